@@ -21,6 +21,11 @@ API_SECRET = ""
 SYMBOL = ""
 #SYMBOL = "BTC_USD"
 
+# Instruments to stream over the websocket, as (instrument_type, settle_currency, symbol). All of them share
+# one connection and each gets its own instrument, trade, order book, order, execution and position data.
+# Defaults to [(INSTRUMENTTYPE, SETTLECURRENCY, SYMBOL)].
+# SUBSCRIPTIONS = [('pc', 'BTC', 'BTC_USD'), ('pc', 'BTC', 'ETH_USD')]
+
 
 ########################################################################################################################
 # Order Size & Spread
@@ -38,6 +43,10 @@ ORDER_STEP_SIZE = 100
 # Distance between successive orders, as a percentage (example: 0.005 for 0.5%)
 INTERVAL = 0.005
 
+# How the levels are spaced: 'geometric' (each level INTERVAL further out than the one before, as a
+# fraction of its price) or 'linear' (INTERVAL of the start price per level).
+LADDER_SPACING = 'geometric'
+
 # Minimum spread to maintain, in percent, between asks & bids
 MIN_SPREAD = 0.01
 
@@ -57,6 +66,10 @@ MAINTAIN_SPREADS = True
 # 0.01 == 1%
 RELIST_INTERVAL = 0.01
 
+# An order filled down to less than this fraction of its level's size is canceled and placed again
+# at full size. 0 leaves partly filled orders alone.
+RELIST_MIN_REMAINING = 0.5
+
 
 ########################################################################################################################
 # Trading Behavior
@@ -87,11 +100,66 @@ DRY_RUN = False
 # order amend/replaces are done, you may hit a ratelimit. If so, email GTE if you feel you need a higher limit.
 LOOP_INTERVAL = 5
 
+# If True, requote as soon as the websocket reports a change to the top of the book, our orders, our
+# position or our executions, instead of sleeping LOOP_INTERVAL between cycles.
+# Bursts of changes are coalesced: after the first one we wait until REQUOTE_DEBOUNCE seconds pass
+# without another, but never longer than REQUOTE_MAX_DELAY. If nothing changes for LOOP_MAX_IDLE
+# seconds we run a cycle anyway.
+EVENT_DRIVEN = False
+REQUOTE_DEBOUNCE = 0.25
+REQUOTE_MAX_DELAY = 1
+LOOP_MAX_IDLE = 5
+
 # Wait times between orders / errors
 API_REST_INTERVAL = 1
 API_ERROR_INTERVAL = 10
 TIMEOUT = 7
 
+# Orders canceled per cancel_batch request.
+CANCEL_BATCH_SIZE = 20
+
+# Order requests (creates, cancel batches) kept in flight at once.
+ORDER_CONCURRENCY = 8
+
+# Client-side rate limit: at most API_RATE_LIMIT requests per API_RATE_WINDOW seconds. Corrected from the
+# X-RateLimit-* headers of every response. Creates and queries leave the last API_RATE_CANCEL_RESERVE
+# requests of the budget to cancels.
+API_RATE_LIMIT = 300
+API_RATE_WINDOW = 300
+API_RATE_CANCEL_RESERVE = 10
+
+# Failed requests are retried up to API_MAX_RETRIES times, waiting a random time between 0 and
+# API_RETRY_BACKOFF seconds, doubling per retry up to API_RETRY_MAX_BACKOFF. No retry is started after
+# API_RETRY_DEADLINE seconds. Creates are only retried if the server can't have acted on them.
+API_MAX_RETRIES = 3
+API_RETRY_BACKOFF = 0.5
+API_RETRY_MAX_BACKOFF = 8
+API_RETRY_DEADLINE = 30
+
+# Open orders are fetched over HTTP OPEN_ORDERS_PAGE_SIZE at a time, with up to OPEN_ORDERS_CONCURRENCY
+# pages requested at once, and at most OPEN_ORDERS_MAX_PAGES pages.
+OPEN_ORDERS_PAGE_SIZE = 100
+OPEN_ORDERS_CONCURRENCY = 1
+OPEN_ORDERS_MAX_PAGES = 50
+
+# If the websocket drops, reconnect in-process instead of restarting the bot: retry up to
+# WS_RECONNECT_ATTEMPTS times, waiting WS_RECONNECT_BACKOFF seconds after the first failure and doubling
+# up to WS_RECONNECT_MAX_BACKOFF. Set WS_RECONNECT_ATTEMPTS = 0 to restart the bot instead.
+WS_RECONNECT_ATTEMPTS = 10
+WS_RECONNECT_BACKOFF = 1
+WS_RECONNECT_MAX_BACKOFF = 30
+
+# If set, every raw websocket frame is recorded (gzipped, in chunks) under this directory.
+# Sessions can be replayed later with market_maker.ws.recorder.FrameReplayer.
+WS_RECORD_DIR = None
+
+# Websocket tables that are never read. Their frames are dropped without being JSON-decoded
+# (they are still recorded). E.g. ['trade'] if the strategy doesn't use recent_trades().
+WS_SKIP_TABLES = []
+
+# Rows kept of the append-only trade and execution tables. Older rows are overwritten.
+WS_TABLE_CAPACITY = {'trade': 200, 'execution': 200}
+
 # If we're doing a dry run, use these numbers for BTC balances
 DRY_BTC = 50
 
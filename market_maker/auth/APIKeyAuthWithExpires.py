@@ -13,12 +13,21 @@ from urllib import parse
 # for rest API which need auth
 class APIKeyAuthWithExpires(AuthBase):
 
-    """Attaches API Key Authentication to the given Request object. This implementation uses `expires`."""
+    """Attaches API Key Authentication to the given Request object. This implementation uses `expires`.
+
+    The signature is HMAC_SHA256(secret, apiKey + expires + data_str), where data_str is the
+    request parameters as sorted JSON, with all spaces and backslashes removed.
+
+    Create one per key and reuse it: the HMAC is keyed once and copied for every signature.
+    sign_params() signs the parameter dict we send directly; as an AuthBase it signs a prepared
+    request by parsing its parameters back out. Both give the same signature.
+    """
 
     def __init__(self, apiKey, apiSecret):
         """Init with Key & Secret."""
         self.apiKey = apiKey
         self.apiSecret = apiSecret
+        self._hmac = hmac.new(bytes(apiSecret, 'utf8'), digestmod=hashlib.sha256)
 
     def __call__(self, r):
         """
@@ -26,57 +35,63 @@ class APIKeyAuthWithExpires(AuthBase):
 
         This way it will not collide with other processes using the same API Key if requests arrive out of order.
         """
-        # modify and return the request
-        expires = int(round(time.time()) + 600)*1000  # 60s grace period in case of clock skew
-        #expires = 1576477289000
-        r.headers['api-expires'] = str(expires)
-        r.headers['api-key'] = self.apiKey
-        #print(str(r.body,encoding = "utf-8"))
-
-        parsedURL = urlparse(r.url)
-        #path = parsedURL.path
-        #print(parsedURL) #ParseResult(scheme='http', netloc='192.168.0.71:7000', path='/v1/api/pc/order/query', params='', query='asset=BTC&symbol=BTC_USD&count=100', fragment='')
-
-        qsencoded = parsedURL.query   #'asset=BTC&symbol=BTC_USD&count=100'
         data = r.body  #post 里面才有
-
         if data:   #参数是以 data 形式的请求，用body做签名
             if isinstance(data, str):  # request 参数用的data
-                query_dict = dict(parse.parse_qsl(data))
-                data_str = json.dumps(query_dict,sort_keys = True).replace(' ', '')  #json.dumps返回带空格的字符串，确保去除空格
-            elif isinstance(data, (bytes, bytearray)):   # request 参数用的json
-                data_str = str(data,encoding = "utf-8")   #r.body 是bytes
-            else:
-                print('r.body not type of str nor bytes, retun None')
-
-            # 对字段排序，先转为dict, 再排序、转回str
-            d = json.loads(data_str)
-            #print(d)
-            data_str1 = json.dumps(d,sort_keys = True).replace('\\', '')  #json.dumps返回带空格的字符串，确保去除反斜杠
-            data_str = data_str1.replace(' ', '')  #json.dumps返回带空格的字符串，确保去除空格
-        elif qsencoded:     #参数是以 query string 形式的请求，使用query string签名
-            #path = path + '?' + parsedURL.query
-            query_dict = dict(parse.parse_qsl(qsencoded))
-
-            data_str1 = json.dumps(query_dict,sort_keys = True).replace('\\', '')  #json.dumps返回带空格的字符串，确保去除反斜杠
-            data_str = data_str1.replace(' ', '')  #json.dumps返回带反斜杠的字符串，确保去除空格      
-        else:
-            print('error:has no parameters')
-        #print('data_str:'+data_str)
-
-        message = self.apiKey +  str(expires) + data_str
-        #print('message str:'+ message)
-        #print('secret str:'+ self.apiSecret)
-        signature = hmac.new(bytes(self.apiSecret, 'utf8'), bytes(message, 'utf8'), digestmod=hashlib.sha256).hexdigest()
-        #print('signature str:'+signature)
-        r.headers['api-signature'] = signature
-        #r.headers['api-signature'] = generate_gte_signature(self.apiKey,self.apiSecret,  expires,  data_str or '')
-        #print(self.apiKey)
-        #print(str(expires))
-        #print(r.headers['api-signature'])
-        
+                params = dict(parse.parse_qsl(data))
+            else:   # request 参数用的json，r.body 是bytes
+                params = json.loads(str(data, encoding="utf-8"))
+            data_str = canonical_json(params)
+        else:     #参数是以 query string 形式的请求，使用query string签名
+            qsencoded = urlparse(r.url).query   #'asset=BTC&symbol=BTC_USD&count=100'
+            data_str = canonical_json(dict(parse.parse_qsl(qsencoded))) if qsencoded else ''
+        r.headers.update(self.sign(data_str))
         return r
 
+    def sign_params(self, query=None, postdict=None, expires=None):
+        """Return the auth headers for a request sent with `params=query` or `json=postdict`,
+        without building and re-parsing the request."""
+        if postdict is not None:
+            data_str = canonical_json(postdict)
+        elif query:
+            data_str = canonical_json(query_params(query))
+        else:
+            data_str = ''
+        return self.sign(data_str, expires)
+
+    def sign(self, data_str, expires=None):
+        """Return the auth headers for a canonical parameter string."""
+        if expires is None:
+            expires = int(round(time.time()) + 600)*1000  # 60s grace period in case of clock skew
+        mac = self._hmac.copy()
+        mac.update(bytes(self.apiKey + str(expires) + data_str, 'utf8'))
+        return {'api-expires': str(expires), 'api-key': self.apiKey, 'api-signature': mac.hexdigest()}
+
+
+def canonical_json(params):
+    """Parameters as signed: sorted JSON, without spaces (even inside values) or backslashes."""
+    return json.dumps(params, sort_keys=True).replace('\\', '').replace(' ', '')  #json.dumps返回带空格、反斜杠的字符串，确保去除
+
+
+def query_params(query):
+    """The parameters the server reads back from `params=query`: requests sends str() of every
+    value, drops None, sends lists as repeated keys (the last one counts) and empty values are
+    ignored, just as parse_qsl ignores them."""
+    params = {}
+    for key, value in query.items():
+        if isinstance(value, (list, tuple)):
+            value = [v for v in value if v is not None]
+            value = value[-1] if value else None
+        if value is None:
+            continue
+        if isinstance(value, (bytes, bytearray)):
+            value = value.decode('utf8')
+        elif not isinstance(value, str):
+            value = str(value)
+        if value:
+            params[key] = value
+    return params
+
 # Generates an API signature.
 # A signature is HMAC_SHA256(secret, verb + path + nonce + data), hex encoded.
 # Verb must be uppercased, url is relative, nonce must be an increasing 64-bit integer
@@ -0,0 +1,130 @@
+"""Order convergence: the fewest order changes that turn our live orders into the ladder."""
+from market_maker.ladder import BUY, SELL
+
+
+class Plan(object):
+    """What to send to converge: orders to create as (side, price in ticks, size), live orders to
+    cancel, and live orders to amend as (order, price in ticks, size)."""
+
+    def __init__(self):
+        self.create = []
+        self.cancel = []
+        self.amend = []
+        self.kept = 0       # Live orders left as they are
+        self.skipped = []   # Sides that were unchanged since the last cycle, and not looked at
+
+    def __len__(self):
+        return len(self.create) + len(self.cancel) + len(self.amend)
+
+    def __repr__(self):
+        return 'Plan(create=%d, cancel=%d, amend=%d, kept=%d)' % (
+            len(self.create), len(self.cancel), len(self.amend), self.kept)
+
+
+class Converger(object):
+    """Plans the orders to create, cancel and amend each cycle, in one linear pass per side.
+
+    The wanted levels and our live orders of a side are both sorted from the touch outwards and
+    merged: each live order not right at a level is matched to the nearest free level within
+    `relist_interval` of the level's price (RELIST_INTERVAL, e.g. 0.01 = 1%) and left alone.
+    Levels left without an order are created; live orders matching no level, or a level that
+    already has one, are canceled.
+    With `amend`, a matched order whose price or size is off is amended instead of left as is;
+    GTE has no amend endpoint, so the order manager doesn't use it. Without it, a matched order
+    filled down to less than `min_remaining` of its level's size (RELIST_MIN_REMAINING, e.g. 0.5)
+    is canceled and its level created again, so fills don't wear the quoted size down.
+
+    A side whose levels and live orders are the same as last cycle, when last cycle found nothing
+    to do on it, is skipped.
+    """
+
+    def __init__(self, relist_interval=None, amend=False, min_remaining=None):
+        self.relist_interval = relist_interval or 0
+        self.amend = amend
+        self.min_remaining = min_remaining or 0
+        self._last = {}     # side -> (levels, sizes, live orders) of a side that needed nothing
+
+    def plan(self, quotes, live_orders):
+        """Plan converging `live_orders` (order dicts from the API) with a Ladder."""
+        to_ticks = quotes.ticks.to_ticks
+        live = {BUY: [], SELL: []}
+        for order in live_orders:
+            side = str(order['side'])
+            if side in live:
+                live[side].append((to_ticks(order['price']), _remaining(order), order))
+
+        plan = Plan()
+        creates = []
+        for side, levels, sizes in ((BUY, quotes.buy_ticks.tolist(), quotes.buy_sizes.tolist()),
+                                    (SELL, quotes.sell_ticks.tolist(), quotes.sell_sizes.tolist())):
+            # Distance from the touch grows with sign * price.
+            sign = -1 if side == BUY else 1
+            orders = sorted(live[side], key=lambda o: sign * o[0])
+            state = (levels, sizes, [(o[2]['order_id'], o[0], o[1]) for o in orders])
+            if self._last.get(side) == state:
+                plan.kept += len(orders)
+                plan.skipped.append(side)
+                continue
+            before = len(plan)
+            side_creates = self.__merge(side, sign, levels, sizes, orders, plan)
+            creates.extend(side_creates)
+            self._last[side] = state if len(plan) == before and not side_creates else None
+
+        # Innermost levels first, alternating sides.
+        creates.sort(key=lambda c: c[0])
+        plan.create = [c[1:] for c in creates]
+        return plan
+
+    def __merge(self, side, sign, levels, sizes, orders, plan):
+        """Match a side's sorted live orders to its levels. Fills in cancels and amends; returns the
+        creates as (rank, side, price in ticks, size)."""
+        rank = sorted(range(len(levels)), key=lambda i: sign * levels[i])
+        keys = [sign * levels[i] for i in rank]
+        tolerance = [int(abs(levels[i]) * self.relist_interval) for i in rank]
+        n = len(keys)
+        kept = [None] * n
+        # Orders right at a level keep it; the rest are matched to the levels left over.
+        at = dict((key, k) for k, key in enumerate(keys))
+        rest = []
+        for item in orders:
+            k = at.get(sign * item[0])
+            if k is not None and kept[k] is None:
+                kept[k] = item
+            else:
+                rest.append(item)
+        j = 0
+        for tick, remaining, order in rest:
+            key = sign * tick
+            # keys[j] + tolerance[j] only grows with j: levels this order is past are past every later one.
+            while j < n and keys[j] + tolerance[j] < key:
+                j += 1
+            best = None
+            k = j
+            while k < n and keys[k] - tolerance[k] <= key:
+                if kept[k] is None and (best is None or abs(keys[k] - key) < abs(keys[best] - key)):
+                    best = k
+                k += 1
+            if best is None:
+                plan.cancel.append(order)
+            else:
+                kept[best] = (tick, remaining, order)
+
+        creates = []
+        for k in range(n):
+            level, size = levels[rank[k]], sizes[rank[k]]
+            if kept[k] is None:
+                creates.append((k, side, level, size))
+                continue
+            tick, remaining, order = kept[k]
+            if self.amend and (tick != level or remaining != size):
+                plan.amend.append((order, level, size))
+            elif not self.amend and remaining < size * self.min_remaining:
+                plan.cancel.append(order)
+                creates.append((k, side, level, size))
+            else:
+                plan.kept += 1
+        return creates
+
+
+def _remaining(order):
+    return int(float(order['qty'])) - int(float(order.get('filled_qty') or 0))
@@ -6,17 +6,18 @@ from market_maker.market_maker import OrderManager
 class CustomOrderManager(OrderManager):
     """A sample order manager for implementing your own custom strategy"""
 
-    def place_orders(self) -> None:
-        # implement your custom strategy here
+    def place_orders(self, ctx) -> None:
+        # implement your custom strategy here, off the cycle's
+        # instrument, ticker, positions and orders in ctx
 
         buy_orders = []
         sell_orders = []
 
-        # populate buy and sell orders, e.g.
-        # buy_orders.append({'price': 999.0, 'orderQty': 100, 'side': "Buy"})
-        # sell_orders.append({'price': 1001.0, 'orderQty': 100, 'side': "Sell"})
+        # populate buy and sell orders with a 'price' and a 'qty' each, e.g.
+        # buy_orders.append({'price': 999.0, 'qty': 100, 'side': '1'})
+        # sell_orders.append({'price': 1001.0, 'qty': 100, 'side': '0'})
 
-        self.converge_orders(buy_orders, sell_orders)
+        self.converge_orders(buy_orders, sell_orders, ctx)
 
 
 def run() -> None:
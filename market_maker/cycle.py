@@ -0,0 +1,83 @@
+"""Cycle context: the market and account state one order manager cycle quotes on, read once."""
+from types import MappingProxyType
+
+from market_maker.ladder import BUY, SELL
+from market_maker.utils import errors
+
+
+class CycleContext(object):
+    """Everything a cycle decides on, read from the exchange once at its start and frozen.
+
+    instrument, ticker   read-only copies, from one websocket snapshot
+    positions            our position rows of the symbol; GTE keeps a long ('1') and a short ('0') one
+    inventory            our Inventory of the symbol: long, short and net size, entry prices and PnL
+    long_qty, short_qty  the sizes of the two positions
+    orders               our open orders of the symbol, read-only
+
+    Every step of the cycle (sanity check, status, ladder, convergence) works off the same data,
+    however the websocket moves meanwhile. `reads` and `rest_calls` count the exchange reads and
+    REST requests made from build() until finish(): a cycle takes 2 reads (the snapshot and our
+    orders) and only sends REST requests for order changes, and to reconcile our orders when
+    their local state is stale.
+    """
+
+    def __init__(self, number, instrument, ticker, positions, inventory, orders):
+        self.number = number
+        self.instrument = instrument
+        self.ticker = ticker
+        self.positions = tuple(positions)
+        self.inventory = inventory
+        self.orders = tuple(MappingProxyType(dict(order)) for order in orders)
+        self.long_qty = inventory.long_qty
+        self.short_qty = inventory.short_qty
+        self.reads = None
+        self.rest_calls = None
+        self._exchange = None
+        self._start = None
+
+    @classmethod
+    def build(cls, exchange, number=0):
+        """Read a cycle's state from an ExchangeInterface: one snapshot, and our open orders.
+        Raises NotSyncedError if the snapshot was taken while the websocket was rebuilding the
+        symbol's instrument or book after a reconnect."""
+        start = (exchange.reads, exchange.rest_calls())
+        symbol = exchange.symbol
+        snapshot = exchange.snapshot()
+        if not snapshot.synced and symbol not in snapshot.books:
+            raise errors.NotSyncedError("No order book with symbol %s yet: reconnecting" % symbol)
+        instrument = snapshot.get_instrument(symbol)
+        ticker = snapshot.get_ticker(symbol)
+        positions = snapshot.position(exchange.instrument_type, exchange.settle_currency, symbol)
+        orders = [o for o in exchange.get_orders() if o.get('symbol', symbol) == symbol]
+        ctx = cls(number, instrument, ticker, positions, snapshot.inventory(symbol), orders)
+        ctx._exchange = exchange
+        ctx._start = start
+        return ctx
+
+    @property
+    def net_qty(self):
+        return self.inventory.net_qty
+
+    def highest_buy(self):
+        """Our highest buy order, or None."""
+        buys = [o for o in self.orders if o['side'] == BUY]
+        return max(buys, key=lambda o: float(o['price'])) if buys else None
+
+    def lowest_sell(self):
+        """Our lowest sell order, or None."""
+        sells = [o for o in self.orders if o['side'] == SELL]
+        return min(sells, key=lambda o: float(o['price'])) if sells else None
+
+    def finish(self):
+        """Count the reads and REST requests made since build()."""
+        if self._exchange is not None:
+            reads, rest_calls = self._start
+            self.reads = self._exchange.reads - reads
+            self.rest_calls = self._exchange.rest_calls() - rest_calls
+        return self
+
+    def __repr__(self):
+        return 'CycleContext(%d, %s, %d orders, long %d, short %d, reads=%s, rest_calls=%s)' % (
+            self.number, self.instrument['symbol'], len(self.orders), self.long_qty, self.short_qty,
+            self.reads, self.rest_calls)
+
@@ -2,14 +2,17 @@
 from __future__ import absolute_import
 import requests
 requests.packages.urllib3.disable_warnings()
+import threading
 import time
 import datetime
 import json
 import base64
 import uuid
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from market_maker.auth import APIKeyAuthWithExpires
-from market_maker.utils import constants, errors
+from market_maker.utils import constants, errors, metrics, ratelimit
+from market_maker.utils.retry import Retry
 from market_maker.ws.ws_thread import GTEWebsocket
 from market_maker.settings import settings
 
@@ -36,13 +39,26 @@ class GTE(object):
                             )
         self.apiKey = apiKey
         self.apiSecret = apiSecret
+        # Auth: API Key/Secret. One signer for every request, keyed once.
+        self.auth = APIKeyAuthWithExpires(apiKey, apiSecret)
         if len(orderIDPrefix) > 13:
             raise ValueError("settings.ORDERID_PREFIX must be at most 13 characters long!")
         self.orderIDPrefix = orderIDPrefix
-        self.retries = 0  # initialize counter
+        self.__reconcile_lock = threading.Lock()
+        # Per-path latency, response and retry counts of every request. See metrics_snapshot().
+        self.metrics = metrics.Registry()
+        # Client-side request budget, corrected from the X-RateLimit-* headers of every response.
+        self.limiter = ratelimit.RateLimiter(settings.get('API_RATE_LIMIT', 300), settings.get('API_RATE_WINDOW', 300),
+                                             reserve=settings.get('API_RATE_CANCEL_RESERVE', 10))
 
         # Prepare HTTPS session
         self.session = requests.Session()
+        # Order requests run on a bounded pool of threads sharing the session's connection pool.
+        self.concurrency = settings.get('ORDER_CONCURRENCY', 8)
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=self.concurrency)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.executor = ThreadPoolExecutor(max_workers=self.concurrency)
         # These headers are always sent
         self.session.headers.update({'user-agent': 'liquidbot-' + constants.VERSION})
         self.session.headers.update({'content-type': 'application/json'})
@@ -59,6 +75,7 @@ class GTE(object):
 
     def exit(self):
         self.ws.exit()
+        self.executor.shutdown(wait=True)
 
     #
     # Public methods
@@ -69,6 +86,18 @@ class GTE(object):
             symbol = self.symbol
         return self.ws.get_ticker(symbol)
 
+    def wait_for_update(self, timeout=None):
+        """Block until the top of the book or our orders/position/executions change, or timeout."""
+        return self.ws.wait_for_update(timeout)
+
+    def snapshot(self, depth=25):
+        """Get a consistent, read-only snapshot of the websocket tables, tickers and books."""
+        return self.ws.snapshot(depth)
+
+    def reconnect_stats(self):
+        """Get websocket reconnect count and the duration of the last reconnect."""
+        return self.ws.reconnect_stats()
+
     def instrument(self, symbol):
         """Get an instrument's details."""
         return self.ws.get_instrument(symbol)
@@ -79,23 +108,28 @@ class GTE(object):
             query['filter'] = json.dumps(filter)
         return self._curl_gte(path='instrument', query=query, verb='GET')
 
-    def market_depth(self, symbol):
-        """Get market depth / orderbook."""
-        return self.ws.market_depth(symbol)
+    def market_depth(self, symbol, depth=25):
+        """Get market depth / orderbook. Returns the best `depth` bid and ask levels as (price, size)."""
+        return self.ws.market_depth(symbol, depth)
 
-    def recent_trades(self):
-        """Get recent trades.
+    def order_book(self, symbol):
+        """Get the live L2 order book of a symbol."""
+        return self.ws.order_book(symbol)
+
+    def recent_trades(self, symbol=None, count=None, since=None):
+        """Get recent trades, oldest first: all that are kept, the last `count`, or those with a
+        timestamp >= `since`. With a symbol, only that symbol's trades.
 
         Returns
         -------
-        A list of dicts:
+        A list of read-only rows, indexed like dicts:
               {u'amount': 60,
                u'date': 1306775375,
                u'price': 8.7401099999999996,
                u'tid': u'93842'},
 
         """
-        return self.ws.recent_trades()
+        return self.ws.recent_trades(symbol, count, since)
 
     #
     # Authentication required methods
@@ -121,6 +155,12 @@ class GTE(object):
         # 返回的是该symbol对应的多个position 数组
         return self.ws.position(instrument_type, settle_currency, symbol)
 
+    @authentication_required
+    def inventory(self, symbol):
+        """Get our inventory of a symbol: long, short and net size, average entry prices and
+        realized PnL, kept up to date by the position and execution streams."""
+        return self.ws.inventory.get(symbol)
+
     @authentication_required
     def isolate_margin(self, symbol, leverage, rethrow_errors=False):
         """Set the leverage on an isolated margin position"""
@@ -165,6 +205,31 @@ class GTE(object):
         postdict = order_dict
         return self._curl_gte(path=endpoint, postdict=postdict, verb="POST")
 
+    @authentication_required
+    def create_order(self, order):
+        """Place an order, as given plus a client_oid with our prefix. Raises on HTTP errors."""
+        order = dict(order)
+        if 'client_oid' not in order:
+            order['client_oid'] = self.orderIDPrefix + base64.b64encode(uuid.uuid4().bytes).decode('utf8').rstrip('=\n')
+        response = self._curl_gte(path='/v1/api/pc/order/create', query=order, verb='POST', rethrow_errors=True)
+        if response.get('code') == 0:
+            data = response.get('data')
+            if isinstance(data, dict) and data.get('order_id') is not None:
+                self.ws.orders.placed(order, data['order_id'])
+            else:
+                self.ws.orders.invalidate('no order_id for a created order')
+        return response
+
+    @authentication_required
+    def create_orders(self, orders):
+        """Place orders concurrently, up to ORDER_CONCURRENCY requests in flight.
+        Returns one Future per order, in the same order; each resolves to the API response."""
+        return [self.submit(self.create_order, order) for order in orders]
+
+    def submit(self, fn, *args, **kwargs):
+        """Run a request on the order pool. Returns a Future."""
+        return self.executor.submit(fn, *args, **kwargs)
+
     @authentication_required
     def amend_bulk_orders(self, orders):
         """Amend multiple orders."""
@@ -190,35 +255,112 @@ class GTE(object):
         """Get open orders."""
         return self.ws.open_orders(self.orderIDPrefix)
 
+    @authentication_required
+    def open_orders(self):
+        """Get open orders from the local order state, kept up to date by the order and execution
+        streams. Reconciled over HTTP first on startup, after a reconnect, or if it has drifted."""
+        if self.ws.orders.stale:
+            self.reconcile_orders()
+        return self.ws.orders.open_orders()
+
+    @authentication_required
+    def reconcile_orders(self):
+        """Replace the local order state with the open orders from HTTP, listed in the settle
+        currency of every instrument we track."""
+        settle_currencies = self.settle_currencies()
+        with self.__reconcile_lock:
+            token = self.ws.orders.begin_reconcile()
+            rows = []
+            for settle_currency in sorted(set(settle_currencies.values())):
+                rows.extend(self.iter_open_orders(settle_currency=settle_currency))
+            symbols = set(settle_currencies) | set(row.get('symbol') for row in rows)
+            diff = self.ws.orders.reconcile(rows, token, symbols)
+        if self.ws.orders.reconciles == 1:
+            self.logger.info("Loaded %d open orders." % len(self.ws.orders))
+        elif any(diff.values()):
+            self.logger.warning("Local order state had drifted: %(added)d orders missing, %(removed)d gone, "
+                                "%(changed)d changed. Reconciled." % diff)
+
+    def settle_currencies(self):
+        """settle_currency of every symbol we track (SUBSCRIPTIONS, and SYMBOL), by symbol."""
+        settle_currencies = dict((symbol, settle_currency)
+                                 for instrument_type, settle_currency, symbol in self.ws.subscriptions)
+        settle_currencies.setdefault(self.symbol, self.settle_currency)
+        return settle_currencies
+
     @authentication_required
     def open_orders_http(self):
         """Get open orders via HTTP. Used on close to ensure we catch them all."""
+        return list(self.iter_open_orders())
+
+    @authentication_required
+    def iter_open_orders(self, page_size=None, concurrency=None, settle_currency=None):
+        """Yield every open order via HTTP, page by page, as the pages arrive. Orders are listed per
+        settle currency, of every symbol settled in it: settle_currency, or SETTLECURRENCY by default.
+
+        Up to `concurrency` pages are requested at once (settings.OPEN_ORDERS_CONCURRENCY); pages
+        are still yielded in order. Paging stops at the first page with fewer than `page_size` rows,
+        at a page with no order we haven't seen (in case the server ignores the assumed 'page'
+        parameter and sends the first page again), or after OPEN_ORDERS_MAX_PAGES pages.
+        Orders that move to an earlier page while we page (because others were filled or canceled)
+        can be missed, ones that move to a later page are only yielded once."""
+        page_size = page_size or settings.get('OPEN_ORDERS_PAGE_SIZE', 100)
+        concurrency = concurrency or settings.get('OPEN_ORDERS_CONCURRENCY', 1)
+        max_pages = settings.get('OPEN_ORDERS_MAX_PAGES', 50)
+        seen = set()
+        page = 1
+        while True:
+            if page > max_pages:
+                self.logger.warning("Stopped listing open orders after %d pages (OPEN_ORDERS_MAX_PAGES); "
+                                    "%d orders listed, there may be more." % (max_pages, len(seen)))
+                return
+            concurrency = min(concurrency, max_pages - page + 1)
+            if concurrency > 1:
+                futures = [self.submit(self.__open_orders_page, p, page_size, settle_currency)
+                           for p in range(page, page + concurrency)]
+                pages = (future.result() for future in futures)
+            else:
+                pages = [self.__open_orders_page(page, page_size, settle_currency)]
+            for orders in pages:
+                page += 1
+                new = 0
+                for order in orders:
+                    if order['order_id'] not in seen:
+                        seen.add(order['order_id'])
+                        new += 1
+                        yield order
+                if len(orders) < page_size:
+                    # Last page. Pages still in flight past it are empty; let them finish on their own.
+                    return
+                if not new:
+                    self.logger.warning("Open orders page %d had no new orders; stopped paging." % (page - 1))
+                    return
+
+    def __open_orders_page(self, page, page_size, settle_currency=None):
+        """One page of open orders, [] past the last one."""
         path = "/v1/api/pc/order/query"
         res_json = self._curl_gte(
             path=path,
             query={
-                'asset': self.settle_currency,
+                'asset': settle_currency or self.settle_currency,
                 'filter': json.dumps({'status': ['2']}).replace('\\', '').replace(' ', ''),  #注意这里一定要处理字符串，否则该字符串提交到服务器，和用于签名的字符串提交到服务器，因为空格会不一致。
-                'count': 100
+                'page': page,
+                'count': page_size
             },
             verb="GET"
         )
         self.logger.debug(res_json)
         if res_json['data']:
-            orders = res_json['data']['rows']
-            #print(orders)
             # Only return orders that start with our clOrdID prefix.
             # 因为服务端不支持，所以。。。。
             # 后面必须加上去
             # return [o for o in orders if str(o['client_oid']).startswith(self.orderIDPrefix)]
-            #print(' open_orders_http')
-            self.logger.debug(orders)
-            return orders
+            return res_json['data']['rows'] or []
         else:
             return []
 
     @authentication_required
-    def cancel(self, settle_currency,symbol,order_id):  #settle_currency,symbol,order_id must be in str
+    def cancel(self, settle_currency,symbol,order_id, rethrow_errors=False):  #settle_currency,symbol,order_id must be in str
         """Cancel an existing order."""
         path = "/v1/api/pc/order/cancel"
         query = {
@@ -226,18 +368,112 @@ class GTE(object):
             'symbol':symbol,
             'id': order_id,
         }
-        return self._curl_gte(path=path, query =query, verb="POST")
+        return self._curl_gte(path=path, query =query, verb="POST", rethrow_errors=rethrow_errors)
 
     @authentication_required
-    def cancel_batch(self, settle_currency,symbol,order_id_arr):
-        """Cancel an existing order."""
+    def cancel_batch(self, settle_currency,symbol,order_id_arr, rethrow_errors=False):
+        """Cancel several existing orders in one request."""
         path = "/v1/api/pc/order/cancel_batch"
         query = {
             'asset':settle_currency,
             'symbol':symbol,
             'filter': json.dumps({'order_id': order_id_arr}).replace('\\', '').replace(' ', ''),  #注意这里一定要处理字符串，否则该字符串提交到服务器，和用于签名的字符串提交到服务器，因为空格会不一致。
         }
-        return self._curl_gte(path=path, query=query, verb="POST")        
+        return self._curl_gte(path=path, query=query, verb="POST", rethrow_errors=rethrow_errors)
+
+    @authentication_required
+    def cancel_orders(self, settle_currency, symbol, order_ids):
+        """Cancel any number of orders through cancel_batch, CANCEL_BATCH_SIZE ids per request.
+        Batches run concurrently on the order pool.
+
+        A batch that fails as a whole, or whose response isn't in a format we know, is retried one
+        id at a time, so one bad id doesn't leave the others open.
+
+        Returns a dict of order_id -> None if it was canceled, or the error for that id.
+        """
+        size = settings.get('CANCEL_BATCH_SIZE', 20)
+        batches = [self.submit(self.__cancel_chunk, settle_currency, symbol, order_ids[i:i + size])
+                   for i in range(0, len(order_ids), size)]
+        results = {}
+        for batch in batches:
+            results.update(batch.result())
+        self.ws.orders.canceled([order_id for order_id, error in results.items() if error is None])
+        if any(error is not None for error in results.values()):
+            self.ws.orders.invalidate('failed cancel')
+        return results
+
+    def __cancel_chunk(self, settle_currency, symbol, chunk):
+        try:
+            response = self.cancel_batch(settle_currency, symbol, chunk, rethrow_errors=True)
+            error = self.__response_error(response)
+        except Exception as e:
+            response, error = None, e
+        if error is None:
+            results = self.__batch_results(chunk, response)
+            if results is not None:
+                return results
+            error = 'unrecognized response data %r' % (response.get('data'),)
+
+        self.logger.warning("Batch cancel of %d orders failed (%s), canceling them one by one." % (len(chunk), error))
+        results = {}
+        for order_id in chunk:
+            try:
+                results[order_id] = self.__response_error(
+                    self.cancel(settle_currency, symbol, order_id, rethrow_errors=True))
+            except Exception as e:
+                results[order_id] = e
+        return results
+
+    def __response_error(self, response):
+        """Return the error of an API response, or None if it succeeded."""
+        if response is not None and response.get('code') == 0:
+            return None
+        return (response or {}).get('msg') or response
+
+    def __batch_results(self, order_ids, response):
+        """Per-id results of a successful cancel_batch, or None if the response isn't in a format
+        we know, so the caller cancels the orders one by one instead.
+
+        The API docs only give cancel_batch a code, with no data: code 0 and no data means every
+        order was canceled. Per-order results are not documented; the format read here, a list of
+        rows (or {'rows': [...]}) with an order_id and a code each, is assumed. If it does come
+        back, ids it lists with a non-zero code, or doesn't list, failed."""
+        data = response.get('data')
+        if not data:
+            return dict((order_id, None) for order_id in order_ids)
+        rows = data.get('rows') if isinstance(data, dict) else data
+        if not isinstance(rows, list) or not all(isinstance(row, dict) and 'order_id' in row for row in rows):
+            return None
+        listed = dict((str(row['order_id']), row) for row in rows)
+        results = {}
+        for order_id in order_ids:
+            row = listed.get(str(order_id))
+            if row is None:
+                results[order_id] = 'not canceled'
+            elif row.get('code', 0) != 0:
+                results[order_id] = row.get('msg') or row
+            else:
+                results[order_id] = None
+        return results
+
+    def metrics_snapshot(self):
+        """REST request metrics so far, as a dict (see metrics.Registry.snapshot)."""
+        self.__record_budget()
+        return self.metrics.snapshot()
+
+    def metrics_dump(self):
+        """REST request metrics so far, as a readable table."""
+        self.__record_budget()
+        return self.metrics.dump()
+
+    def __record_budget(self):
+        for name, priority in (('cancel', ratelimit.CANCEL), ('create', ratelimit.CREATE), ('query', ratelimit.QUERY)):
+            self.metrics.set('ratelimit_budget', self.limiter.budget(priority), (name,))
+
+    def ratelimit_budget(self, priority=ratelimit.CREATE):
+        """How many requests of a priority class (ratelimit.CANCEL, CREATE or QUERY) can be sent
+        right now without waiting for the rate limit."""
+        return self.limiter.budget(priority)
 
     @authentication_required
     def withdraw(self, amount, fee, address):
@@ -250,14 +486,15 @@ class GTE(object):
         }
         return self._curl_gte(path=path, postdict=postdict, verb="POST", max_retries=0)
 
-    # By default don't retry POST or PUT. 
-    # Retrying GET/DELETE is okay because they are idempotent.
-    # In the future we could allow retrying PUT, so long as 'leavesQty' is not used (not idempotent),
-    # or you could change the clOrdID (set {"clOrdID": "new", "origClOrdID": "old"}) so that an amend
-    # can't erroneously be applied twice.
+    # Retrying is only safe when sending a request twice can't do anything twice. GET/DELETE are
+    # idempotent, and so are cancels: cancelling an order again does nothing. Creates and other
+    # POST/PUT requests are only retried when the server can't have acted on them (a 429, or no
+    # connection was made); a timeout or 503 on a create could mean the order was placed.
     def _curl_gte(self, path, query=None, postdict=None, timeout=None, verb=None, rethrow_errors=False,
-                     max_retries=None):
-        """Send a request to GTE Servers."""
+                     max_retries=None, priority=None, idempotent=None):
+        """Send a request to GTE Servers. Waits for rate-limit budget first; `priority` is a
+        ratelimit class, by default CANCEL for cancels, QUERY for GETs and CREATE otherwise.
+        Failed attempts are retried with backoff, within settings.API_RETRY_DEADLINE seconds."""
         # Handle URL
         url = self.base_url + path
 
@@ -268,16 +505,23 @@ class GTE(object):
         if not verb:
             verb = 'POST' if postdict else 'GET'
 
-        # By default don't retry POST or PUT. 
-        # Retrying GET/DELETE is okay because they are idempotent.
-        # In the future we could allow retrying PUT, so long as 'leavesQty' is not used (not idempotent),
-        # or you could change the clOrdID (set {"clOrdID": "new", "origClOrdID": "old"}) so that an amend
-        # can't erroneously be applied twice.
+        if priority is None:
+            if 'cancel' in path:
+                priority = ratelimit.CANCEL
+            elif verb == 'GET':
+                priority = ratelimit.QUERY
+            else:
+                priority = ratelimit.CREATE
+
+        if idempotent is None:
+            idempotent = verb in ('GET', 'HEAD', 'DELETE') or 'cancel' in path
+
         if max_retries is None:
-            max_retries = 0 if verb in ['POST', 'PUT'] else 3
+            max_retries = settings.get('API_MAX_RETRIES', 3)
 
-        # Auth: API Key/Secret
-        auth = APIKeyAuthWithExpires(self.apiKey, self.apiSecret)
+        # Retry state for this request only, so concurrent requests can't corrupt each other's count.
+        state = Retry(max_retries, settings.get('API_RETRY_BACKOFF', 0.5),
+                      settings.get('API_RETRY_MAX_BACKOFF', 8), settings.get('API_RETRY_DEADLINE', 30))
 
         def exit_or_throw(e):
             if rethrow_errors:
@@ -285,123 +529,178 @@ class GTE(object):
             else:
                 exit(1)
 
-        def retry():
-            self.retries += 1
-            if self.retries > max_retries:
-                raise Exception("Max retries on %s (%s) hit, raising." % (path, json.dumps(postdict or '')))
-            return self._curl_gte(path, query, postdict, timeout, verb, rethrow_errors, max_retries)
-
-        # Make the request
-        response = None
-        try:
-            self.logger.debug("sending req to %s: %s" % (url, json.dumps(postdict or query or '')))
-            req = requests.Request(verb, url, json=postdict, auth=auth, params=query)
-            prepped = self.session.prepare_request(req)
-            response = self.session.send(prepped, timeout=timeout,verify=False)
-            # Make non-200s throw
-            response.raise_for_status()
-            text_json = response.json()
-            if text_json['code'] != 0 :
-                self.logger.debug(response.text)
-
-        except requests.exceptions.HTTPError as e:
-            if response is None:
+        def retry(e, retryable=True, delay=None):
+            """Wait before the next attempt, or raise if there isn't one."""
+            if not retryable:
+                self.logger.error("Not retrying %s %s, it may already have been applied." % (verb, path))
                 raise e
-
-            # 401 - Auth error. This is fatal.
-            if response.status_code == 401:
-                self.logger.error("API Key or Secret incorrect, please check and restart.")
-                self.logger.error("Error: " + response.text)
-                if postdict:
-                    self.logger.error(postdict)
-                # Always exit, even if rethrow_errors, because this is fatal
-                exit(1)
-
-            # 404, can be thrown if order canceled or does not exist.
-            elif response.status_code == 404:
-                if verb == 'DELETE':
-                    self.logger.error("Order not found: %s" % postdict['orderID'])
-                    return
-                self.logger.error("Unable to contact the GTE API (404). " +
-                                  "Request: %s \n %s" % (url, json.dumps(postdict)))
+            delay = state.next(delay)
+            if delay is None:
+                raise Exception("Max retries or retry deadline on %s (%s) hit, raising." % (path, json.dumps(postdict or '')))
+            self.metrics.inc('retries', (path,))
+            time.sleep(delay)
+
+        called = time.monotonic()
+        while True:
+            # Make the request
+            response = None
+            try:
+                self.logger.debug("sending req to %s: %s" % (url, json.dumps(postdict or query or '')))
+                # Wait for budget before signing, so a long wait can't expire the signature. A retry
+                # only waits as long as the deadline allows.
+                started = time.monotonic()
+                if not self.limiter.acquire(priority, state.remaining() if state.retries else None):
+                    raise Exception("Out of time waiting for rate limit on %s (%s), raising." %
+                                    (path, json.dumps(postdict or '')))
+                # The deadline runs from the first send, so a long wait for the first token can't
+                # use it up. A retry granted right at the deadline isn't sent, and its token goes back.
+                state.start()
+                if state.expired():
+                    self.limiter.release()
+                    raise Exception("Max retries or retry deadline on %s (%s) hit, raising." %
+                                    (path, json.dumps(postdict or '')))
+                acquired = time.monotonic()
+                try:
+                    req = requests.Request(verb, url, json=postdict, params=query,
+                                           headers=self.auth.sign_params(query, postdict))
+                    prepped = self.session.prepare_request(req)
+                    prepared = time.monotonic()
+                    response = self.session.send(prepped, timeout=state.timeout(timeout), verify=False)
+                finally:
+                    self.__record_response(path, response)
+                received = time.monotonic()
+                self.__record_timing(path, response, started, acquired, prepared, received)
+                # Make non-200s throw
+                response.raise_for_status()
+                text_json = response.json()
+                self.metrics.observe('request_seconds', time.monotonic() - received, (path, 'parse'))
+                if text_json['code'] != 0 :
+                    self.logger.debug(response.text)
+
+            except requests.exceptions.HTTPError as e:
+                if response is None:
+                    raise e
+
+                # 401 - Auth error. This is fatal.
+                if response.status_code == 401:
+                    self.logger.error("API Key or Secret incorrect, please check and restart.")
+                    self.logger.error("Error: " + response.text)
+                    if postdict:
+                        self.logger.error(postdict)
+                    # Always exit, even if rethrow_errors, because this is fatal
+                    exit(1)
+
+                # 404, can be thrown if order canceled or does not exist.
+                elif response.status_code == 404:
+                    if verb == 'DELETE':
+                        self.logger.error("Order not found: %s" % postdict['orderID'])
+                        return
+                    self.logger.error("Unable to contact the GTE API (404). " +
+                                      "Request: %s \n %s" % (url, json.dumps(postdict)))
+                    exit_or_throw(e)
+
+                # 429, ratelimit; hold all requests until X-RateLimit-Reset
+                elif response.status_code == 429:
+                    self.logger.error("Ratelimited on current request. Waiting, then trying again. Try fewer " +
+                                      "order pairs or contact support@gte.io to raise your limits. " +
+                                      "Request: %s \n %s" % (url, json.dumps(postdict)))
+
+                    # Stop sending until the window resets. The retry waits for it in the limiter;
+                    # cancels are first in line then.
+                    ratelimit_reset = int(response.headers.get('X-RateLimit-Reset', time.time() + 1))
+                    self.limiter.exhausted(ratelimit_reset)
+                    reset_str = datetime.datetime.fromtimestamp(ratelimit_reset).strftime('%X')
+                    self.logger.error("Your ratelimit will reset at %s." % reset_str)
+
+                    # The request was refused, so it is safe to send again whatever it is.
+                    retry(e, delay=0)
+                    continue
+
+                # 503 - GTE temporary downtime, likely due to a deploy. Try again
+                elif response.status_code == 503:
+                    self.logger.warning("Unable to contact the GTE API (503), retrying. " +
+                                        "Request: %s \n %s" % (url, json.dumps(postdict)))
+                    retry(e, idempotent)
+                    continue
+
+                elif response.status_code == 400:
+                    error = response.json()['error']
+                    message = error['message'].lower() if error else ''
+
+                    # Duplicate clOrdID: that's fine, probably a deploy, go get the order(s) and return it
+                    if 'duplicate clordid' in message:
+                        orders = postdict['orders'] if 'orders' in postdict else postdict
+
+                        IDs = json.dumps({'clOrdID': [order['clOrdID'] for order in orders]})
+                        orderResults = self._curl_gte('/order', query={'filter': IDs}, verb='GET')
+
+                        for i, order in enumerate(orderResults):
+                            if (
+                                    order['orderQty'] != abs(postdict['orderQty']) or
+                                    order['side'] != ('Buy' if postdict['orderQty'] > 0 else 'Sell') or
+                                    order['price'] != postdict['price'] or
+                                    order['symbol'] != postdict['symbol']):
+                                raise Exception('Attempted to recover from duplicate clOrdID, but order returned from API ' +
+                                                'did not match POST.\nPOST data: %s\nReturned order: %s' % (
+                                                    json.dumps(orders[i]), json.dumps(order)))
+                        # All good
+                        return orderResults
+
+                    elif 'insufficient available balance' in message:
+                        self.logger.error('Account out of funds. The message: %s' % error['message'])
+                        exit_or_throw(Exception('Insufficient Funds'))
+
+
+                # If we haven't returned or re-raised yet, we get here.
+                self.logger.error("Unhandled Error: %s: %s" % (e, response.text))
+                self.logger.error("Endpoint was: %s %s: %s" % (verb, path, json.dumps(postdict)))
                 exit_or_throw(e)
 
-            # 429, ratelimit; cancel orders & wait until X-RateLimit-Reset
-            elif response.status_code == 429:
-                self.logger.error("Ratelimited on current request. Sleeping, then trying again. Try fewer " +
-                                  "order pairs or contact support@gte.io to raise your limits. " +
-                                  "Request: %s \n %s" % (url, json.dumps(postdict)))
-
-                # Figure out how long we need to wait.
-                ratelimit_reset = response.headers['X-RateLimit-Reset']
-                to_sleep = int(ratelimit_reset) - int(time.time())
-                reset_str = datetime.datetime.fromtimestamp(int(ratelimit_reset)).strftime('%X')
-
-                # We're ratelimited, and we may be waiting for a long time. Cancel orders.
-                self.logger.warning("Canceling all known orders in the meantime.")
-                self.cancel([o['orderID'] for o in self.open_orders()])
-
-                self.logger.error("Your ratelimit will reset at %s. Sleeping for %d seconds." % (reset_str, to_sleep))
-                time.sleep(to_sleep)
-
-                # Retry the request.
-                return retry()
-
-            # 503 - GTE temporary downtime, likely due to a deploy. Try again
-            elif response.status_code == 503:
-                self.logger.warning("Unable to contact the GTE API (503), retrying. " +
-                                    "Request: %s \n %s" % (url, json.dumps(postdict)))
-                time.sleep(3)
-                return retry()
-
-            elif response.status_code == 400:
-                error = response.json()['error']
-                message = error['message'].lower() if error else ''
-
-                # Duplicate clOrdID: that's fine, probably a deploy, go get the order(s) and return it
-                if 'duplicate clordid' in message:
-                    orders = postdict['orders'] if 'orders' in postdict else postdict
-
-                    IDs = json.dumps({'clOrdID': [order['clOrdID'] for order in orders]})
-                    orderResults = self._curl_gte('/order', query={'filter': IDs}, verb='GET')
-
-                    for i, order in enumerate(orderResults):
-                        if (
-                                order['orderQty'] != abs(postdict['orderQty']) or
-                                order['side'] != ('Buy' if postdict['orderQty'] > 0 else 'Sell') or
-                                order['price'] != postdict['price'] or
-                                order['symbol'] != postdict['symbol']):
-                            raise Exception('Attempted to recover from duplicate clOrdID, but order returned from API ' +
-                                            'did not match POST.\nPOST data: %s\nReturned order: %s' % (
-                                                json.dumps(orders[i]), json.dumps(order)))
-                    # All good
-                    return orderResults
-
-                elif 'insufficient available balance' in message:
-                    self.logger.error('Account out of funds. The message: %s' % error['message'])
-                    exit_or_throw(Exception('Insufficient Funds'))
-
-
-            # If we haven't returned or re-raised yet, we get here.
-            self.logger.error("Unhandled Error: %s: %s" % (e, response.text))
-            self.logger.error("Endpoint was: %s %s: %s" % (verb, path, json.dumps(postdict)))
-            exit_or_throw(e)
-
-        except requests.exceptions.Timeout as e:
-            # Timeout, re-run this request
-            self.logger.warning("Timed out on request: %s (%s), retrying..." % (path, json.dumps(postdict or '')))
-            return retry()
-
-        except requests.exceptions.ConnectionError as e:
-            self.logger.warning("Unable to contact the GTE API (%s). Please check the URL. Retrying. " +
-                                "Request: %s %s \n %s" % (e, url, json.dumps(postdict)))
-            time.sleep(1)
-            return retry()
-
-        # Reset retry counter on success
-        self.retries = 0
-
-        return response.json()
+            except requests.exceptions.ConnectTimeout as e:
+                self.metrics.inc('responses', (path, 'connect_timeout'))
+                # Never connected, so nothing was sent: safe to retry any request.
+                self.logger.warning("Timed out connecting for request: %s (%s), retrying..." %
+                                    (path, json.dumps(postdict or '')))
+                retry(e)
+                continue
+
+            except requests.exceptions.Timeout as e:
+                self.metrics.inc('responses', (path, 'timeout'))
+                # Timeout, re-run this request
+                self.logger.warning("Timed out on request: %s (%s), retrying..." % (path, json.dumps(postdict or '')))
+                retry(e, idempotent)
+                continue
+
+            except requests.exceptions.ConnectionError as e:
+                self.metrics.inc('responses', (path, 'connection_error'))
+                self.logger.warning(("Unable to contact the GTE API (%s). Please check the URL. Retrying. " +
+                                     "Request: %s %s \n %s") % (e, url, json.dumps(postdict)))
+                retry(e, idempotent)
+                continue
+
+            self.metrics.observe('request_seconds', time.monotonic() - called, (path, 'total'))
+            return text_json
+
+    def __record_response(self, path, response):
+        """Correct the rate limiter from the budget the server reports, and count the response."""
+        headers = response.headers if response is not None else {}
+        header = lambda name: int(headers[name]) if name in headers else None
+        remaining = header('X-RateLimit-Remaining')
+        self.limiter.update(remaining, header('X-RateLimit-Reset'), header('X-RateLimit-Limit'))
+        if response is not None:
+            self.metrics.inc('responses', (path, str(response.status_code)))
+        if remaining is not None:
+            self.metrics.set('ratelimit_remaining', remaining)
+
+    def __record_timing(self, path, response, started, acquired, prepared, received):
+        """Record the phases of one attempt: rate-limit wait, signing, time to the response headers
+        (including connecting, on a new connection) and reading the body."""
+        server = response.elapsed.total_seconds()
+        observe = self.metrics.observe
+        observe('request_seconds', acquired - started, (path, 'wait'))
+        observe('request_seconds', prepared - acquired, (path, 'sign'))
+        observe('request_seconds', server, (path, 'server'))
+        observe('request_seconds', max(0., received - prepared - server), (path, 'read'))
 
 '''
 def test():
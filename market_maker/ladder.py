@@ -0,0 +1,92 @@
+"""Quote ladder: the prices and sizes of every order we want in the book for one cycle."""
+import numpy as np
+
+from market_maker.settings import settings
+
+BUY = '1'
+SELL = '0'
+
+
+class Ladder(object):
+    """One cycle's quotes as arrays, innermost level first.
+
+    buy_ticks, sell_ticks    prices in ticks (int64) of the instrument's `ticks`
+    buy_prices, sell_prices  prices (float64), the exact tick multiples
+    buy_sizes, sell_sizes    order sizes (int64)
+    """
+
+    def __init__(self, ticks, buy_ticks, buy_sizes, sell_ticks, sell_sizes):
+        self.ticks = ticks
+        self.buy_ticks = buy_ticks
+        self.buy_sizes = buy_sizes
+        self.sell_ticks = sell_ticks
+        self.sell_sizes = sell_sizes
+        self.buy_prices = ticks.to_price(buy_ticks)
+        self.sell_prices = ticks.to_price(sell_ticks)
+
+    @classmethod
+    def from_orders(cls, buy_orders, sell_orders, ticks):
+        """A ladder of order dicts with 'price' and 'qty', as built by custom strategies."""
+        def to_ticks(orders):
+            return np.rint(np.array([float(o['price']) for o in orders], dtype=np.float64) / ticks.size).astype(np.int64)
+
+        def sizes(orders):
+            return np.array([int(o['qty']) for o in orders], dtype=np.int64)
+        return cls(ticks, to_ticks(buy_orders), sizes(buy_orders), to_ticks(sell_orders), sizes(sell_orders))
+
+    def levels(self):
+        """Yield (side, price in ticks, size) for every quote, innermost first, alternating buy and sell."""
+        buys = list(zip(self.buy_ticks.tolist(), self.buy_sizes.tolist()))
+        sells = list(zip(self.sell_ticks.tolist(), self.sell_sizes.tolist()))
+        for i in range(max(len(buys), len(sells))):
+            if i < len(buys):
+                yield (BUY,) + buys[i]
+            if i < len(sells):
+                yield (SELL,) + sells[i]
+
+    def __len__(self):
+        return len(self.buy_ticks) + len(self.sell_ticks)
+
+    def __repr__(self):
+        return 'Ladder(%d buys, %d sells)' % (len(self.buy_ticks), len(self.sell_ticks))
+
+
+def build_ladder(start_buy, start_sell, ticks, pairs=None, buys=True, sells=True):
+    """Compute the whole ladder in one pass: ORDER_PAIRS levels a side, INTERVAL apart, starting from
+    start_buy / start_sell (in the instrument's `ticks`), rounded to whole ticks.
+
+    settings.LADDER_SPACING is 'geometric' (each level INTERVAL further from the one before, as a
+    fraction of its price) or 'linear' (INTERVAL of the start price per level). Sizes go from
+    ORDER_START_SIZE up by ORDER_STEP_SIZE per level, or are random between MIN_ORDER_SIZE and
+    MAX_ORDER_SIZE with RANDOM_ORDER_SIZE. Levels that would quote at a price <= 0 are left out.
+    """
+    if pairs is None:
+        pairs = settings.ORDER_PAIRS
+    interval = settings.INTERVAL
+    steps = np.arange(1, pairs + 1, dtype=np.float64)
+    if settings.MAINTAIN_SPREADS:
+        # The first level quotes right at the start position.
+        steps -= 1
+
+    spacing = settings.get('LADDER_SPACING') or 'geometric'
+    if spacing == 'geometric':
+        buy_levels = start_buy * (1 + interval) ** -steps
+        sell_levels = start_sell * (1 + interval) ** steps
+    elif spacing == 'linear':
+        buy_levels = start_buy * (1 - interval * steps)
+        sell_levels = start_sell * (1 + interval * steps)
+    else:
+        raise ValueError("settings.LADDER_SPACING must be 'geometric' or 'linear', not %r" % spacing)
+
+    buy_ticks = np.rint(buy_levels).astype(np.int64)
+    sell_ticks = np.rint(sell_levels).astype(np.int64)
+
+    if settings.RANDOM_ORDER_SIZE is True:
+        buy_sizes = np.random.randint(settings.MIN_ORDER_SIZE, settings.MAX_ORDER_SIZE + 1, pairs).astype(np.int64)
+        sell_sizes = np.random.randint(settings.MIN_ORDER_SIZE, settings.MAX_ORDER_SIZE + 1, pairs).astype(np.int64)
+    else:
+        buy_sizes = sell_sizes = settings.ORDER_START_SIZE + np.arange(pairs, dtype=np.int64) * settings.ORDER_STEP_SIZE
+
+    buy_keep = (buy_ticks > 0) & buys
+    sell_keep = np.full(pairs, bool(sells))
+    return Ladder(ticks, buy_ticks[buy_keep], buy_sizes[buy_keep], sell_ticks[sell_keep], sell_sizes[sell_keep])
@@ -1,18 +1,20 @@
 #coding=utf-8
 from __future__ import absolute_import
-from time import sleep
+from time import sleep, monotonic
 import sys
+import math
 from datetime import datetime
 from os.path import getmtime
-import random
 import requests
 import atexit
 import signal
 import uuid
 
-from market_maker import gte
+from market_maker import gte, ladder
+from market_maker.converge import Converger
+from market_maker.cycle import CycleContext
 from market_maker.settings import settings
-from market_maker.utils import log, constants, errors, math
+from market_maker.utils import log, constants, errors
 
 # Used for reloading the bot - saves modified times of key files
 import os
@@ -39,6 +41,8 @@ class ExchangeInterface:
                                     apiKey=settings.API_KEY, apiSecret=settings.API_SECRET,
                                     orderIDPrefix=settings.ORDERID_PREFIX, postOnly=settings.POST_ONLY,
                                     timeout=settings.TIMEOUT)
+        # Market and account reads so far, so a cycle's reads can be counted (see CycleContext).
+        self.reads = 0
 
     def cancel_order(self, order):
         tickLog = self.get_instrument()['tickLog']
@@ -54,23 +58,68 @@ class ExchangeInterface:
                 break
 
     def cancel_all_orders(self):
+        """Cancel our open orders in every instrument we track (SUBSCRIPTIONS), not only SYMBOL."""
         if self.dry_run:
             return
 
         logger.info("Resetting current position. Canceling all existing orders.")
-        tickLog = self.get_instrument()['tickLog']
 
         # In certain cases, a WS update might not make it through before we call this.
         # For that reason, we grab via HTTP to ensure we grab them all.
-        orders = self.gte.http_open_orders()
-
-        for order in orders:
-            logger.info("Canceling: %s %d @ %.*f" % (order['side'], order['orderQty'], tickLog, order['price']))
+        settle_currencies = self.gte.settle_currencies()
+        orders = []
+        for settle_currency in sorted(set(settle_currencies.values())):
+            for order in self.gte.iter_open_orders(settle_currency=settle_currency):
+                symbol = order.get('symbol', self.symbol)
+                if symbol not in settle_currencies:
+                    continue  # Another symbol settled in the same currency, which we don't trade
+                tickLog = self.get_instrument(symbol)['tickLog']
+                logger.info("Canceling: %s %s %d @ %.*f" % (symbol, order['side'], int(order['qty']), tickLog,
+                                                          float(order['price'])))
+                orders.append(order)
 
         if len(orders):
-            self.gte.cancel([order['orderID'] for order in orders])
+            self.cancel_orders(orders)
+
+    def create_orders(self, orders, instrument=None):
+        """Place orders concurrently. Outcomes are logged in the order given, as each one
+        completes. Returns the API responses (or errors), in the same order."""
+        tickLog = (instrument or self.get_instrument())['tickLog']
+        if self.dry_run:
+            # Nothing is sent: print what would be.
+            for order in orders:
+                logger.info("%4s %d @ %.*f" % (order['side'], order['qty'], tickLog, float(order['price'])))
+            return orders
+        results = []
+        for order, future in zip(orders, self.gte.create_orders(orders)):
+            try:
+                result = future.result()
+                error = None if result.get('code') == 0 else result.get('msg') or result
+            except Exception as e:
+                result = error = e
+            if error is None:
+                logger.info("%4s %d @ %.*f" % (order['side'], order['qty'], tickLog, float(order['price'])))
+            else:
+                logger.warning("%4s %d @ %.*f failed: %s" % (order['side'], order['qty'], tickLog, float(order['price']), error))
+            results.append(result)
+        return results
 
-        sleep(settings.API_REST_INTERVAL)
+    def cancel_orders(self, orders):
+        """Cancel orders in batches, under each order's own symbol (SYMBOL if the row has none).
+        Returns a dict of order_id -> None if canceled, or the error. Failures are logged."""
+        if self.dry_run:
+            return dict((order['order_id'], None) for order in orders)
+        by_symbol = {}
+        for order in orders:
+            by_symbol.setdefault(order.get('symbol', self.symbol), []).append(order['order_id'])
+        settle_currencies = self.gte.settle_currencies()
+        results = {}
+        for symbol, order_ids in by_symbol.items():
+            results.update(self.gte.cancel_orders(settle_currencies.get(symbol, self.settle_currency), symbol, order_ids))
+        failed = dict((order_id, error) for order_id, error in results.items() if error is not None)
+        if failed:
+            logger.warning("Failed to cancel %d of %d orders: %s" % (len(failed), len(orders), failed))
+        return results
 
     def get_portfolio(self):
         contracts = settings.CONTRACTS
@@ -129,75 +178,82 @@ class ExchangeInterface:
 
     # long仓位数量
     def get_long_delta(self, symbol=None):
-        if symbol is None:
-            symbol = self.symbol
-        ps = self.get_position(symbol)
-        #print(ps)
-        for p in ps:
-            if p['side'] == '1':
-                return int(p['qty'])
-        # 没找到
-        return 0
+        return self.get_inventory(symbol).long_qty
     
     # short仓位数量
     def get_short_delta(self, symbol=None):
+        return self.get_inventory(symbol).short_qty
+
+    def get_delta(self, symbol=None):
+        """Net position: long minus short contracts."""
+        return self.get_inventory(symbol).net_qty
+
+    def get_inventory(self, symbol=None):
+        """Our Inventory of a symbol, from the position and execution streams."""
         if symbol is None:
             symbol = self.symbol
-        ps = self.get_position(symbol)
-        for p in ps:
-            if p['side'] == '0':
-                return int(p['qty'])
-        # 没找到
-        return 0
+        self.reads += 1
+        return self.gte.inventory(symbol)
 
     def get_instrument(self, symbol=None):
         if symbol is None:
             symbol = self.symbol
+        self.reads += 1
         return self.gte.instrument(symbol)
 
     def get_margin(self):
+        self.reads += 1
         if self.dry_run:
             return {'marginBalance': float(settings.DRY_BTC), 'availableFunds': float(settings.DRY_BTC)}
         return self.gte.funds()
 
-    def get_orders_ws(self):
-        if self.dry_run:
-            return []
-        return self.gte.open_orders_ws()
-
-    def get_orders_http(self):
+    def get_orders(self):
+        """Our open orders, from the local order state."""
+        self.reads += 1
         if self.dry_run:
             return []
-        return self.gte.open_orders_http()
-
-    def get_highest_buy(self):
-        buys = [o for o in self.get_orders_http() if o['side'] == '1']
-        if not len(buys):
-            return {'price': -2**32}
-        highest_buy = max(buys or [], key=lambda o: float(o['price']))
-        return highest_buy if highest_buy else {'price': -2**32}
-
-    def get_lowest_sell(self):
-        sells = [o for o in self.get_orders_http() if o['side'] == '0']
-        if not len(sells):
-            return {'price': 2**32}
-        lowest_sell = min(sells or [], key=lambda o: float(o['price']))
-        return lowest_sell if lowest_sell else {'price': 2**32}  # ought to be enough for anyone
+        return self.gte.open_orders()
 
     def get_position(self, symbol=None):
         if symbol is None:
             symbol = self.symbol
+        self.reads += 1
         return self.gte.position_ws(self.instrument_type, self.settle_currency,symbol)
 
     def get_ticker(self, symbol=None):
         if symbol is None:
             symbol = self.symbol
+        self.reads += 1
         return self.gte.ticker_data(symbol)
 
+    def snapshot(self):
+        """Consistent, read-only view of all websocket data, for reading through a whole cycle."""
+        self.reads += 1
+        return self.gte.snapshot()
+
+    def get_metrics(self):
+        """REST request metrics: per-path latency, response codes, retries and rate-limit headroom."""
+        return self.gte.metrics_snapshot()
+
+    def dump_metrics(self):
+        return self.gte.metrics_dump()
+
+    def rest_calls(self):
+        """REST requests sent so far, retries included."""
+        return self.gte.metrics.total('responses')
+
+    def wait_for_update(self, timeout):
+        """Block until market or account data we quote on changes, or `timeout` seconds pass."""
+        return self.gte.wait_for_update(timeout)
+
     def is_open(self):
-        """Check that websockets are still open."""
+        """Check that websockets are still open (or reconnecting)."""
         return not self.gte.ws.exited
 
+    def is_synced(self):
+        """Check that the websocket is connected and its tables are up to date."""
+        return self.gte.ws.connected
+
     
     #def check_market_open(self):
     #    instrument = self.get_instrument()
@@ -205,9 +261,10 @@ class ExchangeInterface:
     #        raise errors.MarketClosedError("The instrument %s is not open. State: %s" %
     #                                       (self.symbol, instrument["state"]))
 
-    def check_if_orderbook_empty(self):
+    def check_if_orderbook_empty(self, instrument=None):
         """This function checks whether the order book is empty"""
-        instrument = self.get_instrument()
+        if instrument is None:
+            instrument = self.get_instrument()
         #if instrument['midPrice'] is None:  # 原代码
         if instrument['last_price'] is None:
             raise errors.MarketEmptyError("Orderbook is empty, cannot quote")
@@ -244,6 +301,9 @@ class OrderManager:
         # on any error.
         atexit.register(self.exit)
         signal.signal(signal.SIGTERM, self.exit)
+        # `kill -USR1 <pid>` logs the REST request metrics.
+        if hasattr(signal, 'SIGUSR1'):
+            signal.signal(signal.SIGUSR1, self.log_metrics)
 
         #logger.info('settle:'+self.settle_currency)
         #print(settings)
@@ -262,6 +322,10 @@ class OrderManager:
         self.running_qty_long = self.starting_qty_long
         self.running_qty_short = self.starting_qty_short
 
+        # Plans each cycle's order changes; remembers what the last cycle saw.
+        self.converger = Converger(settings.RELIST_INTERVAL, min_remaining=settings.get('RELIST_MIN_REMAINING', 0.5))
+        self.cycles = 0
+
 
 
         self.reset()
@@ -269,21 +333,36 @@ class OrderManager:
     def reset(self):
         # 无需取消所有订单吧？
         #self.exchange.cancel_all_orders() 
-        self.sanity_check()
-        self.print_status()
 
         # Create orders and converge.
-        self.place_orders()
-
-    def print_status(self):
+        self.run_cycle()
+
+    def new_cycle(self):
+        """Read the market and account state this cycle quotes on, once."""
+        self.cycles += 1
+        ctx = CycleContext.build(self.exchange, self.cycles)
+        self.instrument = ctx.instrument
+        return ctx
+
+    def run_cycle(self):
+        """One requote, off a single read of the exchange state. Returns its CycleContext."""
+        ctx = self.new_cycle()
+        self.sanity_check(ctx)  # Ensures health of mm - several cut-out points here
+        self.print_status(ctx)  # Print skew, delta, etc
+        self.place_orders(ctx)  # Creates desired orders and converges to existing orders
+        ctx.finish()
+        logger.debug("Cycle %d: %d reads, %d REST calls" % (ctx.number, ctx.reads, ctx.rest_calls))
+        return ctx
+
+    def print_status(self, ctx):
         """Print the current MM status."""
 
         #margin = self.exchange.get_margin()
-        position = self.exchange.get_position() #这里返回的是数组
-        self.running_qty_long = self.exchange.get_long_delta()
-        self.running_qty_short = self.exchange.get_short_delta()
+        position = ctx.positions #这里返回的是数组
+        self.running_qty_long = ctx.long_qty
+        self.running_qty_short = ctx.short_qty
 
-        tickLog = self.exchange.get_instrument()['tickLog']
+        tickLog = ctx.instrument['tickLog']
         #self.start_XBt = margin["marginBalance"]
         self.start_XBt = 500
 
@@ -294,40 +373,52 @@ class OrderManager:
         #if int(position['qty']) != 0:
             #logger.info("Avg Cost Price: %.*f" % (tickLog, float(position['avgCostPrice'])))
             #logger.info("Avg Entry Price: %.*f" % (tickLog, float(position['avgEntryPrice'])))
+        inventory = ctx.inventory
+        if inventory.long_qty or inventory.short_qty:
+            entry = lambda price: '%.*f' % (tickLog, price) if price is not None else 'unknown'
+            logger.info("Avg Entry Price: long %s; short %s" % (entry(inventory.long_entry), entry(inventory.short_entry)))
+        logger.info("Net Position: %d, Realized PnL: %.*f" % (inventory.net_qty, tickLog, inventory.realized_pnl))
         logger.info("Contracts Traded This Run: long %d; short %d" % (self.running_qty_long - self.starting_qty_long,self.running_qty_short - self.starting_qty_short ))
         #logger.info("Total Contract Delta: %.4f XBT" % self.exchange.calc_delta()['spot'])
 
-    def get_ticker(self):
-        ticker = self.exchange.get_ticker()
-        tickLog = self.exchange.get_instrument()['tickLog']
+    def get_ticker(self, ctx):
+        ticker = ctx.ticker
+        tickLog = ctx.instrument['tickLog']
 
         # Set up our buy & sell positions as the smallest possible unit above and below the current spread
         # and we'll work out from there. That way we always have the best price but we don't kill wide
         # and potentially profitable spreads.
-        #self.start_position_buy = ticker["buy"] + self.instrument['tickSize']
-        #self.start_position_sell = ticker["sell"] - self.instrument['tickSize']
-        self.start_position_buy = ticker["buy"] + 0.5
-        self.start_position_sell = ticker["sell"] - 0.5
+        ticks = ctx.instrument['ticks']
+        best_buy = ticks.to_ticks(ticker["buy"])
+        best_sell = ticks.to_ticks(ticker["sell"])
+        self.start_ticks_buy = best_buy + 1
+        self.start_ticks_sell = best_sell - 1
 
         # If we're maintaining spreads and we already have orders in place,
         # make sure they're not ours. If they are, we need to adjust, otherwise we'll
         # just work the orders inward until they collide.
         if settings.MAINTAIN_SPREADS:
-            if ticker['buy'] == self.exchange.get_highest_buy()['price']:
-                self.start_position_buy = ticker["buy"]
-            if ticker['sell'] == self.exchange.get_lowest_sell()['price']:
-                self.start_position_sell = ticker["sell"]
-
-        # Back off if our spread is too small.
-        if self.start_position_buy * (1.00 + settings.MIN_SPREAD) > self.start_position_sell:
-            self.start_position_buy *= (1.00 - (settings.MIN_SPREAD / 2))
-            self.start_position_sell *= (1.00 + (settings.MIN_SPREAD / 2))
+            highest_buy = ctx.highest_buy()
+            lowest_sell = ctx.lowest_sell()
+            if highest_buy is not None and best_buy == ticks.to_ticks(highest_buy['price']):
+                self.start_ticks_buy = best_buy
+            if lowest_sell is not None and best_sell == ticks.to_ticks(lowest_sell['price']):
+                self.start_ticks_sell = best_sell
+
+        # Back off if our spread is too small. Rounded outwards, so the spread is at least MIN_SPREAD.
+        if self.start_ticks_buy * (1.00 + settings.MIN_SPREAD) > self.start_ticks_sell:
+            self.start_ticks_buy = int(math.floor(self.start_ticks_buy * (1.00 - (settings.MIN_SPREAD / 2))))
+            self.start_ticks_sell = int(math.ceil(self.start_ticks_sell * (1.00 + (settings.MIN_SPREAD / 2))))
+
+        # The same start positions as prices, for logging and custom strategies.
+        self.start_position_buy = ticks.to_price(self.start_ticks_buy)
+        self.start_position_sell = ticks.to_price(self.start_ticks_sell)
 
         # Midpoint, used for simpler order placement.
         self.start_position_mid = ticker["mid"]
         logger.info(
             "%s Ticker: Buy: %.*f, Sell: %.*f" %
-            (self.instrument['symbol'], tickLog, ticker["buy"], tickLog, ticker["sell"])
+            (ctx.instrument['symbol'], tickLog, ticker["buy"], tickLog, ticker["sell"])
         )
         logger.info('Start Positions: Buy: %.*f, Sell: %.*f, Mid: %.*f' %
                     (tickLog, self.start_position_buy, tickLog, self.start_position_sell,
@@ -337,191 +428,120 @@ class OrderManager:
     def get_price_offset(self, index):
         """Given an index (1, -1, 2, -2, etc.) return the price for that side of the book.
            Negative is a buy, positive is a sell."""
+        return self.instrument['ticks'].to_price(self.get_tick_offset(index))
+
+    def get_tick_offset(self, index):
+        """get_price_offset(), in ticks."""
         # Maintain existing spreads for max profit
         if settings.MAINTAIN_SPREADS:
-            start_position = self.start_position_buy if index < 0 else self.start_position_sell
+            start_ticks = self.start_ticks_buy if index < 0 else self.start_ticks_sell
             # First positions (index 1, -1) should start right at start_position, others should branch from there
             index = index + 1 if index < 0 else index - 1
         else:
             # Offset mode: ticker comes from a reference exchange and we define an offset.
-            start_position = self.start_position_buy if index < 0 else self.start_position_sell
+            start_ticks = self.start_ticks_buy if index < 0 else self.start_ticks_sell
 
             # If we're attempting to sell, but our sell price is actually lower than the buy,
             # move over to the sell side.
-            if index > 0 and start_position < self.start_position_buy:
-                start_position = self.start_position_sell
+            if index > 0 and start_ticks < self.start_ticks_buy:
+                start_ticks = self.start_ticks_sell
             # Same for buys.
-            if index < 0 and start_position > self.start_position_sell:
-                start_position = self.start_position_buy
+            if index < 0 and start_ticks > self.start_ticks_sell:
+                start_ticks = self.start_ticks_buy
 
-        #return math.toNearest(start_position * (1 + settings.INTERVAL) ** index, self.instrument['tickSize'])
-        return math.toNearest(start_position * (1 + settings.INTERVAL) ** index, 0.5)
+        return int(round(start_ticks * (1 + settings.INTERVAL) ** index))
 
     ###
     # 处理订单，创建和取消Orders
     ###
-    def place_orders(self):
-        """Create order items for use in convergence."""
-
-        buy_orders = []
-        sell_orders = []
-        # Create orders from the outside in. This is intentional - let's say the inner order gets taken;
-        # then we match orders from the outside in, ensuring the fewest number of orders are amended and only
-        # a new order is created in the inside. If we did it inside-out, all orders would be amended
-        # down and a new order would be created at the outside.
-        for i in reversed(range(1, settings.ORDER_PAIRS + 1)):
-            if not self.long_position_limit_exceeded():
-                buy_orders.append(self.prepare_order(-i))
-            if not self.short_position_limit_exceeded():
-                sell_orders.append(self.prepare_order(i))
-
-        return self.converge_orders(buy_orders, sell_orders)
-
-    # 准备一个order对象
-    def prepare_order(self, index):
-        """Create an order object."""
-
-        if settings.RANDOM_ORDER_SIZE is True:
-            quantity = random.randint(settings.MIN_ORDER_SIZE, settings.MAX_ORDER_SIZE)
-        else:
-            quantity = settings.ORDER_START_SIZE + ((abs(index) - 1) * settings.ORDER_STEP_SIZE)
-
-        price = self.get_price_offset(index)  # float类型
-        return {  
+    def place_orders(self, ctx):
+        """Build this cycle's ladder and converge the book to it."""
+        return self.converge_ladder(self.build_ladder(ctx), ctx)
+
+    def build_ladder(self, ctx):
+        """Compute every buy and sell of this cycle in one pass, from the start positions set by get_ticker()."""
+        return ladder.build_ladder(self.start_ticks_buy, self.start_ticks_sell, ctx.instrument['ticks'],
+                                   buys=not self.long_position_limit_exceeded(ctx),
+                                   sells=not self.short_position_limit_exceeded(ctx))
+
+    def new_order(self, side, price_ticks, quantity):
+        """Create an order object to send. Its price is the decimal string of `price_ticks`."""
+        return {
             'asset':settings.SETTLECURRENCY,
             'symbol': settings.SYMBOL,
-            'price': price, 
-            'qty': quantity, 
-            'side': "1" if index < 0 else "0" , 
+            'price': self.instrument['ticks'].to_str(price_ticks),
+            'qty': quantity,
+            'side': side,
             'close_flag':0 ,
             'order_type':1
             }   #1是多 0是卖出空;0 是开仓
 
     # 统计账户中的活动订单，取消某些订单；
     # 创建新订单
-    def converge_orders(self, buy_orders, sell_orders):
-        """Converge the orders we currently have in the book with what we want to be in the book.
-           This involves amending any open orders and creating new ones if any have filled completely.
-           We start from the closest orders outward."""
-        max_qty = 1000  # 单个价位允许存在的最大订单
-
-        tickLog = self.exchange.get_instrument()['tickLog']
-        
-        to_create = []
-        to_cancel = []
-
-        #existing_orders_raw = self.exchange.get_orders()
-        #existing_orders_raw = self.exchange.gte.open_orders()
-        existing_orders_raw =self.exchange.get_orders_http()
-        at_price_dict = {}  # 在每个价格上的活动订单数组 price -> [order1,order2...] 
-
-        # 返回的订单没有按照价格合并，所以首先要合并
-        print(existing_orders_raw)
-        for order in existing_orders_raw:   
-            price_str = order['price']
-            if not price_str in at_price_dict:
-                at_price_dict[price_str] = [order]
-            else:
-                at_price_dict[price_str].append(order)
-
-        #logger.info(at_price_dict)
-        # 先处理buy_orders和sell_orders
-        for order in buy_orders:
-            price_str = str(order['price'])
-            if not price_str in at_price_dict:
-                to_create.append(order)
-            else:  # 在该价位已经有订单
-                arr = at_price_dict[price_str]
-                total_qty = sum(int(item['qty'])-int(item['filled_qty']) for item in arr)
-                if total_qty + order['qty'] < max_qty:
-                    to_create.append(order)
-
-        for order in sell_orders:
-            price_str = str(order['price'])
-            if not price_str in at_price_dict:
-                to_create.append(order)
-            else:  # 在该价位已经有订单
-                arr = at_price_dict[price_str]
-                total_qty = sum(int(item['qty'])-int(item['filled_qty']) for item in arr)
-                if total_qty + order['qty'] < max_qty:
-                    to_create.append(order)
-
-        # 处理已经存在的订单
-        # 超过每个价位的限额，则把改价位所有的订单取消。
-        # 超过价格范围的无意义订单也取消，避免占用资金
-        #print(at_price_dict)
-        for key,arr in at_price_dict.items():
-            if float(key) > self.get_price_offset(settings.ORDER_PAIRS + 1) or float(key) < self.get_price_offset( -1 * (settings.ORDER_PAIRS + 1)):
-                logger.info('取消价外订单')
-                to_cancel.extend(arr)
-                continue
-
-            total_qty = sum(int(item['qty'])-int(item['filled_qty']) for item in arr)
-            if total_qty > max_qty: #这里要修改具体数值
-                #取消所有过量订单
-                logger.info('取消过量订单')
-                to_cancel.extend(arr)
+    def converge_orders(self, buy_orders, sell_orders, ctx):
+        """Converge the orders we currently have in the book with lists of order dicts, as a custom
+           place_orders() would build them. See converge_ladder()."""
+        return self.converge_ladder(ladder.Ladder.from_orders(buy_orders, sell_orders, ctx.instrument['ticks']), ctx)
+
+    def converge_ladder(self, quotes, ctx):
+        """Converge the orders we currently have in the book with the ladder we want in the book,
+           with the fewest cancels and creates: orders within RELIST_INTERVAL of a level stay,
+           levels without one get a new order, and orders off the ladder are canceled."""
+        tickLog = ctx.instrument['tickLog']
+
+        plan = self.converger.plan(quotes, ctx.orders)
+        logger.debug("Convergence: %s" % plan)
+
+        # Cancel first: stale orders sit at bad prices, and canceling frees margin for the new ones.
+        if len(plan.cancel) > 0:
+            logger.info("Canceling %d orders:" % (len(plan.cancel)))
+            for order in plan.cancel:
+                logger.info("%4s %d @ %.*f" % (order['side'], int(order['qty']), tickLog, float(order['price'])))
+            self.exchange.cancel_orders(plan.cancel)
 
-        if len(to_create) > 0:
+        # Innermost first.
+        if len(plan.create) > 0:
+            to_create = [self.new_order(side, price, qty) for side, price, qty in plan.create]
             logger.info("Creating %d orders:" % (len(to_create)))
-            for order in reversed(to_create):
-                logger.info("%4s %d @ %.*f" % (order['side'], order['qty'], tickLog, order['price']))
-
-                self.exchange.gte._curl_gte(path='/v1/api/pc/order/create', query=order, verb='POST')
-                #sleep(5)
-                
+            self.exchange.create_orders(to_create, ctx.instrument)
             #self.exchange.create_bulk_orders(to_create)  #暂时没有bulk order 接口
 
-        to_cancel_ids = []
-        # Could happen if we exceed a delta limit
-        if len(to_cancel) > 0:
-            logger.info("Canceling %d orders:" % (len(to_cancel)))
-            for order in reversed(to_cancel):
-                logger.info("%4s %d @ %.*f" % (order['side'], int(order['qty']), tickLog, float(order['price'])))
-            to_cancel_ids = [o['order_id'] for o in to_cancel]
-            
-            for id in to_cancel_ids:
-                self.exchange.gte.cancel(self.settle_currency,self.symbol,id)
-                sleep(1)
-            #后面记得改成批处理订单
-            #self.exchange.gte.cancel_batch(self.settle_currency,self.symbol,to_cancel_ids)
-
     ###
     # Position Limits
     ###
 
-    def short_position_limit_exceeded(self):
+    def short_position_limit_exceeded(self, ctx):
         """Returns True if the short position limit is exceeded"""
         if not settings.CHECK_POSITION_LIMITS:
             return False
-        position = self.exchange.get_delta()
-        return position <= settings.MIN_POSITION
+        return ctx.inventory.short_limit_exceeded(settings.MIN_POSITION)
 
-    def long_position_limit_exceeded(self):
+    def long_position_limit_exceeded(self, ctx):
         """Returns True if the long position limit is exceeded"""
         if not settings.CHECK_POSITION_LIMITS:
             return False
-        position = self.exchange.get_delta()
-        return position >= settings.MAX_POSITION
+        return ctx.inventory.long_limit_exceeded(settings.MAX_POSITION)
 
     ###
     # Sanity
     ##
 
-    def sanity_check(self):
+    def sanity_check(self, ctx):
         """Perform checks before placing orders."""
 
         # Check if OB is empty - if so, can't quote.
-        self.exchange.check_if_orderbook_empty()
+        self.exchange.check_if_orderbook_empty(ctx.instrument)
 
         # Ensure market is still open.
         #self.exchange.check_market_open()
 
         # Get ticker, which sets price offsets and prints some debugging info.
-        ticker = self.get_ticker()
+        ticker = self.get_ticker(ctx)
 
         # Sanity check:
-        if self.get_price_offset(-1) >= ticker["sell"] or self.get_price_offset(1) <= ticker["buy"]:
+        ticks = ctx.instrument['ticks']
+        if (self.get_tick_offset(-1) >= ticks.to_ticks(ticker["sell"]) or
+                self.get_tick_offset(1) <= ticks.to_ticks(ticker["buy"])):
             logger.error("Buy: %s, Sell: %s" % (self.start_position_buy, self.start_position_sell))
             logger.error("First buy position: %s\nGTE Best Ask: %s\nFirst sell position: %s\nGTE Best Bid: %s" %
                          (self.get_price_offset(-1), ticker["sell"], self.get_price_offset(1), ticker["buy"]))
@@ -529,15 +549,15 @@ class OrderManager:
             self.exit()
 
         # Messaging if the position limits are reached
-        if self.long_position_limit_exceeded():
+        if self.long_position_limit_exceeded(ctx):
             logger.info("Long delta limit exceeded")
             logger.info("Current Position: %.f, Maximum Position: %.f" %
-                        (self.exchange.get_delta(), settings.MAX_POSITION))
+                        (ctx.net_qty, settings.MAX_POSITION))
 
-        if self.short_position_limit_exceeded():
+        if self.short_position_limit_exceeded(ctx):
             logger.info("Short delta limit exceeded")
             logger.info("Current Position: %.f, Minimum Position: %.f" %
-                        (self.exchange.get_delta(), settings.MIN_POSITION))
+                        (ctx.net_qty, settings.MIN_POSITION))
 
     ###
     # Running
@@ -549,6 +569,10 @@ class OrderManager:
             if getmtime(f) > mtime:
                 self.restart()
 
+    def log_metrics(self, *args):
+        """Log the REST request metrics collected so far."""
+        logger.info("REST request metrics (ms):\n%s" % self.exchange.dump_metrics())
+
     def check_connection(self):
         """Ensure the WS connections are still open."""
         return self.exchange.is_open()
@@ -571,7 +595,7 @@ class OrderManager:
             #sys.stdout.flush()
 
             self.check_file_change()
-            sleep(settings.LOOP_INTERVAL)
+            self.wait_for_requote()
 
             # This will restart on very short downtime, but if it's longer,
             # the MM will crash entirely as it is unable to connect to the WS on boot.
@@ -579,9 +603,43 @@ class OrderManager:
                 logger.error("Realtime data connection unexpectedly closed, restarting.")
                 self.restart()
 
-            self.sanity_check()  # Ensures health of mm - several cut-out points here
-            self.print_status()  # Print skew, delta, etc
-            self.place_orders()  # Creates desired orders and converges to existing orders
+            # The websocket reconnects by itself; don't quote off half-rebuilt tables meanwhile.
+            if not self.exchange.is_synced():
+                logger.warning("Realtime data connection is reconnecting, skipping this cycle.")
+                continue
+
+            try:
+                self.run_cycle()
+            except errors.NotSyncedError as e:
+                # The reconnect started after the check above.
+                logger.warning("%s, skipping this cycle." % e)
+
+    def wait_for_requote(self):
+        """Wait until the next cycle should run.
+
+        With EVENT_DRIVEN off this just sleeps LOOP_INTERVAL. With it on, we wake as soon as the
+        websocket reports a top-of-book, order, position or execution change, or after LOOP_MAX_IDLE
+        seconds as a heartbeat. A burst of changes is coalesced into a single requote: after waking
+        we keep collecting until REQUOTE_DEBOUNCE seconds pass quietly, or REQUOTE_MAX_DELAY in total."""
+        if not settings.get('EVENT_DRIVEN', False):
+            sleep(settings.LOOP_INTERVAL)
+            return
+
+        changed = self.exchange.wait_for_update(settings.get('LOOP_MAX_IDLE', settings.LOOP_INTERVAL))
+        if not changed:
+            return
+
+        debounce = settings.get('REQUOTE_DEBOUNCE', 0.25)
+        deadline = monotonic() + settings.get('REQUOTE_MAX_DELAY', 1)
+        while debounce > 0:
+            remaining = deadline - monotonic()
+            if remaining <= 0:
+                break
+            more = self.exchange.wait_for_update(min(debounce, remaining))
+            if not more:
+                break
+            changed |= more
+        logger.debug("Requoting on changes to: %s" % ', '.join(sorted(changed)))
 
     def restart(self):
         logger.info("Restarting the market maker...")
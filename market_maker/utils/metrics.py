@@ -0,0 +1,173 @@
+import threading
+from bisect import bisect_left
+
+# Histogram bucket upper bounds, in seconds: 0.5ms doubling up to ~33s. Anything slower goes in
+# a last, unbounded bucket.
+BUCKETS = tuple(0.0005 * 2 ** i for i in range(17))
+
+
+class Histogram(object):
+    """Counts of observed values per bucket, plus count, sum, min and max."""
+
+    __slots__ = ('counts', 'count', 'sum', 'min', 'max')
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        for i, n in enumerate(other.counts):
+            self.counts[i] += n
+        self.count += other.count
+        self.sum += other.sum
+        if other.min is not None and (self.min is None or other.min < self.min):
+            self.min = other.min
+        if other.max is not None and (self.max is None or other.max > self.max):
+            self.max = other.max
+
+    def percentile(self, q):
+        """Upper bound of the bucket holding the q-th percentile (0-100), or None if empty.
+        Never more than the largest value seen."""
+        if not self.count:
+            return None
+        rank = q / 100. * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank and n:
+                return min(BUCKETS[i], self.max) if i < len(BUCKETS) else self.max
+        return self.max
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'mean': self.sum / self.count if self.count else None,
+            'min': self.min,
+            'max': self.max,
+            'p50': self.percentile(50),
+            'p90': self.percentile(90),
+            'p99': self.percentile(99),
+        }
+
+
+class Registry(object):
+    """In-process counters, gauges and histograms, each named and labelled with a tuple.
+
+    Recording takes no lock: every thread writes to its own shard, and reads add the shards up.
+    Only a thread's first write takes a lock, to register its shard. Gauges are plain assignments.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._shards = []
+        self._gauges = {}
+        self._lock = threading.Lock()
+
+    #
+    # Recording
+    #
+    def inc(self, name, labels=(), n=1):
+        counters = self.__shard()[0]
+        key = (name, labels)
+        counters[key] = counters.get(key, 0) + n
+
+    def observe(self, name, value, labels=()):
+        histograms = self.__shard()[1]
+        key = (name, labels)
+        histogram = histograms.get(key)
+        if histogram is None:
+            histogram = histograms[key] = Histogram()
+        histogram.observe(value)
+
+    def set(self, name, value, labels=()):
+        self._gauges[(name, labels)] = value
+
+    #
+    # Reading
+    #
+    def counter(self, name, labels=()):
+        key = (name, labels)
+        return sum(counters.get(key, 0) for counters, histograms in self.__shards())
+
+    def total(self, name):
+        """A counter summed over all its labels."""
+        return sum(n for counters, histograms in self.__shards()
+                   for (counter, labels), n in list(counters.items()) if counter == name)
+
+    def histogram(self, name, labels=()):
+        """A merged copy of a histogram, empty if nothing was observed."""
+        key = (name, labels)
+        merged = Histogram()
+        for counters, histograms in self.__shards():
+            if key in histograms:
+                merged.merge(histograms[key])
+        return merged
+
+    def gauge(self, name, labels=()):
+        return self._gauges.get((name, labels))
+
+    def snapshot(self):
+        """Everything recorded so far, as {'counters': {name: {labels: count}}, 'gauges': {name:
+        {labels: value}}, 'histograms': {name: {labels: summary}}}."""
+        counters = {}
+        merged = {}
+        for shard_counters, shard_histograms in self.__shards():
+            for key, n in list(shard_counters.items()):
+                counters[key] = counters.get(key, 0) + n
+            for key, histogram in list(shard_histograms.items()):
+                if key not in merged:
+                    merged[key] = Histogram()
+                merged[key].merge(histogram)
+        return {
+            'counters': _by_name(counters),
+            'gauges': _by_name(dict(self._gauges)),
+            'histograms': _by_name(dict((key, h.summary()) for key, h in merged.items())),
+        }
+
+    def dump(self):
+        """The snapshot as a readable table, one series per line. Times are in milliseconds."""
+        snapshot = self.snapshot()
+        lines = []
+        for name, series in sorted(snapshot['histograms'].items()):
+            lines.append('%-48s %8s %9s %9s %9s %9s %9s' % (name, 'count', 'mean', 'p50', 'p90', 'p99', 'max'))
+            for labels, s in sorted(series.items()):
+                lines.append('  %-46s %8d %9.1f %9.1f %9.1f %9.1f %9.1f' % (
+                    ' '.join(labels), s['count'], s['mean'] * 1000, s['p50'] * 1000, s['p90'] * 1000,
+                    s['p99'] * 1000, s['max'] * 1000))
+        for kind in ('counters', 'gauges'):
+            for name, series in sorted(snapshot[kind].items()):
+                lines.append(name)
+                for labels, value in sorted(series.items()):
+                    lines.append('  %-46s %8s' % (' '.join(labels) or '-', value))
+        return '\n'.join(lines)
+
+    def __shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = ({}, {})
+            with self._lock:
+                self._shards.append(shard)
+        return shard
+
+    def __shards(self):
+        with self._lock:
+            return list(self._shards)
+
+
+def _by_name(series):
+    result = {}
+    for (name, labels), value in series.items():
+        result.setdefault(name, {})[labels] = value
+    return result
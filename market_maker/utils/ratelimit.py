@@ -0,0 +1,127 @@
+import threading
+import time
+from time import monotonic
+
+# Request priority classes, most urgent first.
+CANCEL = 0
+CREATE = 1
+QUERY = 2
+
+
+class RateLimiter(object):
+    """Client-side token bucket for the REST API, so we run out of budget on our side instead
+    of getting a 429.
+
+    The bucket holds up to `limit` tokens and refills at limit/window per second. Every request
+    takes one token. The server's X-RateLimit-* headers are authoritative: each response resets
+    the token count to what the server says is left, less the requests still in flight, and the
+    bucket is full again at X-RateLimit-Reset. A response saying nothing is left (or a 429) stops
+    all requests until then.
+
+    Cancels come first: creates and queries leave the last `reserve` tokens for cancels, and
+    never take a token while a more urgent request is waiting.
+    """
+
+    def __init__(self, limit, window, reserve=0):
+        self.limit = limit
+        self.window = float(window)
+        self.reserve = reserve
+        self.tokens = float(limit)
+        self.pending = 0           # Requests sent whose response we haven't seen
+        self._reset_at = None      # Monotonic time the server's window resets, if known
+        self._blocked = False      # The server's window is used up until _reset_at
+        self._updated = monotonic()
+        self._waiting = [0, 0, 0]  # Waiting requests per priority class
+        self._cond = threading.Condition()
+
+    def acquire(self, priority=CREATE, timeout=None):
+        """Take a token, waiting for one if needed. Returns False if `timeout` seconds passed first."""
+        deadline = None if timeout is None else monotonic() + timeout
+        with self._cond:
+            self._waiting[priority] += 1
+            try:
+                while True:
+                    now = monotonic()
+                    self.__refill(now)
+                    wait = self.__wait_time(priority, now)
+                    if wait <= 0:
+                        self.tokens -= 1
+                        self.pending += 1
+                        return True
+                    if deadline is not None:
+                        if now >= deadline:
+                            return False
+                        wait = min(wait, deadline - now)
+                    self._cond.wait(wait)
+            finally:
+                self._waiting[priority] -= 1
+                self._cond.notify_all()
+
+    def release(self):
+        """Give back a token from acquire() that was not used to send a request."""
+        with self._cond:
+            self.pending = max(0, self.pending - 1)
+            self.tokens = min(float(self.limit), self.tokens + 1)
+            self._cond.notify_all()
+
+    def update(self, remaining=None, reset=None, limit=None):
+        """Correct the bucket from a response's X-RateLimit-Remaining, -Reset (epoch seconds)
+        and -Limit headers. Call once per acquire(), with no arguments if there was no response,
+        unless the token was given back with release()."""
+        with self._cond:
+            self.pending = max(0, self.pending - 1)
+            if limit is not None:
+                self.limit = limit
+            if reset is not None:
+                self._reset_at = monotonic() + max(0., reset - time.time())
+            if remaining is not None:
+                self.tokens = max(0., min(float(self.limit), remaining - self.pending))
+                self._updated = monotonic()  # The server's count is as of now: refill from here
+                if remaining <= 0 and self._reset_at is not None:
+                    self._blocked = True
+            self._cond.notify_all()
+
+    def exhausted(self, reset):
+        """The server says the budget is used up until `reset` (epoch seconds), e.g. on a 429."""
+        with self._cond:
+            self.tokens = 0.
+            self._updated = monotonic()
+            self._reset_at = monotonic() + max(0., reset - time.time())
+            self._blocked = True
+            self._cond.notify_all()
+
+    def budget(self, priority=CREATE):
+        """Requests of this priority class that can be sent right now without waiting."""
+        with self._cond:
+            now = monotonic()
+            self.__refill(now)
+            if self._blocked:
+                return 0
+            return max(0, int(self.tokens - self.__reserve(priority)))
+
+    def __reserve(self, priority):
+        return 0 if priority == CANCEL else self.reserve
+
+    def __refill(self, now):
+        if self._reset_at is not None and now >= self._reset_at:
+            # The server's window has reset.
+            self._reset_at = None
+            self._blocked = False
+            self.tokens = float(self.limit)
+        if not self._blocked:
+            self.tokens = min(float(self.limit), self.tokens + (now - self._updated) * self.limit / self.window)
+        self._updated = now
+
+    def __wait_time(self, priority, now):
+        """Seconds until a request of this priority may take a token, or <= 0 if it may now."""
+        if self._blocked:
+            return self._reset_at - now
+        needed = 1 + self.__reserve(priority) - self.tokens
+        if needed > 0:
+            wait = needed * self.window / self.limit
+            if self._reset_at is not None:
+                wait = min(wait, self._reset_at - now)
+            return max(wait, 0.001)
+        if any(self._waiting[:priority]):
+            return self.window / self.limit  # Woken up early when the more urgent request goes
+        return 0
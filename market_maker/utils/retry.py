@@ -0,0 +1,58 @@
+import random
+from time import monotonic
+
+
+class Retry(object):
+    """Retry state for one request: how many times it was retried and how much time is left.
+
+    Waits between attempts grow exponentially from `backoff` seconds, capped at `max_backoff`,
+    with full jitter (a random wait between 0 and that), so requests that failed together don't
+    all come back at the same moment. No retry is started that would end past `deadline` seconds
+    after start(), which is called once the request is first ready to send.
+
+    Every request gets its own Retry, so requests running concurrently never share a count.
+    """
+
+    def __init__(self, max_retries, backoff, max_backoff, deadline=None):
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.window = deadline
+        self.deadline = None
+        self.retries = 0
+
+    def start(self):
+        """Start the deadline, if it isn't running yet."""
+        if self.window is not None and self.deadline is None:
+            self.deadline = monotonic() + self.window
+
+    def expired(self):
+        """Whether the deadline has passed, so no attempt should be sent."""
+        remaining = self.remaining()
+        return remaining is not None and remaining <= 0
+
+    def remaining(self):
+        """Seconds left until the deadline, or None if there is none (or it isn't started)."""
+        if self.deadline is None:
+            return None
+        return max(0., self.deadline - monotonic())
+
+    def timeout(self, timeout):
+        """The timeout for the next attempt: `timeout`, cut short to the time left."""
+        remaining = self.remaining()
+        if remaining is None:
+            return timeout
+        return remaining if timeout is None else min(timeout, remaining)
+
+    def next(self, delay=None):
+        """Count a retry and return the seconds to wait before it, or None if the retries or the
+        time are used up. `delay` replaces the backoff when the wait is known (e.g. a rate-limit reset)."""
+        if self.retries >= self.max_retries:
+            return None
+        if delay is None:
+            delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** self.retries))
+        remaining = self.remaining()
+        if remaining is not None and delay >= remaining:
+            return None
+        self.retries += 1
+        return delay
@@ -0,0 +1,48 @@
+from decimal import Decimal
+
+
+class Ticks(object):
+    """Fixed-point prices for one instrument: a price is a whole number of ticks.
+
+    Built once from the instrument's tick_size. Prices from the API (strings or floats) become
+    ints with to_ticks(); arithmetic and comparisons stay in ints; to_price() and to_str() turn
+    ticks back into a float or the decimal string sent to the API. No Decimal is built per price.
+    """
+
+    def __init__(self, tick_size):
+        tick = Decimal(str(tick_size))
+        self.decimals = max(-tick.as_tuple().exponent, 0)
+        self.scale = 10 ** self.decimals             # Prices times scale are whole numbers
+        self.units = int(tick * self.scale)          # One tick, in 1/scale
+        self.size = float(tick)
+
+    def to_ticks(self, price):
+        """The nearest whole number of ticks to a price (a string or a number)."""
+        return int(round(float(price) / self.size))
+
+    def to_price(self, ticks):
+        """The float nearest to the decimal price of `ticks` (int or NumPy array): a whole
+        number divided by a power of ten, so no float error creeps in."""
+        return (ticks * self.units) / float(self.scale)
+
+    def to_str(self, ticks):
+        """The decimal string of a price in ticks, e.g. '7421' or '8000.5'."""
+        value = int(ticks) * self.units
+        if not self.decimals:
+            return str(value)
+        sign = '-' if value < 0 else ''
+        whole, fraction = divmod(abs(value), self.scale)
+        return '%s%d.%0*d' % (sign, whole, self.decimals, fraction)
+
+    def round(self, price):
+        """A price rounded to the nearest tick, as a float. Same as math.toNearest, faster."""
+        return self.to_price(self.to_ticks(price))
+
+    def __eq__(self, other):
+        return isinstance(other, Ticks) and (self.units, self.scale) == (other.units, other.scale)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return 'Ticks(%s)' % self.to_str(1)
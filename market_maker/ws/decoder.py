@@ -0,0 +1,44 @@
+import json
+
+# JSON decoding of websocket frames.
+#
+# The fastest installed parser is used: orjson, then ujson, then the stdlib. None of them is
+# required; `pip install orjson` is enough to switch.
+BACKENDS = {'json': json.loads}
+try:
+    import orjson
+    BACKENDS['orjson'] = orjson.loads
+except ImportError:
+    pass
+try:
+    import ujson
+    BACKENDS['ujson'] = ujson.loads
+except ImportError:
+    pass
+
+DEFAULT_BACKEND = next(name for name in ('orjson', 'ujson', 'json') if name in BACKENDS)
+
+
+class FrameDecoder(object):
+    '''Decodes raw frames, dropping frames of tables nobody reads.
+
+    Frames are decoded first and then dropped by their table. Scanning the raw frame for the
+    table name before decoding it costs more on the frames it doesn't skip than it saves on the
+    ones it does, with every backend (see test/decoder-benchmark.py).
+    '''
+
+    def __init__(self, skip_tables=(), backend=None):
+        self.backend = backend or DEFAULT_BACKEND
+        self.loads = BACKENDS[self.backend]
+        self.skip_tables = tuple(skip_tables)
+        self._skip = frozenset(self.skip_tables)
+        if not self.skip_tables:
+            # Nothing to filter: decode() is the parser itself.
+            self.decode = self.loads
+
+    def decode(self, raw):
+        '''Return the decoded frame, or None if it belongs to a skipped table.'''
+        message = self.loads(raw)
+        if type(message) is dict and message.get('table') in self._skip:
+            return None
+        return message
@@ -0,0 +1,246 @@
+import threading
+from time import monotonic
+
+
+# Our position in one symbol. GTE positions are two-sided: a long ('1') and a short ('0') position
+# are held side by side, each with its own size and average entry price. Realized PnL is in quote
+# currency per contract (price difference times contracts); multiply by the contract size for
+# the settle currency.
+#
+# Position rows set a side's size. The part of a row's change that no execution has explained yet
+# is kept as the side's `pending` contracts, and fills that follow are matched against it first:
+# those contracts are counted already, so they only move the entry price or realized PnL. A
+# pending change still unexplained after MATCH_WINDOW seconds is dropped.
+#
+# An entry price is None while unknown: when contracts were opened that no execution or position
+# row priced, and until the side is flat again. Closing fills of such a side add nothing to
+# realized PnL.
+class Inventory(object):
+
+    # Seconds the executions of a position row's change may take to arrive.
+    MATCH_WINDOW = 5.0
+
+    __slots__ = ('symbol', 'long_qty', 'short_qty', 'long_entry', 'short_entry', 'long_basis', 'short_basis',
+                 'long_pending', 'short_pending', 'long_pending_at', 'short_pending_at', 'realized_pnl', 'fills')
+
+    def __init__(self, symbol):
+        self.symbol = symbol
+        self.long_qty = 0
+        self.short_qty = 0
+        self.long_entry = 0.    # Average entry price of the long position, 0 when flat, None if unknown
+        self.short_entry = 0.
+        self.long_basis = 0     # Contracts of the long position long_entry is the average of
+        self.short_basis = 0
+        self.long_pending = 0   # Change of long_qty from position rows not explained by executions yet
+        self.short_pending = 0
+        self.long_pending_at = None  # When long_pending was first left unexplained
+        self.short_pending_at = None
+        self.realized_pnl = 0.
+        self.fills = 0
+
+    @property
+    def net_qty(self):
+        return self.long_qty - self.short_qty
+
+    def long_limit_exceeded(self, max_position):
+        '''True if the net position is at or above max_position.'''
+        return self.net_qty >= max_position
+
+    def short_limit_exceeded(self, min_position):
+        '''True if the net position is at or below min_position.'''
+        return self.net_qty <= min_position
+
+    def fill(self, side, qty, price, close=False, now=None):
+        '''Apply one fill: a buy ('1') opens a long or closes a short, a sell ('0') opens a short
+        or closes a long. `now` is a monotonic time, to expire pending changes; returns True if one
+        expired unexplained.'''
+        self.fills += 1
+        held_side = ('0' if side == '1' else '1') if close else side
+        prefix = _PREFIXES[held_side]
+        expired = self.__expire(prefix, now)
+        held, pending = getattr(self, prefix + 'qty'), getattr(self, prefix + 'pending')
+        entry, basis = getattr(self, prefix + 'entry'), getattr(self, prefix + 'basis')
+        if close:
+            counted = min(qty, max(0, -pending))  # Closed in a position row already
+            closed = counted + min(qty - counted, held)
+            if entry is not None:
+                self.realized_pnl += (price - entry if held_side == '1' else entry - price) * closed
+            held -= closed - counted
+            pending += counted
+            basis = min(basis, held + max(0, -pending))
+        else:
+            counted = min(qty, max(0, pending))   # Opened in a position row already
+            held += qty - counted
+            pending -= counted
+            priced = min(qty, held - basis)
+            if priced > 0 and entry is not None:
+                entry = (entry * basis + price * priced) / (basis + priced)
+                basis += priced
+        self.__set(prefix, held, entry, basis, pending)
+        return expired
+
+    def set_qty(self, side, qty, entry=None, now=None, partial=False):
+        '''Set one side's size from a position row. Any change executions haven't explained yet is
+        left pending for them; a partial replaces the side outright. Returns True if an earlier
+        pending change expired unexplained.'''
+        prefix = _PREFIXES[side]
+        expired = self.__expire(prefix, now)
+        pending = 0 if partial else getattr(self, prefix + 'pending') + qty - getattr(self, prefix + 'qty')
+        basis = getattr(self, prefix + 'basis')
+        if entry is None:
+            entry = getattr(self, prefix + 'entry')
+            if partial and qty > basis:
+                entry = None  # Contracts we didn't see opening
+            basis = min(basis, qty) if partial else basis
+        else:
+            basis = qty
+        if pending and getattr(self, prefix + 'pending_at') is None:
+            setattr(self, prefix + 'pending_at', now)
+        self.__set(prefix, qty, entry, basis, pending)
+        return expired
+
+    def copy(self):
+        inventory = Inventory(self.symbol)
+        for slot in Inventory.__slots__:
+            setattr(inventory, slot, getattr(self, slot))
+        return inventory
+
+    def __expire(self, prefix, now):
+        pending_at = getattr(self, prefix + 'pending_at')
+        if now is None or pending_at is None or now - pending_at < Inventory.MATCH_WINDOW:
+            return False
+        held = getattr(self, prefix + 'qty')
+        basis = min(getattr(self, prefix + 'basis'), held)
+        entry = getattr(self, prefix + 'entry') if basis == held else None
+        self.__set(prefix, held, entry, basis, 0)
+        return True
+
+    def __set(self, prefix, held, entry, basis, pending):
+        if not held and not pending:
+            entry, basis = 0., 0
+        setattr(self, prefix + 'qty', held)
+        setattr(self, prefix + 'entry', entry)
+        setattr(self, prefix + 'basis', basis)
+        setattr(self, prefix + 'pending', pending)
+        if not pending:
+            setattr(self, prefix + 'pending_at', None)
+
+    def __repr__(self):
+        return 'Inventory(%s, long %d @ %s, short %d @ %s, net %d, realized %g)' % (
+            self.symbol, self.long_qty, '%g' % self.long_entry if self.long_entry is not None else '?',
+            self.short_qty, '%g' % self.short_entry if self.short_entry is not None else '?', self.net_qty,
+            self.realized_pnl)
+
+
+_PREFIXES = {'1': 'long_', '0': 'short_'}
+
+
+# Our inventory per symbol, kept up to date by the position and execution streams, so position
+# limits are checked in constant time instead of scanning the position rows every time.
+#
+# Every execution is applied as it arrives, in O(1): sizes, average entry prices and realized PnL
+# move with each fill. Position rows are the exchange's own count and always win: a row sets the
+# side's size, which also brings us back in line after a reconnect.
+#
+# GTE pushes the position row of a fill before its execution. The change a row brings beyond the
+# executions seen so far is left pending, and the executions that follow are matched against it
+# instead of being counted again (see Inventory). An execution that comes first is counted, and its
+# row then changes nothing. A change no execution explains within Inventory.MATCH_WINDOW seconds
+# means we missed one, and is counted as drift. Executions in a partial happened before it and are
+# already in the positions, so only inserted executions are applied.
+class InventoryTracker(object):
+
+    # Fields of execution rows holding the filled size and price. The first one present is used.
+    FILL_QTY_FIELDS = ('exec_qty', 'fill_qty', 'qty')
+    FILL_PRICE_FIELDS = ('exec_price', 'fill_price', 'price')
+
+    # Fields of position rows holding the average entry price, if any.
+    ENTRY_FIELDS = ('avg_entry_price', 'avg_price', 'entry_price')
+
+    def __init__(self):
+        self.drift = 0              # Position changes no execution explained
+        self._inventories = {}      # symbol -> Inventory
+        self._lock = threading.Lock()
+
+    #
+    # Reads
+    #
+    def get(self, symbol):
+        '''Return a copy of a symbol's inventory (flat if we never had a position).'''
+        with self._lock:
+            inventory = self._inventories.get(symbol)
+            return inventory.copy() if inventory is not None else Inventory(symbol)
+
+    def copy(self):
+        '''Return copies of every symbol's inventory, by symbol.'''
+        with self._lock:
+            return dict((symbol, inventory.copy()) for symbol, inventory in self._inventories.items())
+
+    def net_qty(self, symbol):
+        with self._lock:
+            inventory = self._inventories.get(symbol)
+            return inventory.net_qty if inventory is not None else 0
+
+    #
+    # Websocket events
+    #
+    def apply_positions(self, action, rows, symbol=None):
+        '''Apply a position frame. A partial is the whole position of the symbols it covers
+        (`symbol` is the frame's symbol, for an empty partial): sides it leaves out are flat.'''
+        with self._lock:
+            now = monotonic()
+            if action == 'partial':
+                sides = set((row.get('symbol'), str(row.get('side'))) for row in rows)
+                symbols = set(s for s, side in sides if s is not None)
+                if symbol is not None:
+                    symbols.add(symbol)
+                for s in symbols:
+                    for side in ('1', '0'):
+                        if (s, side) not in sides:
+                            self.__inventory(s).set_qty(side, 0, partial=True)
+            for row in rows:
+                if 'symbol' not in row or 'side' not in row:
+                    continue
+                if action == 'delete':
+                    qty = 0
+                elif 'qty' in row:
+                    qty = int(float(row['qty']))
+                else:
+                    continue  # An update that doesn't touch the size
+                entry = _first(row, InventoryTracker.ENTRY_FIELDS)
+                inventory = self.__inventory(row['symbol'])
+                if inventory.set_qty(str(row['side']), qty, float(entry) if entry is not None else None, now,
+                                     partial=action == 'partial'):
+                    self.drift += 1
+
+    def apply_executions(self, rows):
+        '''Apply inserted execution rows, one fill each.'''
+        with self._lock:
+            now = monotonic()
+            for row in rows:
+                qty = _first(row, InventoryTracker.FILL_QTY_FIELDS)
+                price = _first(row, InventoryTracker.FILL_PRICE_FIELDS)
+                if 'symbol' not in row or 'side' not in row or qty is None or price is None:
+                    continue
+                if self.__inventory(row['symbol']).fill(str(row['side']), int(float(qty)), float(price),
+                                                        str(row.get('close_flag') or 0) == '1', now):
+                    self.drift += 1
+
+    #
+    # Private methods
+    #
+    def __inventory(self, symbol):
+        inventory = self._inventories.get(symbol)
+        if inventory is None:
+            inventory = self._inventories[symbol] = Inventory(symbol)
+        return inventory
+
+    def __repr__(self):
+        return 'InventoryTracker(%s)' % ', '.join(repr(i) for i in self._inventories.values())
+
+
+def _first(row, fields):
+    for field in fields:
+        if row.get(field) is not None:
+            return row[field]
+    return None
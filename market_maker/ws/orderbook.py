@@ -0,0 +1,208 @@
+from bisect import bisect_left, bisect_right, insort
+
+
+# Incremental L2 order book, kept up to date from the `order_book` websocket table.
+#
+# Each side keeps its price levels in a sorted list (for ordering) plus a dict of price -> size
+# (for lookups). Levels are sorted so the best price is at the END of the list: most activity
+# happens near the touch, and inserting/removing near the end of a Python list is cheap.
+#
+#   best bid / ask      O(1)
+#   size at a price     O(1)
+#   rank of a price     O(log n)
+#   top N levels        O(1) to create, a live view with no copying
+
+# GTE sends side '1' for buys and '0' for sells. BitMEX-style names are accepted as well.
+BID_SIDES = ('1', 1, 'Buy', 'buy')
+
+
+class DepthView(object):
+    '''Read-only view of the best `depth` levels of a BookSide, best first. Items are (price, size).
+
+    The view does not copy anything; it reads the side it was created from, so it reflects
+    updates applied after it was created.
+    '''
+
+    def __init__(self, side, depth):
+        self._side = side
+        self._depth = depth
+
+    def __len__(self):
+        n = len(self._side._keys)
+        return n if self._depth is None else min(n, self._depth)
+
+    def __getitem__(self, i):
+        n = len(self)
+        if i < 0:
+            i += n
+        if not 0 <= i < n:
+            raise IndexError('depth index out of range')
+        price = self._side._price(self._side._keys[-1 - i])
+        return price, self._side._sizes[price]
+
+    def __iter__(self):
+        side = self._side
+        keys = side._keys
+        sizes = side._sizes
+        for i in range(len(self)):
+            price = side._price(keys[-1 - i])
+            yield price, sizes[price]
+
+    def __repr__(self):
+        return 'DepthView(%r)' % list(self)
+
+
+class BookSide(object):
+    '''One side of the book: price levels and the aggregated size resting at each.'''
+
+    def __init__(self, is_bid):
+        self.is_bid = is_bid
+        # Sort keys, ascending. Bids are keyed on price and asks on -price so that the best
+        # level of either side is always the last element.
+        self._keys = []
+        self._sizes = {}
+
+    def _key(self, price):
+        return price if self.is_bid else -price
+
+    _price = _key  # The mapping is its own inverse
+
+    def add(self, price, size):
+        '''Add `size` (which may be negative) to the level at `price`.'''
+        sizes = self._sizes
+        if price in sizes:
+            total = sizes[price] + size
+            if total > 0:
+                sizes[price] = total
+            else:
+                del sizes[price]
+                keys = self._keys
+                key = self._key(price)
+                # Fast path: the level being removed is the best one.
+                if keys[-1] == key:
+                    keys.pop()
+                else:
+                    del keys[bisect_left(keys, key)]
+        elif size > 0:
+            sizes[price] = size
+            key = self._key(price)
+            keys = self._keys
+            if not keys or keys[-1] < key:
+                keys.append(key)
+            else:
+                insort(keys, key)
+
+    def best(self):
+        '''Return (price, size) of the best level, or None if this side is empty.'''
+        if not self._keys:
+            return None
+        price = self._price(self._keys[-1])
+        return price, self._sizes[price]
+
+    def size(self, price):
+        '''Size resting at `price`, 0 if there is no such level.'''
+        return self._sizes.get(price, 0)
+
+    def rank(self, price):
+        '''Number of levels strictly better than `price` (0 means `price` would be the best level).'''
+        return len(self._keys) - bisect_right(self._keys, self._key(price))
+
+    def top(self, depth=None):
+        '''Return a DepthView of the best `depth` levels (all levels if None).'''
+        return DepthView(self, depth)
+
+    def clear(self):
+        del self._keys[:]
+        self._sizes.clear()
+
+    def __len__(self):
+        return len(self._keys)
+
+
+class OrderBook(object):
+    '''L2 book for a single symbol, built from order_book partial/insert/update/delete rows.'''
+
+    def __init__(self, symbol):
+        self.symbol = symbol
+        self.bids = BookSide(True)
+        self.asks = BookSide(False)
+        # Rows by id, as (side, price, size), so updates and deletes that only carry the id
+        # can be resolved to a level.
+        self._rows = {}
+        # Bumped on every applied frame. Lets readers cache values derived from the book.
+        self.version = 0
+
+    def apply(self, action, rows):
+        '''Apply one websocket frame to the book.'''
+        if action == 'partial':
+            self.clear()
+            self.__insert(rows)
+        elif action == 'insert':
+            self.__insert(rows)
+        elif action == 'update':
+            self.__update(rows)
+        elif action == 'delete':
+            self.__delete(rows)
+        else:
+            raise Exception("Unknown action: %s" % action)
+        self.version += 1
+
+    def best_bid(self):
+        return self.bids.best()
+
+    def best_ask(self):
+        return self.asks.best()
+
+    def level(self, side, price):
+        '''Size resting at `price` on `side` ('1'/'Buy' for bids, anything else for asks).'''
+        return (self.bids if side in BID_SIDES else self.asks).size(float(price))
+
+    def depth(self, depth=None):
+        '''Return the best `depth` levels of each side as zero-copy views.'''
+        return {'bids': self.bids.top(depth), 'asks': self.asks.top(depth)}
+
+    def clear(self):
+        self.bids.clear()
+        self.asks.clear()
+        self._rows.clear()
+
+    def __insert(self, rows):
+        book_rows = self._rows
+        for row in rows:
+            side = self.bids if row['side'] in BID_SIDES else self.asks
+            price = float(row['price'])
+            size = _size(row)
+            old = book_rows.get(row['id'])
+            if old is not None:
+                old[0].add(old[1], -old[2])
+            book_rows[row['id']] = (side, price, size)
+            side.add(price, size)
+
+    def __update(self, rows):
+        book_rows = self._rows
+        for row in rows:
+            old = book_rows.get(row['id'])
+            if old is None:
+                continue  # Could happen before the partial arrives
+            side, price, size = old
+            side.add(price, -size)
+            if 'side' in row:
+                side = self.bids if row['side'] in BID_SIDES else self.asks
+            if 'price' in row:
+                price = float(row['price'])
+            if 'qty' in row or 'size' in row:
+                size = _size(row)
+            book_rows[row['id']] = (side, price, size)
+            side.add(price, size)
+
+    def __delete(self, rows):
+        book_rows = self._rows
+        for row in rows:
+            old = book_rows.pop(row['id'], None)
+            if old is not None:
+                old[0].add(old[1], -old[2])
+
+
+def _size(row):
+    '''Row size. GTE uses `qty`; BitMEX-style rows use `size`.'''
+    return float(row['qty'] if 'qty' in row else row['size'])
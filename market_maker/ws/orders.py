@@ -0,0 +1,228 @@
+import threading
+from collections import deque
+
+
+# Local state of our own orders, so the order manager doesn't have to ask the REST API for its
+# open orders every cycle.
+#
+# Orders are indexed by order_id and by client_oid. The websocket thread feeds it order frames
+# (inserts, updates, deletes) and execution frames; the REST connector tells it about orders it
+# placed or canceled as soon as the response is in, so a cycle never sees an order twice or
+# misses one that is waiting for its websocket echo.
+#
+# The state is only known to be right after a reconcile(), which replaces it with the open orders
+# from REST. Until then - on startup, after a reconnect, and whenever an event shows the state
+# has drifted from the exchange (an update or execution for an order we don't know, a failed
+# cancel) - it is `stale`, and the connector reconciles before using it.
+#
+# Events that arrive while a reconcile is fetching from REST are newer than the REST view; the
+# orders they touched keep their local version.
+class OrderTracker(object):
+
+    # Order statuses of open orders. Any other status means filled or canceled. The API docs don't
+    # list GTE's status codes: '2' is open (the status the order query is filtered on to list open
+    # orders), '1' is taken to be an order accepted but not yet on the book. An order with an
+    # unknown open status would be dropped as done; it comes back with the next reconcile.
+    OPEN_STATUSES = ('1', '2')
+
+    # How many closed order ids to remember, so late events for them aren't taken as drift.
+    CLOSED_MEMORY = 1000
+
+    def __init__(self):
+        self.stale = True
+        self.reconciles = 0
+        self.drift = 0              # Times the state was found to have drifted from the exchange
+        self._orders = {}           # order_id -> order
+        self._by_client_oid = {}    # client_oid -> order
+        self._closed = set()
+        self._closed_order = deque()
+        self._touched = None        # order_ids changed while a reconcile is fetching, or None
+        self._epoch = 0             # Bumped on every invalidate()
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def is_done(order):
+        '''True if an order row is filled or canceled.'''
+        status = order.get('status')
+        if status is not None and str(status) not in OrderTracker.OPEN_STATUSES:
+            return True
+        qty = order.get('qty')
+        return qty is not None and float(order.get('filled_qty') or 0) >= float(qty)
+
+    #
+    # Reads
+    #
+    def open_orders(self, client_oid_prefix=None):
+        '''Return copies of our open orders, optionally only those whose client_oid has a prefix.'''
+        with self._lock:
+            orders = list(self._orders.values())
+        if client_oid_prefix is not None:
+            orders = [o for o in orders if str(o.get('client_oid') or '').startswith(client_oid_prefix)]
+        return [dict(o) for o in orders]
+
+    def get(self, order_id):
+        with self._lock:
+            order = self._orders.get(str(order_id))
+            return dict(order) if order is not None else None
+
+    def by_client_oid(self, client_oid):
+        with self._lock:
+            order = self._by_client_oid.get(client_oid)
+            return dict(order) if order is not None else None
+
+    def __len__(self):
+        return len(self._orders)
+
+    #
+    # Websocket events
+    #
+    def apply(self, action, rows):
+        '''Apply an order frame.'''
+        with self._lock:
+            for row in rows:
+                if 'order_id' not in row:
+                    continue
+                order_id = str(row['order_id'])
+                self.__touch(order_id)
+                if action == 'delete':
+                    self.__close(order_id)
+                elif order_id in self._orders:
+                    self.__update(order_id, row)
+                elif order_id in self._closed:
+                    continue  # A late event for an order we already saw close
+                elif action == 'update' and 'price' not in row:
+                    # A partial update of an order we never saw.
+                    self.invalidate('update for unknown order %s' % order_id)
+                else:
+                    self.__update(order_id, row)
+
+    def apply_executions(self, rows):
+        '''Apply execution rows. Fills themselves arrive as order updates; an execution of an order
+        we don't know means we missed it.'''
+        with self._lock:
+            for row in rows:
+                order_id = row.get('order_id')
+                if order_id is None:
+                    continue
+                order_id = str(order_id)
+                if order_id not in self._orders and order_id not in self._closed:
+                    self.invalidate('execution of unknown order %s' % order_id)
+
+    #
+    # REST results
+    #
+    def placed(self, order, order_id):
+        '''Record an order we just placed, as sent, under the order_id the API returned.'''
+        with self._lock:
+            order_id = str(order_id)
+            self.__touch(order_id)
+            if order_id in self._closed:
+                return  # Filled or canceled before the response came back
+            row = dict(order, order_id=order_id)
+            tracked = self._orders.get(order_id)
+            if tracked is not None:
+                # Its websocket ack or fill came first and is newer than what we sent: only add
+                # the fields it lacks.
+                row = dict((k, v) for k, v in row.items() if k not in tracked)
+            else:
+                row.setdefault('filled_qty', 0)
+            self.__update(order_id, row)
+
+    def canceled(self, order_ids):
+        '''Drop orders we just canceled.'''
+        with self._lock:
+            for order_id in order_ids:
+                order_id = str(order_id)
+                self.__touch(order_id)
+                self.__close(order_id)
+
+    #
+    # Reconciliation
+    #
+    def invalidate(self, reason=None):
+        '''Mark the state as possibly wrong, so it is reconciled before it's used again.'''
+        with self._lock:
+            if reason is not None and not self.stale:
+                self.drift += 1
+            self.stale = True
+            self._epoch += 1
+
+    def begin_reconcile(self):
+        '''Start recording changes before fetching the open orders from REST. Returns a token
+        for reconcile().'''
+        with self._lock:
+            self._touched = set()
+            return self._epoch
+
+    def reconcile(self, rows, token, symbols=None):
+        '''Replace the state with the open orders from REST, keeping the local version of orders
+        that changed since begin_reconcile(). `symbols` are the symbols the REST listing covered
+        (None: all); our orders in other symbols are left as they are. Returns how many orders were
+        added, removed and changed, which should all be 0 if nothing drifted.'''
+        with self._lock:
+            touched = self._touched or set()
+            self._touched = None
+            remote = dict((str(row['order_id']), row) for row in rows)
+            added = removed = changed = 0
+            for order_id, order in list(self._orders.items()):
+                if symbols is not None and order.get('symbol') is not None and order['symbol'] not in symbols:
+                    continue  # Not listed
+                if order_id not in remote and order_id not in touched:
+                    self.__close(order_id)
+                    removed += 1
+            for order_id, row in remote.items():
+                if order_id in touched:
+                    continue
+                local = self._orders.get(order_id)
+                if local is None:
+                    added += 1
+                elif any(str(local.get(k)) != str(row.get(k)) for k in ('price', 'qty', 'filled_qty')):
+                    changed += 1
+                if local is not None or not self.is_done(row):
+                    self.__reopen(order_id)
+                    self.__update(order_id, row)
+            self.reconciles += 1
+            # A reconnect or drift during the fetch needs another round.
+            self.stale = token != self._epoch
+            return {'added': added, 'removed': removed, 'changed': changed}
+
+    #
+    # Private methods
+    #
+    def __touch(self, order_id):
+        if self._touched is not None:
+            self._touched.add(order_id)
+
+    def __update(self, order_id, row):
+        order = self._orders.get(order_id)
+        if order is None:
+            order = self._orders[order_id] = {}
+        old_client_oid = order.get('client_oid')
+        order.update(row)
+        order['order_id'] = order_id
+        client_oid = order.get('client_oid')
+        if old_client_oid is not None and old_client_oid != client_oid:
+            self._by_client_oid.pop(old_client_oid, None)
+        if client_oid:
+            self._by_client_oid[client_oid] = order
+        if self.is_done(order):
+            self.__close(order_id)
+
+    def __close(self, order_id):
+        order = self._orders.pop(order_id, None)
+        if order is not None and order.get('client_oid'):
+            self._by_client_oid.pop(order['client_oid'], None)
+        if order_id not in self._closed:
+            self._closed.add(order_id)
+            self._closed_order.append(order_id)
+            if len(self._closed_order) > OrderTracker.CLOSED_MEMORY:
+                self._closed.discard(self._closed_order.popleft())
+
+    def __reopen(self, order_id):
+        '''Forget that an order closed, so a later close of it is remembered afresh.'''
+        if order_id in self._closed:
+            self._closed.discard(order_id)
+            self._closed_order.remove(order_id)
+
+    def __repr__(self):
+        return 'OrderTracker(%d open%s)' % (len(self._orders), ', stale' if self.stale else '')
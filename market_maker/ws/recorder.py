@@ -0,0 +1,141 @@
+import gzip
+import logging
+import os
+import threading
+import time
+import zlib
+from collections import deque
+from glob import glob
+from itertools import groupby
+
+
+# Records raw websocket frames to disk and plays them back.
+#
+# Each frame is stored with the monotonic time (ns) it was received at, one per line:
+#
+#   <monotonic_ns>\t<raw frame>\n
+#
+# Frames go to gzip files of at most FRAMES_PER_CHUNK frames each, named
+# frames-<session start>-<chunk number>.log.gz. A chunk is only a complete gzip file once it is
+# rotated or the recorder is closed, but the writer flushes the compressed stream to disk every
+# FLUSH_INTERVAL seconds, so a session that dies loses at most the frames of the last interval.
+# Its last chunk is left truncated; FrameReplayer reads it up to where it ends.
+#
+# record() just appends to a deque; compression and disk writes happen on a background thread.
+class FrameRecorder(object):
+
+    FRAMES_PER_CHUNK = 100000
+
+    # How often the writer thread wakes up to drain the buffer and flush it to disk, in seconds.
+    FLUSH_INTERVAL = 0.5
+
+    def __init__(self, directory):
+        self.logger = logging.getLogger('root')
+        self.directory = directory
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.session = time.strftime('%Y%m%d-%H%M%S')
+        self.frames = 0
+        self._buffer = deque()
+        self._file = None
+        self._chunk = 0
+        self._closed = threading.Event()
+        self._writer = threading.Thread(target=self.__write_loop)
+        self._writer.daemon = True
+        self._writer.start()
+
+    def record(self, raw):
+        '''Record one raw frame (str or bytes). Safe to call from the websocket thread.'''
+        self._buffer.append((time.monotonic_ns(), raw))
+
+    def close(self):
+        '''Write out everything recorded so far and stop the writer thread.'''
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        self._writer.join()
+
+    def __write_loop(self):
+        while not self._closed.wait(FrameRecorder.FLUSH_INTERVAL):
+            self.__drain()
+        self.__drain()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __drain(self):
+        buffer = self._buffer
+        if not buffer:
+            return
+        while buffer:
+            ts, raw = buffer.popleft()
+            if isinstance(raw, (bytes, bytearray)):
+                raw = raw.decode('utf8')
+            if self._file is None or self.frames % FrameRecorder.FRAMES_PER_CHUNK == 0:
+                self.__rotate()
+            # JSON allows raw newlines only as whitespace between tokens.
+            self._file.write('%d\t%s\n' % (ts, raw.replace('\n', ' ')))
+            self.frames += 1
+        # A sync flush: everything written so far can be decompressed from the file as it is.
+        self._file.flush()
+
+    def __rotate(self):
+        if self._file is not None:
+            self._file.close()
+        self._chunk += 1
+        path = os.path.join(self.directory, 'frames-%s-%05d.log.gz' % (self.session, self._chunk))
+        self.logger.info("Recording websocket frames to %s" % path)
+        self._file = gzip.open(path, 'wt', encoding='utf8')
+
+
+class FrameReplayer(object):
+    '''Replays frames written by FrameRecorder into a GTEWebsocket (or anything with _handle_message).
+
+    `source` is a chunk file, or a directory (all chunks in it are played in name order, one
+    session after the other).
+    '''
+
+    def __init__(self, source):
+        self.logger = logging.getLogger('root')
+        if os.path.isdir(source):
+            self.paths = sorted(glob(os.path.join(source, 'frames-*.log.gz')))
+        else:
+            self.paths = [source]
+
+    def sessions(self):
+        '''Return the chunk paths of each recorded session, in order. Timestamps are only
+        comparable within a session.'''
+        session = lambda path: os.path.basename(path).rsplit('-', 1)[0]
+        return [list(paths) for name, paths in groupby(self.paths, session)]
+
+    def frames(self, paths=None):
+        '''Yield (monotonic_ns, raw) for every recorded frame, of all chunks or of `paths`. A
+        truncated chunk (the last one of a session that died) is read up to where it ends.'''
+        for path in paths or self.paths:
+            with gzip.open(path, 'rt', encoding='utf8') as f:
+                try:
+                    for line in f:
+                        if not line.endswith('\n'):
+                            break  # Cut off mid-frame
+                        ts, raw = line[:-1].split('\t', 1)
+                        yield int(ts), raw
+                except (EOFError, OSError, zlib.error) as e:
+                    self.logger.warning("%s is truncated, replayed up to where it ends: %s" % (path, e))
+
+    def replay(self, ws, speed=None):
+        '''Feed every frame to `ws`. With speed=None frames are fed as fast as possible; otherwise
+        the recorded gaps between frames are kept, divided by `speed` (1.0 is wall-clock speed).
+        Each session is paced from its own first frame. Returns the number of frames replayed.'''
+        count = 0
+        for paths in self.sessions():
+            start = first = None
+            for ts, raw in self.frames(paths):
+                if speed:
+                    if first is None:
+                        first, start = ts, time.monotonic()
+                    delay = (ts - first) / 1e9 / speed - (time.monotonic() - start)
+                    if delay > 0:
+                        time.sleep(delay)
+                ws._handle_message(raw)
+                count += 1
+        return count
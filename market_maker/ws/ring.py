@@ -0,0 +1,218 @@
+import threading
+from collections import deque
+from operator import itemgetter
+
+
+# A fixed-capacity ring buffer for append-only websocket tables (trades, executions).
+#
+# Appending is O(1) and never copies: once the ring is full each new row overwrites the oldest
+# one, so memory stays flat instead of growing to a limit and being cut in half.
+#
+# Rows are stored compactly, as tuples of their values in a fixed field order, not one dict per
+# row. Reads build a fresh dict for every row they return. The field order is learned from the
+# rows and grows if a row brings a new field; rows stored before that don't have it, later rows
+# without it read it as None.
+#
+# Iteration, len(), indexing and `+=` behave like the list the tables used to be. Rows are
+# always returned oldest first.
+#
+# With a partition field, reads of one value (symbol) walk an index of the append positions of
+# its rows, so they only touch that symbol's rows. The index is brought up to date by the reads
+# that use it, not by insert().
+class RingTable(object):
+
+    def __init__(self, capacity, partition=None, time_key='timestamp'):
+        self.capacity = capacity
+        self.partition_key = partition
+        self.time_key = time_key
+        self.fields = ()       # Field order of the stored tuples
+        self._values = _no_fields  # Row -> tuple of its values in field order; KeyError if it doesn't fit
+        self._slots = [None] * capacity
+        self._count = 0  # Rows appended since the last clear(); the next one goes to _count % capacity
+        self._writing = 0  # Set by insert() before it writes: the rows up to here may be in the slots
+        self._partitions = {}  # partition value -> (deque of the append positions of its rows, deque of the rows)
+        self._indexed = 0      # Rows appended before this position are in _partitions
+        self._index_lock = threading.Lock()  # Readers only: insert() never touches the index
+
+    def insert(self, rows):
+        '''Append rows, overwriting the oldest ones once the ring is full.'''
+        slots = self._slots
+        capacity = self.capacity
+        count = self._count
+        # Takes no lock: readers copying slots out check _writing afterwards. See __copy().
+        self._writing = count + len(rows)
+        values = self._values
+        size = len(self.fields)
+        for row in rows:
+            try:
+                if len(row) != size:
+                    raise KeyError
+                record = values(row)
+            except KeyError:
+                record = self.__record(row)
+                values = self._values
+                size = len(self.fields)
+            slots[count % capacity] = record
+            count += 1
+        self._count = count
+
+    def find(self, matchData):
+        '''Append-only: rows can't be looked up by key.'''
+        return None
+
+    def delete(self, matchData):
+        '''Append-only: rows can't be deleted by key.'''
+        return None
+
+    def last(self, count, value=None):
+        '''Return the newest `count` rows (whose partition field equals `value`, if given).'''
+        if count <= 0:
+            return []
+        if value is None:
+            return self.__rows(self.__copy(self._count - count)[1])
+        if self.partition_key is None:
+            return []
+        partition = self.__index().get(value)
+        if partition is None:
+            return []
+        return self.__rows(list(partition[1])[-count:])  # Copied in one step: other readers may be indexing
+
+    def since(self, timestamp, value=None):
+        '''Return the rows whose time_key is >= `timestamp` (and whose partition field equals
+        `value`, if given). Rows are assumed to arrive in time order.'''
+        fields = self.fields
+        if self.time_key not in fields:
+            return []
+        position = fields.index(self.time_key)
+        records = []
+        for record in self.__newest_first(value):
+            ts = record[position] if position < len(record) else None
+            if ts is None or ts < timestamp:
+                break
+            records.append(record)
+        records.reverse()
+        return self.__rows(records)
+
+    def partition(self, value):
+        '''Return the rows whose partition field equals `value`.'''
+        return self.last(self.capacity, value)
+
+    def clear(self):
+        self._count = self._writing = 0
+        self._slots = [None] * self.capacity
+        with self._index_lock:
+            self._partitions = {}
+            self._indexed = 0
+
+    def rows(self):
+        '''Return a list of the rows, as new dicts.'''
+        return self.__rows(self.__copy()[1])
+
+    #
+    # List compatibility
+    #
+    def __iadd__(self, rows):
+        self.insert(rows)
+        return self
+
+    def __iter__(self):
+        return iter(self.rows())
+
+    def __len__(self):
+        return min(self._count, self.capacity)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return self.rows()[i]
+        records = self.__copy()[1]
+        return dict(zip(self.fields, records[i]))
+
+    def __eq__(self, other):
+        if isinstance(other, RingTable):
+            other = other.rows()
+        return self.rows() == other
+
+    def __copy(self, first=0):
+        '''Copy the stored tuples of the rows appended from position `first` on out of the ring,
+        oldest first. Returns (the position of the first one copied, the tuples).'''
+        slots = self._slots  # Before _count: a clear() resets _count first
+        count = self._count
+        capacity = self.capacity
+        first = max(first, count - capacity, 0)
+        start = first % capacity
+        stop = start + count - first
+        if stop <= capacity:
+            records = slots[start:stop]
+        else:
+            records = slots[start:] + slots[:stop - capacity]
+        # An insert() running meanwhile may have overwritten the oldest of them: drop those.
+        stale = self._writing - capacity - first
+        if stale > 0:
+            del records[:stale]
+            first += stale
+        return first, records
+
+    def __rows(self, records):
+        # Fields only ever grow at the end, so every record zips with the current field order.
+        fields = self.fields
+        return [dict(zip(fields, record)) for record in records]
+
+    def __record(self, row):
+        '''Add any new fields of `row` to the field order, and return its tuple of values.'''
+        new = [k for k in row if k not in self.fields]
+        if new:
+            self.fields += tuple(new)
+            if len(self.fields) == 1:
+                value = itemgetter(self.fields[0])
+                self._values = lambda row: (value(row),)
+            else:
+                self._values = itemgetter(*self.fields)
+        return tuple([row.get(k) for k in self.fields])
+
+    def __newest_first(self, value=None):
+        '''Yield the stored tuples, newest first.'''
+        if value is None:
+            for record in reversed(self.__copy()[1]):
+                yield record
+            return
+        if self.partition_key is None:
+            return
+        partition = self.__index().get(value)
+        if partition is not None:
+            for record in reversed(list(partition[1])):
+                yield record
+
+    def __index(self):
+        '''Add the rows appended since the last read to the partition index, and return it.'''
+        with self._index_lock:
+            count = self._count
+            if self._indexed > count:
+                self._partitions, self._indexed = {}, 0  # Cleared since
+            fields = self.fields
+            capacity = self.capacity
+            first, records = self.__copy(self._indexed)
+            partitions = self._partitions
+            key = fields.index(self.partition_key) if self.partition_key in fields else None
+            for i, record in enumerate(records, first):
+                value = record[key] if key is not None and key < len(record) else None
+                partition = partitions.get(value)
+                if partition is None:
+                    partition = partitions[value] = (deque(maxlen=capacity), deque(maxlen=capacity))
+                partition[0].append(i)
+                partition[1].append(record)
+            self._indexed = first + len(records)
+            # Drop the rows overwritten since.
+            oldest = self._indexed - capacity
+            for positions, rows in partitions.values():
+                while positions and positions[0] < oldest:
+                    positions.popleft()
+                    rows.popleft()
+            return partitions
+
+    def __repr__(self):
+        return 'RingTable(capacity=%d, %r)' % (self.capacity, self.rows())
+
+
+def _no_fields(row):
+    raise KeyError('no fields yet')
+
@@ -0,0 +1,71 @@
+from market_maker.utils import errors
+from market_maker.ws.inventory import Inventory
+
+
+# A consistent, read-only copy of the websocket state, for one strategy cycle.
+#
+# GTEWebsocket.snapshot() copies the tables while the websocket thread keeps applying frames,
+# without a lock. Consistency comes from a generation counter (a seqlock): the websocket thread
+# makes it odd before applying a frame and even again once the frame is fully applied. A copy
+# taken while the counter was even and still the same afterwards saw no half-applied frame;
+# any other copy is thrown away and taken again. Ingest never waits for a reader.
+#
+# Rows are read-only mappings, so a snapshot can be shared freely and never changes.
+#
+# A snapshot taken during a reconnect is not `synced`: its tables may be empty or still partly
+# rebuilt, and looking up a missing instrument, ticker or book raises NotSyncedError.
+class Snapshot(object):
+
+    def __init__(self, generation, tables, instruments, tickers, books, inventories=None, synced=True):
+        self.generation = generation
+        self.synced = synced
+        self.tables = tables              # table name -> tuple of rows
+        self.instruments = instruments    # symbol -> instrument
+        self.tickers = tickers            # symbol -> ticker
+        self.books = books                # symbol -> {'bids': ((price, size), ...), 'asks': ...}, best first
+        self.inventories = inventories or {}  # symbol -> Inventory, our position
+
+    def get_instrument(self, symbol):
+        instrument = self.instruments.get(symbol)
+        if instrument is None:
+            self.__missing("instrument or index", symbol)
+        return instrument
+
+    def get_ticker(self, symbol):
+        ticker = self.tickers.get(symbol)
+        if ticker is None:
+            self.__missing("ticker", symbol)
+        return ticker
+
+    def market_depth(self, symbol):
+        if symbol not in self.books:
+            self.__missing("order book", symbol)
+        return self.books[symbol]
+
+    def __missing(self, what, symbol):
+        if not self.synced:
+            raise errors.NotSyncedError("No %s with symbol %s yet: reconnecting" % (what, symbol))
+        raise Exception("Unable to find %s with symbol: %s" % (what, symbol))
+
+    def rows(self, table):
+        '''Return the rows of a table, or () if it hasn't been received.'''
+        return self.tables.get(table, ())
+
+    def position(self, instrument_type, settle_currency, symbol):
+        return [p for p in self.rows('position') if p['symbol'] == symbol and
+                p['instrument_type'] == instrument_type and p['settle_currency'] == settle_currency]
+
+    def inventory(self, symbol):
+        '''Return our Inventory of a symbol: long, short and net size, entry prices and realized PnL.'''
+        inventory = self.inventories.get(symbol)
+        return inventory if inventory is not None else Inventory(symbol)
+
+    def orders(self, symbol=None):
+        return [o for o in self.rows('order') if symbol is None or o.get('symbol') == symbol]
+
+    def recent_trades(self, symbol=None):
+        return [t for t in self.rows('trade') if symbol is None or t['symbol'] == symbol]
+
+    def __repr__(self):
+        return 'Snapshot(generation=%d, %s)' % (self.generation, ', '.join(
+            '%s=%d' % (table, len(rows)) for table, rows in sorted(self.tables.items())))
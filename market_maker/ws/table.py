@@ -0,0 +1,143 @@
+from itertools import islice
+
+
+# A websocket table indexed by its primary key.
+#
+# Rows live in an insertion-ordered dict keyed on the tuple of the table's key fields, so
+# insert, update and delete are O(1) no matter how large the table gets. Tables without key
+# fields (e.g. trades) are append-only and get a running sequence number as their key.
+#
+# Tables can also be partitioned on a field (e.g. 'symbol'), so all rows of one symbol are a
+# direct lookup instead of a filter over every symbol's rows.
+#
+# Iteration, len(), indexing and `+=` behave like the plain list the tables used to be, so
+# callers reading `ws.data[table]` keep working.
+class KeyedTable(object):
+
+    def __init__(self, keys=None, partition=None):
+        self.keys = tuple(keys or ())
+        self.partition_key = partition
+        self._rows = {}
+        self._parts = {}
+        self._seq = 0
+
+    def key_of(self, row):
+        '''Return the primary key of a row (or of a partial row carrying the key fields).'''
+        if not self.keys:
+            return None
+        return tuple([row.get(k) for k in self.keys])
+
+    def insert(self, rows):
+        '''Insert rows. A row whose key is already present replaces the existing one.'''
+        index = self._rows
+        keys = self.keys
+        pk = self.partition_key
+        for row in rows:
+            if keys:
+                key = tuple([row.get(k) for k in keys])
+            else:
+                self._seq += 1
+                key = self._seq
+            if pk is not None:
+                old = index.get(key)
+                if old is not None:
+                    self.__unpartition(key, old)
+                self._parts.setdefault(row.get(pk), {})[key] = row
+            index[key] = row
+
+    def find(self, matchData):
+        '''Return the row with the same key as `matchData`, or None.'''
+        if not self.keys:
+            return None
+        return self._rows.get(self.key_of(matchData))
+
+    def update(self, matchData):
+        '''Merge `matchData` into the row with the same key. Returns the row, or None if not found.'''
+        item = self.find(matchData)
+        if item is not None:
+            item.update(matchData)
+        return item
+
+    def delete(self, matchData):
+        '''Remove the row with the same key as `matchData`. Returns the removed row, or None.'''
+        if not self.keys:
+            return None
+        key = self.key_of(matchData)
+        row = self._rows.pop(key, None)
+        if row is not None and self.partition_key is not None:
+            self.__unpartition(key, row)
+        return row
+
+    def remove(self, item):
+        '''list.remove() equivalent: remove a row previously returned from this table.'''
+        if self.keys:
+            key = self.key_of(item)
+            if self._rows.get(key) is not item:
+                key = None
+        else:
+            key = next((k for k, row in self._rows.items() if row is item), None)
+        if key is None:
+            raise ValueError('KeyedTable.remove(x): x not in table')
+        del self._rows[key]
+        if self.partition_key is not None:
+            self.__unpartition(key, item)
+
+    def drop_oldest(self, count):
+        '''Drop the `count` oldest rows.'''
+        for key in list(islice(self._rows, count)):
+            row = self._rows.pop(key)
+            if self.partition_key is not None:
+                self.__unpartition(key, row)
+
+    def partition(self, value):
+        '''Return the rows whose partition field equals `value`, in insertion order.'''
+        part = self._parts.get(value)
+        return list(part.values()) if part else []
+
+    def clear(self):
+        self._rows.clear()
+        self._parts.clear()
+
+    def rows(self):
+        '''Return a list copy of the rows, in insertion order.'''
+        return list(self._rows.values())
+
+    #
+    # List compatibility
+    #
+    def __iadd__(self, rows):
+        self.insert(rows)
+        return self
+
+    def __iter__(self):
+        return iter(self._rows.values())
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __contains__(self, item):
+        if self.keys:
+            return self._rows.get(self.key_of(item)) is item
+        return any(row is item for row in self._rows.values())
+
+    def __getitem__(self, i):
+        if i == 0 and self._rows:
+            return next(iter(self._rows.values()))
+        if i == -1 and self._rows:
+            return next(reversed(self._rows.values()))
+        return self.rows()[i]
+
+    def __eq__(self, other):
+        if isinstance(other, KeyedTable):
+            other = other.rows()
+        return self.rows() == other
+
+    def __unpartition(self, key, row):
+        part = self._parts.get(row.get(self.partition_key))
+        if part is not None:
+            part.pop(key, None)
+            if not part:
+                del self._parts[row.get(self.partition_key)]
+
+    def __repr__(self):
+        return 'KeyedTable(keys=%r, %r)' % (list(self.keys), self.rows())
@@ -0,0 +1,146 @@
+import asyncio
+import json
+import ssl
+
+from market_maker.ws.ws_thread import GTEWebsocket
+
+try:
+    from websockets.asyncio.client import connect as ws_connect  # websockets >= 13
+    HEADERS_KWARG = 'additional_headers'
+except ImportError:
+    try:
+        from websockets import connect as ws_connect
+        HEADERS_KWARG = 'extra_headers'
+    except ImportError:
+        ws_connect = None
+
+
+# Asyncio alternative to the threaded GTEWebsocket.
+#
+# Decoding, table updates and strategy callbacks all run on one event loop, so there is no second
+# thread mutating self.data while the strategy reads it. All the data methods of GTEWebsocket
+# (get_instrument, get_ticker, position, open_orders, recent_trades, market_depth...) work the same.
+#
+# A strategy can `await ws.next_update()` to wait for market events, or register a callback with
+# add_listener(). Callbacks are scheduled on the loop when a change is applied and run once the
+# frame is done, so they can read the tables and take snapshot(); coroutine callbacks are
+# scheduled as tasks.
+#
+# Requires the `websockets` package (pip install websockets).
+class GTEAsyncWebsocket(GTEWebsocket):
+
+    def __init__(self):
+        super(GTEAsyncWebsocket, self).__init__()
+        self.listeners = []
+        self._updated = asyncio.Event()
+        self._reader = None
+
+    async def connect(self, endpoint="", shouldAuth=True):
+        '''Connect to the websocket, subscribe and wait for the initial partials.'''
+        if ws_connect is None:
+            raise ImportError('GTEAsyncWebsocket requires the websockets package: pip install websockets')
+
+        self.shouldAuth = shouldAuth
+        self.logger.info("Connecting to %s" % self.ws_url)
+
+        headers = dict(h.split(':', 1) for h in self._get_auth())
+        kwargs = {HEADERS_KWARG: {k.strip(): v.strip() for k, v in headers.items()}}
+        if self.ws_url.startswith('wss'):
+            # Same as the threaded client: don't verify the certificate.
+            context = ssl.create_default_context()
+            context.check_hostname = False
+            context.verify_mode = ssl.CERT_NONE
+            kwargs['ssl'] = context
+        self.ws = await ws_connect(self.ws_url, **kwargs)
+        self._reader = asyncio.ensure_future(self.__read_loop())
+        self.logger.info('Connected to WS. Now to subscribe some sample data')
+
+        for args in self._market_subscriptions():
+            await self.send_command('sub', args)
+        symbols = [symbol for instrument_type, settle_currency, symbol in self.subscriptions]
+        await self.__wait_until(lambda: all(s in self.instruments and s in self.books for s in symbols))
+
+        if self.shouldAuth:
+            await self.send_command('auth_key_expires', self._auth_args())
+            for args in self._account_subscriptions():
+                await self.send_command('sub', args)
+            await self.__wait_until(lambda: {'position', 'order'} <= set(self.data))
+        self.connected = True
+        self.logger.info('Got sample market data. Starting.')
+
+    async def send_command(self, command, args=None):
+        '''Send a raw command.'''
+        await self.ws.send(json.dumps({"op": command, "args": args or ""}))
+
+    async def next_update(self, timeout=None):
+        '''Wait until a relevant table changes or `timeout` seconds pass.
+        Returns the set of tables that changed since the last call (empty on timeout).'''
+        if not self.updated_tables and not self.exited:
+            self._updated.clear()
+            try:
+                await asyncio.wait_for(self._updated.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        changed = self.updated_tables
+        self.updated_tables = set()
+        return changed
+
+    def wait_for_update(self, timeout=None):
+        raise RuntimeError('GTEAsyncWebsocket runs on an event loop; use `await next_update()` instead')
+
+    def add_listener(self, callback):
+        '''Call `callback(table)` whenever a relevant table changes.'''
+        self.listeners.append(callback)
+
+    def exit(self):
+        self.exited = True
+        if self._reader is not None and not self._reader.done():
+            self._reader.cancel()
+        self._updated.set()
+        if self.recorder is not None:
+            self.recorder.close()
+
+    async def close(self):
+        '''Exit and close the socket.'''
+        self.exit()
+        if self.ws is not None:
+            await self.ws.close()
+
+    #
+    # Private methods
+    #
+    def _notify_update(self, table):
+        self.updated_tables.add(table)
+        self._updated.set()
+        if self.listeners:
+            # Called while the frame is being applied (the write lock held, the generation odd):
+            # a listener calling snapshot() right here would spin forever.
+            asyncio.get_event_loop().call_soon(self.__call_listeners, table)
+
+    def __call_listeners(self, table):
+        for callback in self.listeners:
+            result = callback(table)
+            if asyncio.iscoroutine(result):
+                asyncio.ensure_future(result)
+
+    async def __read_loop(self):
+        try:
+            async for message in self.ws:
+                self._handle_message(message)
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            if not self.exited:
+                self.logger.exception('Websocket error: %s' % e)
+        finally:
+            self.logger.info('Websocket Closed')
+            self.exited = True
+            self.connected = False
+            self._updated.set()
+
+    async def __wait_until(self, predicate):
+        '''On subscribe, data will come down. Wait for it.'''
+        while not predicate():
+            if self.exited:
+                raise Exception("Websocket closed before the initial data arrived")
+            await asyncio.sleep(0.01)
@@ -3,15 +3,25 @@ import websocket
 import threading
 import traceback
 import ssl
-from time import sleep
+from time import sleep, monotonic
+from types import MappingProxyType
 import json
 import decimal
 import logging
 from market_maker.settings import settings
 from market_maker.auth.APIKeyAuth import generate_expires, generate_signature
 from market_maker.auth.APIKeyAuthWithExpires import *
+from market_maker.utils import errors
 from market_maker.utils.log import setup_custom_logger
-from market_maker.utils.math import toNearest
+from market_maker.utils.ticks import Ticks
+from market_maker.ws.decoder import FrameDecoder
+from market_maker.ws.inventory import InventoryTracker
+from market_maker.ws.orderbook import OrderBook
+from market_maker.ws.orders import OrderTracker
+from market_maker.ws.recorder import FrameRecorder
+from market_maker.ws.ring import RingTable
+from market_maker.ws.snapshot import Snapshot
+from market_maker.ws.table import KeyedTable
 from future.utils import iteritems
 from future.standard_library import hooks
 with hooks():  # Python 2/3 compat
@@ -31,19 +41,61 @@ class GTEWebsocket():
     # Don't grow a table larger than this amount. Helps cap memory usage.
     MAX_TABLE_LEN = 200
 
+    # Fields that uniquely identify a row of each table. Updates and deletes are matched on them.
+    # Tables not listed here are append-only. order_book is kept in self.books.
+    TABLE_KEYS = {
+        'instrument': ['settle_currency', 'asset_class', 'symbol'],
+        'order': ['order_id'],
+        'position': ['instrument_type', 'settle_currency', 'symbol', 'side'],
+    }
+
+    # Append-only tables kept in a fixed-size ring buffer. Their capacity is MAX_TABLE_LEN unless
+    # WS_TABLE_CAPACITY says otherwise.
+    RING_TABLES = ('trade', 'execution')
+
+    # Tables whose changes wake up a waiting order manager. order_book only wakes it when the
+    # top of the book moves.
+    WAKE_TABLES = ('order', 'position', 'execution')
+
+    # How long a reconnect may take to get all partials back before the attempt is abandoned.
+    RESYNC_TIMEOUT = 30
+
     def __init__(self):
         self.logger = logging.getLogger('root')
+        self._update_cond = threading.Condition()
+        self.__reconnect_lock = threading.Lock()
+        # Seqlock generation: odd while a frame is being applied. See snapshot(). Only bumped with
+        # _write_lock held, which every writer of the tables (the websocket thread applying frames,
+        # a reconnect resetting them) takes, so the two bumps of one write never interleave with
+        # another's and leave it odd.
+        self._generation = 0
+        self._write_lock = threading.Lock()
+        self.snapshot_retries = 0
+        # Held to fill or invalidate the ticker cache, so a ticker built from a book that is being
+        # changed is never cached after the change dropped the old one.
+        self._ticker_lock = threading.Lock()
+        # Our own orders, fed by the order and execution streams. Survives reconnects; reconciled
+        # over REST by the connector whenever it is stale.
+        self.orders = OrderTracker()
+        # Our position per symbol, fed by the position and execution streams.
+        self.inventory = InventoryTracker()
         self.__reset()
         self.data = {}  #客户端维护的数据结构，完全不是消息体的 raw 数据
         self.ws_url = settings.WS_URL
         self.keys = {}
+        # (instrument_type, settle_currency, symbol) of every instrument we stream, over one connection.
+        self.subscriptions = [tuple(s) for s in settings.get('SUBSCRIPTIONS') or
+                              [(settings.INSTRUMENTTYPE, settings.SETTLECURRENCY, settings.SYMBOL)]]
+        self.ws = None
+        # Optional on-disk log of every raw frame received, for replay with FrameReplayer.
+        self.recorder = FrameRecorder(settings.WS_RECORD_DIR) if settings.get('WS_RECORD_DIR') else None
+        # Fastest installed JSON parser; frames of WS_SKIP_TABLES are dropped before decoding.
+        self.decoder = FrameDecoder(settings.get('WS_SKIP_TABLES') or ())
 
 
     def __del__(self):
         self.exit()
 
-    # We run one symbol at a process. 
-    # So no need to cover multiple instrument type/assets/symbols
     def connect(self, endpoint="",  shouldAuth=True):
         '''Connect to the websocket and initialize data stores.'''
 
@@ -54,156 +106,172 @@ class GTEWebsocket():
         wsURL = self.ws_url
 
         self.logger.info("Connecting to %s" % wsURL)
-        self.__connect(wsURL)  # auth信息放在http header里面了
+        if not self.__connect(wsURL):  # auth信息放在http header里面了
+            self.logger.error("Couldn't connect to WS! Exiting.")
+            self.exit()
+            sys.exit(1)
         self.logger.info('Connected to WS. Now to subscribe some sample data')
 
-        # 我们约定单个进程不能跨货币区、跨品种；否则计算起来太麻烦
-        # 如果想多交易区、多品种交易，就运行多个进程。
-        sub_settle_currencys = 'BTC'
-        instrument_type = 'pc'
-        sub_symbols = ['BTC_USD']  #打算订阅/交易的品种
-
-
-        for symbol in sub_symbols:
-            args = {
-                "instrument_type":instrument_type,
-                "table":"instrument",
-                "settle_currency":sub_settle_currencys,
-                "symbol":symbol
-            }
-            self.__send_command('sub',args)
-            args = {
-                "instrument_type":instrument_type,
-                "table":"trade",
-                "settle_currency":sub_settle_currencys,
-                "symbol":symbol
-            } 
-            self.__send_command('sub',args)
-            args = {
-                "instrument_type":instrument_type,
-                "table":"order_book",
-                "settle_currency":sub_settle_currencys,
-                "symbol":symbol
-            } 
-            self.__send_command('sub',args)
-
-        # Connected. Wait for partials
-        # 确保收到第一条partial消息之后才完成初始化
-        self.__wait_for_symbol(symbol)
-
-        self.shouldAuth = True
-        if self.shouldAuth:
-            # ws 命令方式auth
-            expires = int(round(time.time()) + 60)*1000  # 60s grace period in case of clock skew
-            message = "GET/ws" + str(expires) 
-            signature = hmac.new(bytes(settings.API_SECRET, 'utf8'), bytes(message, 'utf8'), digestmod=hashlib.sha256).hexdigest()
-            args = { 
-                "api_key" : settings.API_KEY, 
-                "expires" : str(expires), 
-                "signature" : signature 
-                }
-            self.logger.info('expires：'+ str(expires))
-            self.logger.info('expmessage：'+ message)
-            self.logger.info('signature：'+ signature)
-            self.__send_command('auth_key_expires',args)
-            
-            # 订阅账户信息
-            args = {
-                "instrument_type":settings.INSTRUMENTTYPE,
-                "table":"order",
-                "settle_currency":settings.SETTLECURRENCY,
-                "symbol":settings.SYMBOL
-            }
-            self.__send_command('sub',args)
-            args = {
-                "instrument_type":settings.INSTRUMENTTYPE,
-                "table":"execution",
-                "settle_currency":settings.SETTLECURRENCY,
-                "symbol":settings.SYMBOL
-            } 
-            self.__send_command('sub',args)
-            args = {
-                "instrument_type":settings.INSTRUMENTTYPE,
-                "table":"position",
-                "settle_currency":settings.SETTLECURRENCY,
-                "symbol":settings.SYMBOL
-            } 
-            self.__send_command('sub',args)
-
-            self.__wait_for_account()
+        self.__subscribe()
         self.logger.info('Got sample market data. Starting.')
 
+    def reconnect_stats(self):
+        '''Return how many times we reconnected and how long the last reconnect took, in seconds
+        from the socket dropping to all tables being resynced.'''
+        return {
+            'connected': self.connected,
+            'reconnects': self.reconnects,
+            'last_reconnect_time': self.last_reconnect_time
+        }
+
     #
     # Data methods
     #
     def get_instrument(self, symbol):
-        #self.logger.info(list(self.data.keys()))
-        instruments = self.data['instrument']
-        #self.logger.info(instruments)
-        matchingInstruments = [i for i in instruments if i['symbol'] == symbol]
-        if len(matchingInstruments) == 0:
+        '''Return the instrument of a symbol. This is the live row, kept up to date by the instrument
+        stream, with derived fields (tickLog, tickSize, tickScale and the `ticks` price type) precomputed.'''
+        instrument = self.instruments.get(symbol)
+        if instrument is None:
+            if not self.connected:
+                raise errors.NotSyncedError("No instrument with symbol %s yet: reconnecting" % symbol)
             raise Exception("Unable to find instrument or index with symbol: " + symbol)
-        instrument = matchingInstruments[0]
-        # Turn the 'tickSize' into 'tickLog' for use in rounding
-        # http://stackoverflow.com/a/6190291/832202
-        instrument['tickLog'] = decimal.Decimal(str(instrument['tick_size'])).as_tuple().exponent * -1
         return instrument
 
     def get_ticker(self, symbol):
-        '''Return a ticker object. Generated from instrument.'''
-
+        '''Return a ticker object, built from the live order book.
+        It is cached until the next order_book or instrument delta, so reading it is cheap.'''
+        ticker = self.tickers.get(symbol)
+        if ticker is None:
+            with self._ticker_lock:
+                ticker = self.tickers[symbol] = self.__build_ticker(symbol)
+        return ticker
+
+    def __build_ticker(self, symbol):
         instrument = self.get_instrument(symbol)
 
         # If this is an index, we have to get the data from the last trade.
         if instrument['symbol'][0] == '.':
             ticker = {}
             ticker['mid'] = ticker['buy'] = ticker['sell'] = ticker['last'] = instrument['markPrice']
+            ticker['microprice'] = ticker['mid']
+            ticker['spread'] = 0
         # Normal instrument
         else:
-            # 我们先fake一点数据
-            bid = float(instrument['last_price']) - 5
-            ask = float(instrument['last_price']) + 2.5
-            '''
-            bid = instrument['bidPrice'] or instrument['last_price']
-            ask = instrument['askPrice'] or instrument['last_price']
-            '''
+            last = float(instrument['last_price'] or 0)
+            book = self.books.get(symbol)
+            best_bid = book.best_bid() if book else None
+            best_ask = book.best_ask() if book else None
+            # An empty side falls back to the last traded price.
+            bid, bid_size = best_bid or (last, 0)
+            ask, ask_size = best_ask or (last, 0)
+            # Microprice: mid weighted towards the side with less resting size.
+            if bid_size + ask_size > 0:
+                microprice = (bid * ask_size + ask * bid_size) / (bid_size + ask_size)
+            else:
+                microprice = (bid + ask) / 2
             ticker = {
-                "last": instrument['last_price'],
+                "last": last,
                 "buy": bid,
                 "sell": ask,
-                "mid": (bid + ask) / 2
+                "mid": (bid + ask) / 2,
+                "microprice": microprice,
+                "spread": ask - bid
             }
 
-        # The instrument has a tickSize. Use it to round values.
-        #return {k: toNearest(float(v or 0), instrument['tickSize']) for k, v in iteritems(ticker)}
-        return {k: toNearest(float(v or 0), 0.5) for k, v in iteritems(ticker)}
-        
+        # The instrument has a tick_size. Use it to round values.
+        ticks = instrument['ticks']
+        return {k: ticks.round(v or 0) for k, v in iteritems(ticker)}
+
+    def wait_for_update(self, timeout=None):
+        '''Block until a relevant table changes or `timeout` seconds pass.
+        Returns the set of tables that changed since the last call (empty on timeout).'''
+        with self._update_cond:
+            if not self.updated_tables:
+                self._update_cond.wait(timeout)
+            changed = self.updated_tables
+            self.updated_tables = set()
+        return changed
+
+    def snapshot(self, depth=25):
+        '''Return a consistent, read-only Snapshot of all tables, tickers and the best `depth` levels
+        of every book. Takes no lock: if a frame was applied while copying, the copy is retried.
+        A snapshot taken while reconnecting is not `synced`: its tables may be partly rebuilt.'''
+        while True:
+            synced = self.connected  # Read first: a reconnect drops it before resetting the tables
+            generation = self._generation
+            if generation % 2:
+                sleep(0)  # A frame is half-applied. Let the websocket thread finish it.
+                continue
+            try:
+                snapshot = self.__copy_state(generation, depth, synced)
+            except Exception:
+                # E.g. a table changed size under us. Only a real error if nothing was applied.
+                if self._generation == generation:
+                    raise
+                snapshot = None
+            if snapshot is not None and self._generation == generation:
+                return snapshot
+            self.snapshot_retries += 1
+
+    def __copy_state(self, generation, depth, synced):
+        tables = {}
+        for table, rows in list(self.data.items()):
+            if isinstance(rows, RingTable):
+                # rows() already builds new dicts from the stored tuples: wrap them without another copy.
+                tables[table] = tuple([MappingProxyType(row) for row in rows.rows()])
+            else:
+                tables[table] = tuple([MappingProxyType(dict(row)) for row in rows])
+        instruments = dict((symbol, MappingProxyType(dict(instrument)))
+                           for symbol, instrument in list(self.instruments.items()))
+        books = {}
+        for symbol, book in list(self.books.items()):
+            levels = book.depth(depth)
+            books[symbol] = {'bids': tuple(levels['bids']), 'asks': tuple(levels['asks'])}
+        # Built fresh rather than from the cache, which may be filled by other readers at any time.
+        # Without a book the ticker falls back to the last price, except while a reconnect is
+        # rebuilding the tables, when the book may just not be back yet.
+        tickers = dict((symbol, MappingProxyType(self.__build_ticker(symbol)))
+                       for symbol in instruments if synced or symbol in books)
+        return Snapshot(generation, tables, instruments, tickers, books, self.inventory.copy(), synced)
 
     def funds(self):
         return self.data['margin'][0]
 
-    def market_depth(self, symbol):
-        raise NotImplementedError('orderBook is not subscribed; use askPrice and bidPrice on instrument')
-        # return self.data['orderBook25'][0]
+    def order_book(self, symbol):
+        '''Return the live OrderBook for a symbol.'''
+        if symbol not in self.books:
+            if not self.connected:
+                raise errors.NotSyncedError("No order book with symbol %s yet: reconnecting" % symbol)
+            raise Exception("Unable to find order book with symbol: " + symbol)
+        return self.books[symbol]
+
+    def market_depth(self, symbol, depth=25):
+        '''Return the best `depth` levels of each side as {'bids': view, 'asks': view}, best first.
+        The views are live and read straight from the book; copy them if you need a snapshot.'''
+        return self.order_book(symbol).depth(depth)
 
     def open_orders(self, clOrdIDPrefix):
-        orders = self.data['order']
-        # Filter to only open orders (leavesQty > 0) and those that we actually placed
-        return [o for o in orders if str(o['clOrdID']).startswith(clOrdIDPrefix) and o['leavesQty'] > 0]
+        '''Return our open orders whose client_oid starts with the prefix, from the local order state.'''
+        return self.orders.open_orders(clOrdIDPrefix)
 
     # 返回指定结算区、指定工具类型、指定symbol的全部仓位
     # 返回结果是数组
     def position(self,instrument_type, settle_currency,symbol):
-        positions = self.data['position']
-        pos = [p for p in positions if p['instrument_type'] == instrument_type and p['settle_currency'] == settle_currency and p['symbol'] == symbol  ]
+        positions = self.data['position'].partition(symbol)
+        pos = [p for p in positions if p['instrument_type'] == instrument_type and p['settle_currency'] == settle_currency]
         if len(pos) == 0:
             # No position found; stub it
             #return {'avgCostPrice': 0, 'avgEntryPrice': 0, 'currentQty': 0, 'symbol': symbol}
             pass
         return pos
 
-    def recent_trades(self):
-        return self.data['trade']
+    def recent_trades(self, symbol=None, count=None, since=None):
+        '''Return trades, oldest first: all of them, the last `count`, or those with a timestamp
+        >= `since`. With a symbol, only that symbol's trades.'''
+        trades = self.data['trade']
+        if since is not None:
+            return trades.since(since, symbol)
+        return trades.last(count or trades.capacity, symbol)
 
     #
     # Lifecycle methods
@@ -215,12 +283,74 @@ class GTEWebsocket():
 
     def exit(self):
         self.exited = True
-        self.ws.close()
+        if self.ws is not None:
+            self.ws.close()
+        if self.recorder is not None:
+            self.recorder.close()
+        # Don't leave the order manager waiting on a dead connection.
+        with self._update_cond:
+            self._update_cond.notify_all()
 
     #
     # Private methods
     #
 
+    def __subscribe(self, timeout=None):
+        '''Subscribe to all tables, authenticating on the way, and wait for their partials.'''
+        for args in self._market_subscriptions():
+            self.__send_command('sub', args)
+
+        # Connected. Wait for partials
+        # 确保收到第一条partial消息之后才完成初始化
+        for instrument_type, settle_currency, symbol in self.subscriptions:
+            self.__wait_for_symbol(symbol, timeout)
+
+        self.shouldAuth = True
+        if self.shouldAuth:
+            # ws 命令方式auth
+            self.__send_command('auth_key_expires', self._auth_args())
+
+            # 订阅账户信息
+            for args in self._account_subscriptions():
+                self.__send_command('sub', args)
+
+            self.__wait_for_account(timeout)
+        self.connected = True
+
+    def _market_subscriptions(self):
+        '''Return the args of every public table subscription.'''
+        return [{
+            "instrument_type": instrument_type,
+            "table": table,
+            "settle_currency": settle_currency,
+            "symbol": symbol
+        } for instrument_type, settle_currency, symbol in self.subscriptions
+            for table in ('instrument', 'trade', 'order_book')]
+
+    def _account_subscriptions(self):
+        '''Return the args of every private (account) table subscription.'''
+        return [{
+            "instrument_type": instrument_type,
+            "table": table,
+            "settle_currency": settle_currency,
+            "symbol": symbol
+        } for instrument_type, settle_currency, symbol in self.subscriptions
+            for table in ('order', 'execution', 'position')]
+
+    def _auth_args(self):
+        '''Return the args of the auth_key_expires command.'''
+        expires = int(round(time.time()) + 60)*1000  # 60s grace period in case of clock skew
+        message = "GET/ws" + str(expires)
+        signature = hmac.new(bytes(settings.API_SECRET, 'utf8'), bytes(message, 'utf8'), digestmod=hashlib.sha256).hexdigest()
+        self.logger.info('expires：'+ str(expires))
+        self.logger.info('expmessage：'+ message)
+        self.logger.info('signature：'+ signature)
+        return {
+            "api_key": settings.API_KEY,
+            "expires": str(expires),
+            "signature": signature
+        }
+
     def __connect(self, wsURL):
         '''Connect to the websocket in a thread.'''
         self.logger.debug("Starting thread")
@@ -229,10 +359,10 @@ class GTEWebsocket():
         sslopt_ca_certs = {'ca_certs': ssl_defaults.cafile}
         self.ws = websocket.WebSocketApp(wsURL,
                                          on_message=self.__on_message,
-                                         on_close=self.__on_close,
+                                         on_close=lambda ws, *args: self.__on_close(ws),
                                          on_open=self.__on_open,
                                          on_error=self.__on_error,
-                                         header=self.__get_auth()
+                                         header=self._get_auth()
                                          )
 
         setup_custom_logger('websocket', log_level=settings.LOG_LEVEL)
@@ -243,17 +373,65 @@ class GTEWebsocket():
         self.logger.info("Started thread")
 
         # Wait for connect before continuing
-        conn_timeout = 5
-        while (not self.ws.sock or not self.ws.sock.connected) and conn_timeout and not self._error:
-            sleep(1)
-            conn_timeout -= 1
+        deadline = monotonic() + 5
+        while (not self.ws.sock or not self.ws.sock.connected) and not self._error:
+            if monotonic() > deadline:
+                return False
+            sleep(0.05)
+
+        return not self._error
+
+    def __reconnect(self):
+        '''Reconnect with exponential backoff, replay the subscriptions and rebuild every table
+        from fresh partials. Runs in its own thread; gives up (and exits) after
+        WS_RECONNECT_ATTEMPTS failed attempts.'''
+        disconnected_at = monotonic()
+        # Order events are lost while we're away.
+        self.orders.invalidate('websocket reconnect')
+        attempts = settings.get('WS_RECONNECT_ATTEMPTS', 10)
+        delay = settings.get('WS_RECONNECT_BACKOFF', 1)
+        for attempt in range(1, attempts + 1):
+            if self.exited:
+                return
+            self.logger.warning("Reconnecting to %s (attempt %d/%d)." % (self.ws_url, attempt, attempts))
+            self.__reset_tables()
+            self._error = None
+            try:
+                if not self.__connect(self.ws_url):
+                    raise Exception("Couldn't connect to WS")
+                self.__subscribe(GTEWebsocket.RESYNC_TIMEOUT)
+            except Exception as e:
+                self.logger.warning("Reconnect attempt failed: %s. Retrying in %.1fs." % (e, delay))
+                self.ws.close()
+                sleep(delay)
+                delay = min(delay * 2, settings.get('WS_RECONNECT_MAX_BACKOFF', 30))
+                continue
+
+            self.reconnects += 1
+            self.last_reconnect_time = monotonic() - disconnected_at
+            self.logger.info("Reconnected and resynced in %.2fs." % self.last_reconnect_time)
+            self.__reconnect_lock.release()
+            # Everything may have moved while we were away.
+            self._notify_update('reconnect')
+            return
 
-        if not conn_timeout or self._error:
-            self.logger.error("Couldn't connect to WS! Exiting.")
-            self.exit()
-            sys.exit(1)
+        self.logger.error("Unable to reconnect to WS after %d attempts. Exiting." % attempts)
+        self.__reconnect_lock.release()
+        self.exit()
 
-    def __get_auth(self):
+    def __reset_tables(self):
+        '''Drop all table data. Readers holding the old containers keep a consistent (stale) view.'''
+        with self._write_lock:
+            self._generation += 1
+            with self._ticker_lock:
+                self.data = {}
+                self.keys = {}
+                self.books = {}
+                self.tickers = {}
+                self.instruments = {}
+            self._generation += 1
+
+    def _get_auth(self):
         '''Return auth headers. Will use API Keys if present in settings.'''
 
         if self.shouldAuth is False:
@@ -269,29 +447,49 @@ class GTEWebsocket():
             "api-key:" + settings.API_KEY
         ]
 
-    def __wait_for_account(self):
+    def __wait_for_account(self, timeout=None):
         '''On subscribe, this data will come down. Wait for it.'''
         # Wait for the keys to show up from the ws
         # while not {'margin', 'position', 'order'} <= set(self.data):
-        while not { 'position', 'order'} <= set(self.data):   # 暂时没有'margin',
-            sleep(0.1)
+        self.__wait_until(lambda: {'position', 'order'} <= set(self.data), timeout)   # 暂时没有'margin',
 
-    def __wait_for_symbol(self, symbol):
+    def __wait_for_symbol(self, symbol, timeout=None):
         '''On subscribe, this data will come down. Wait for it.'''
-        while not {'instrument', 'order_book'} <= set(self.data):
-            sleep(0.1)
+        self.__wait_until(lambda: symbol in self.instruments and symbol in self.books, timeout)
+
+    def __wait_until(self, predicate, timeout=None):
+        deadline = None if timeout is None else monotonic() + timeout
+        while not predicate():
+            if deadline is not None and monotonic() > deadline:
+                raise Exception("Timed out waiting for partials")
+            sleep(0.05)
             
     # 需要 command   args 两个参数，后两个可以为空
     def __send_command(self, command, args=None):
         '''Send a raw command.'''
-        self.logger.debug(json.dumps({"op": command, "args": args or ""}))
-        self.ws.send(json.dumps({"op": command, "args": args or ""}))
+        command = json.dumps({"op": command, "args": args or ""})
+        self.logger.debug(command)
+        self.ws.send(command)
 
     def __on_message(self, message):
         '''Handler for parsing WS messages.'''
-        message = json.loads(message)
-        #self.logger.info(json.dumps(message))
-
+        self._handle_message(message)
+
+    def _handle_message(self, message):
+        '''Decode a raw WS message and apply it to the tables. Independent of the transport.'''
+        if self.recorder is not None:
+            self.recorder.record(message)
+        message = self.decoder.decode(message)
+        if message is None:
+            return
+        with self._write_lock:
+            self._generation += 1
+            try:
+                self.__apply_message(message)
+            finally:
+                self._generation += 1
+
+    def __apply_message(self, message):
         if 'status' in message:    # 是状态类消息
             if message['status'] == 400:
                 self.error(message['error'])
@@ -303,16 +501,22 @@ class GTEWebsocket():
             return
         elif 'data' in message:     # 是数据消息
             
-            table = message['table'] if 'table' in message else None  # 主题
-            action = message['action'] if 'action' in message else None
+            table = message.get('table')  # 主题
+            action = message.get('action')
             if not action:
-                self.logger.info(json.dumps(message))
+                self.logger.info('%s', message)
 
-            if table not in self.data:   # 例如 orderbookL2还没有
-                self.data[table] = []
+            if table == 'order_book':
+                self.__apply_book(action, message)
+                return
 
-            if table not in self.keys:
-                self.keys[table] = []
+            if table not in self.data:   # 例如 orderbookL2还没有
+                self.keys[table] = GTEWebsocket.TABLE_KEYS.get(table, [])
+                if table in GTEWebsocket.RING_TABLES:
+                    capacity = (settings.get('WS_TABLE_CAPACITY') or {}).get(table, GTEWebsocket.MAX_TABLE_LEN)
+                    self.data[table] = RingTable(capacity, partition='symbol')
+                else:
+                    self.data[table] = KeyedTable(self.keys[table], partition='symbol')
 
             # There are four possible actions from the WS:
             # 'partial' - full table image
@@ -320,93 +524,157 @@ class GTEWebsocket():
             # 'update'  - update row
             # 'delete'  - delete row
             if action == 'partial':
-                self.logger.debug("%s: partial" % table)
+                self.logger.debug("%s: partial", table)
                 self.data[table] += message['data']
 
-                # Keys are communicated on partials to let you know how to uniquely identify
-                # an item. We use it for updates.
-                #self.keys[table] = message['data']['keys']  # self.keys[table] 存贮每个主题唯一识别字段
-                # 现在我们手动赋值
-                self.keys['instument'] = ['settle_currency','asset_class','symbol']
-                self.keys['trade'] = ['settle_currency','asset_class','symbol']
-                self.keys['order_book'] = ['id']
+                # Keys are not communicated on partials; self.keys[table] comes from TABLE_KEYS.
 
             elif action == 'insert':
-                self.logger.debug('%s: inserting %s' % (table, message['data']))
+                self.logger.debug('%s: inserting %s', table, message['data'])
                 self.data[table] += message['data']
 
                 # Limit the max length of the table to avoid excessive memory usage.
-                # Don't trim orders because we'll lose valuable state if we do.
-                if table not in ['order_book'] and len(self.data[table]) > GTEWebsocket.MAX_TABLE_LEN:
-                    self.data[table] = self.data[table][(GTEWebsocket.MAX_TABLE_LEN // 2):]
+                # Ring tables are bounded already.
+                if table not in GTEWebsocket.RING_TABLES and len(self.data[table]) > GTEWebsocket.MAX_TABLE_LEN:
+                    self.data[table].drop_oldest(GTEWebsocket.MAX_TABLE_LEN // 2)
 
             elif action == 'update':
-                self.logger.debug('%s: updating %s' % (table, message['data']))
+                self.logger.debug('%s: updating %s', table, message['data'])
                 # Locate the item in the collection and update it.
                 for updateData in message['data']:
-                    item = findItemByKeys(self.keys[table], self.data[table], updateData)
+                    item = self.data[table].find(updateData)
                     if not item:
-                        self.logger.debug('updating data %s not found in %s' % ( updateData,table))
+                        self.logger.debug('updating data %s not found in %s', updateData, table)
                         continue  # No item found to update. Could happen before push
 
                     # Log executions
-                    if table == 'order':
-                        is_canceled = 'ordStatus' in updateData and updateData['ordStatus'] == 'Canceled'
-                        if 'cumQty' in updateData and not is_canceled:
-                            contExecuted = updateData['cumQty'] - item['cumQty']
-                            if contExecuted > 0:
-                                instrument = self.get_instrument(item['symbol'])
-                                self.logger.info("Execution: %s %d Contracts of %s at %.*f" %
-                                            (item['side'], contExecuted, item['symbol'],
-                                            instrument['tickLog'], item['price']))
+                    if table == 'order' and 'filled_qty' in updateData:
+                        contExecuted = float(updateData['filled_qty']) - float(item.get('filled_qty') or 0)
+                        if contExecuted > 0:
+                            instrument = self.get_instrument(item['symbol'])
+                            self.logger.info("Execution: %s %g Contracts of %s at %.*f" %
+                                        (item['side'], contExecuted, item['symbol'],
+                                        instrument['tickLog'], float(item['price'])))
 
                     # Update this item.
                     item.update(updateData)
 
                     # Remove canceled / filled orders
-                    if table == 'order' and item['leavesQty'] <= 0:
+                    if table == 'order' and OrderTracker.is_done(item):
                         self.data[table].remove(item)
 
             elif action == 'delete':
-                self.logger.debug('%s: deleting %s' % (table, message['data']))
+                self.logger.debug('%s: deleting %s', table, message['data'])
                 # Locate the item in the collection and remove it.
                 for deleteData in message['data']:
-                    item = findItemByKeys(self.keys[table], self.data[table], deleteData)
-                    self.data[table].remove(item)
+                    if self.data[table].delete(deleteData) is None:
+                        self.logger.debug('deleting data %s not found in %s', deleteData, table)
             else:
                 raise Exception("Unknown action: %s" % action)
 
+            if table == 'instrument':
+                self.__refresh_instruments(message['data'])
+            elif table == 'order':
+                self.orders.apply(action, message['data'])
+            elif table == 'position':
+                self.inventory.apply_positions(action, message['data'], message.get('symbol'))
+            elif table == 'execution' and action == 'insert':
+                self.orders.apply_executions(message['data'])
+                self.inventory.apply_executions(message['data'])
+
+            if table in GTEWebsocket.WAKE_TABLES:
+                self._notify_update(table)
+
+
+    def __refresh_instruments(self, rows):
+        '''Point the instrument cache at the current rows of the symbols in an instrument frame and
+        recompute their derived fields when the tick size changed.'''
+        instruments = self.data['instrument']
+        for row in rows:
+            symbol = row.get('symbol')
+            matching = instruments.partition(symbol)
+            if not matching:
+                self.instruments.pop(symbol, None)
+                self.__drop_ticker(symbol)
+                continue
+            instrument = matching[0]
+            if 'tick_size' in row or 'tickLog' not in instrument:
+                # Turn the 'tick_size' into 'tickLog' for use in rounding
+                # http://stackoverflow.com/a/6190291/832202
+                instrument['tickLog'] = decimal.Decimal(str(instrument['tick_size'])).as_tuple().exponent * -1
+                instrument['tickSize'] = float(instrument['tick_size'])
+                # Fixed-point prices, in whole ticks
+                instrument['ticks'] = Ticks(instrument['tick_size'])
+                # Prices times tickScale are whole numbers
+                instrument['tickScale'] = instrument['ticks'].scale
+            self.instruments[symbol] = instrument
+            self.__drop_ticker(symbol)
+
+    def __apply_book(self, action, message):
+        '''Apply an order_book frame to the per-symbol L2 books.'''
+        self.logger.debug('order_book: %s %s', action, message['data'])
+        rows = message['data']
+        default = message.get('symbol')
+        symbol = rows[0].get('symbol', default) if rows else default
+        if all(row.get('symbol', default) == symbol for row in rows):
+            # Almost every frame is for a single symbol: apply it as is, without regrouping.
+            rows_by_symbol = {symbol: rows} if symbol is not None else {}
+        else:
+            rows_by_symbol = {}
+            for row in rows:
+                rows_by_symbol.setdefault(row.get('symbol', default), []).append(row)
+        for symbol, rows in iteritems(rows_by_symbol):
+            if symbol not in self.books:
+                self.books[symbol] = OrderBook(symbol)
+            book = self.books[symbol]
+            touch = (book.best_bid(), book.best_ask())
+            book.apply(action, rows)
+            self.__drop_ticker(symbol)
+            if (book.best_bid(), book.best_ask()) != touch:
+                self._notify_update('order_book')
+
+    def __drop_ticker(self, symbol):
+        '''Invalidate a symbol's cached ticker after its book or instrument changed.'''
+        with self._ticker_lock:
+            self.tickers.pop(symbol, None)
+
+    def _notify_update(self, table):
+        '''Wake up anyone blocked in wait_for_update().'''
+        with self._update_cond:
+            self.updated_tables.add(table)
+            self._update_cond.notify_all()
 
     def __on_open(self):
         self.logger.info("Websocket Opened.")
         
 
-    def __on_close(self):
+    def __on_close(self, ws):
         self.logger.info('Websocket Closed')
-        self.exit()
+        if self.exited or ws is not self.ws:
+            return  # Shutting down, or a socket we already replaced
+        self.connected = False
+        if settings.get('WS_RECONNECT_ATTEMPTS', 10) <= 0:
+            self.exit()
+        elif self.__reconnect_lock.acquire(False):
+            reconnect = threading.Thread(target=self.__reconnect)
+            reconnect.daemon = True
+            reconnect.start()
 
-    def __on_error(self, ws, error):
+    def __on_error(self, error):
+        # A dropped connection is followed by __on_close, which reconnects.
         if not self.exited:
-            self.error(error)
+            self._error = error
+            self.logger.error(error)
 
     def __reset(self):
-        self.data = {}
-        self.keys = {}
+        self.__reset_tables()
+        self.updated_tables = set()
         self.exited = False
+        self.connected = False
+        self.reconnects = 0
+        self.last_reconnect_time = None
         self._error = None
 
-# keys:['symbol','id']
-# table: self.data['orderbook']  整个交易所所有的品种；
-# matchData: message['data']['rows']的一个item
-def findItemByKeys(keys, table, matchData):
-    for item in table:
-        matched = True
-        for key in keys:
-            if item[key] != matchData[key]:
-                matched = False
-        if matched:
-            return item
-
 if __name__ == "__main__":
     # create console handler and set level to debug
     logger = logging.getLogger()
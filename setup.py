@@ -19,7 +19,8 @@ setup(name='gte-market-maker',
       install_requires=[
           'requests',
           'websocket-client',
-          'future'
+          'future',
+          'numpy'
       ],
       packages=['market_maker', 'market_maker.auth', 'market_maker.utils', 'market_maker.ws'],
       entry_points={
@@ -0,0 +1,142 @@
+import numpy as np
+
+from market_maker.converge import Converger
+from market_maker.ladder import BUY, SELL, Ladder
+from market_maker.utils.ticks import Ticks
+
+###
+# converge-test.py
+#
+# Checks the plans Converger.plan() makes for a 3-level ladder a side, 1 tick = 0.5:
+#
+#   unchanged      - our orders are the ladder: nothing to do, and the next cycle skips both sides
+#   shifted        - the ladder moves within RELIST_INTERVAL: orders stay; beyond it: all relisted
+#   partial fill   - an order filled below RELIST_MIN_REMAINING of its level is canceled and placed
+#                    again at full size (or amended, with amend); a smaller fill is left alone
+#   extra orders   - two orders on one level: the one nearest the level stays, the other goes
+#   skip cache     - a side is only skipped while its levels and orders are what they were
+#
+# Run from a project directory with a settings.py: python test/converge-test.py
+###
+
+TICKS = Ticks('0.5')
+
+
+def ladder(buy, sell, sizes=(100, 200, 300)):
+    """Levels 10 ticks apart from buy / sell, in ticks."""
+    n = len(sizes)
+    return Ladder(TICKS, np.array([buy - 10 * i for i in range(n)], dtype=np.int64), np.array(sizes, dtype=np.int64),
+                  np.array([sell + 10 * i for i in range(n)], dtype=np.int64), np.array(sizes, dtype=np.int64))
+
+
+def orders_of(quotes, shift=0):
+    return [order('%s%d' % (side, tick), side, tick + shift, size) for side, tick, size in quotes.levels()]
+
+
+def order(order_id, side, tick, qty, filled_qty=0):
+    return {'order_id': order_id, 'side': side, 'price': TICKS.to_str(tick), 'qty': str(qty),
+            'filled_qty': str(filled_qty)}
+
+
+def ids(orders):
+    return sorted(o['order_id'] for o in orders)
+
+
+def check(name, plan, create=0, cancel=0, amend=0, kept=None):
+    print('%-28s %r' % (name, plan))
+    assert (len(plan.create), len(plan.cancel), len(plan.amend)) == (create, cancel, amend), plan
+    if kept is not None:
+        assert plan.kept == kept, plan
+
+
+def test_unchanged():
+    quotes = ladder(16000, 16002)
+    converger = Converger(0.01, min_remaining=0.5)
+    check('empty book', converger.plan(quotes, []), create=6)
+    live = orders_of(quotes)
+    check('unchanged', converger.plan(quotes, live), kept=6)
+    plan = converger.plan(quotes, live)
+    check('unchanged, skipped', plan, kept=6)
+    assert sorted(plan.skipped) == sorted([BUY, SELL])
+
+
+def test_shifted():
+    quotes = ladder(16000, 16002)
+    live = orders_of(quotes)
+    # 20 ticks = 10.0 on 8000, 0.125%.
+    check('shifted within 1%', Converger(0.01).plan(ladder(16020, 16022), live), kept=6)
+    # 400 ticks = 200.0, 2.5%.
+    plan = Converger(0.01).plan(ladder(16400, 16402), live)
+    check('shifted beyond 1%', plan, create=6, cancel=6, kept=0)
+    assert plan.create[0] == (BUY, 16400, 100), plan.create
+    check('shifted 1 tick, exact', Converger(0).plan(quotes, orders_of(quotes, 1)), create=6, cancel=6)
+
+
+def test_partial_fill():
+    quotes = ladder(16000, 16002)
+    live = orders_of(quotes)
+    live[0] = order('b0', BUY, 16000, 100, filled_qty=99)   # 1 of 100 left
+    live[1] = order('s0', SELL, 16002, 100, filled_qty=40)  # 60 of 100 left
+    converger = Converger(0.01, min_remaining=0.5)
+    plan = converger.plan(quotes, live)
+    check('partial fill', plan, create=1, cancel=1, kept=5)
+    assert ids(plan.cancel) == ['b0'] and plan.create == [(BUY, 16000, 100)]
+    # Nothing is cached while there's work to do: the next cycle sees the same fill again.
+    check('partial fill, next cycle', converger.plan(quotes, live), create=1, cancel=1, kept=5)
+
+    check('partial fill, threshold off', Converger(0.01).plan(quotes, live), kept=6)
+    plan = Converger(0.01, amend=True, min_remaining=0.5).plan(quotes, live)
+    check('partial fill, amend', plan, amend=2, kept=4)
+    assert sorted((o['order_id'], tick, size) for o, tick, size in plan.amend) == [
+        ('b0', 16000, 100), ('s0', 16002, 100)]
+
+
+def test_extra_orders():
+    quotes = ladder(16000, 16002)
+    live = orders_of(quotes) + [order('extra', BUY, 16001, 100), order('far', SELL, 17000, 100)]
+    plan = Converger(0.01).plan(quotes, live)
+    check('extra orders', plan, cancel=2, kept=6)
+    assert ids(plan.cancel) == ['extra', 'far']
+
+    # The order nearest the level is the one kept.
+    live = [order('near', BUY, 16000, 100), order('off', BUY, 16003, 100)]
+    plan = Converger(0.01).plan(ladder(16000, 16002, sizes=(100,)), live)
+    assert ids(plan.cancel) == ['off'] and plan.create == [(SELL, 16002, 100)], plan
+
+
+def test_skip_cache():
+    quotes = ladder(16000, 16002)
+    live = orders_of(quotes)
+    converger = Converger(0.01, min_remaining=0.5)
+    converger.plan(quotes, live)
+    assert converger.plan(quotes, live).skipped
+
+    # A fill on a buy: the buys are planned again, the sells still skipped.
+    filled = [dict(o) for o in live]
+    filled[0]['filled_qty'] = '10'
+    plan = converger.plan(quotes, filled)
+    check('skip cache, fill', plan, kept=6)
+    assert plan.skipped == [SELL]
+
+    # The ladder moves: nothing skipped.
+    plan = converger.plan(ladder(16400, 16402), filled)
+    assert plan.skipped == [] and len(plan.create) == 6
+
+    # A side that needed work isn't cached.
+    converger = Converger(0.01)
+    converger.plan(quotes, live[1:])
+    assert converger.plan(quotes, live[1:]).skipped == [SELL]
+    print('%-28s ok' % 'skip cache')
+
+
+def main():
+    test_unchanged()
+    test_shifted()
+    test_partial_fill()
+    test_extra_orders()
+    test_skip_cache()
+    print('ok')
+
+
+if __name__ == "__main__":
+    main()
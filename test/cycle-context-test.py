@@ -0,0 +1,168 @@
+import atexit
+import json
+import logging
+import time
+from urllib.parse import parse_qs, urlparse
+
+from market_maker.settings import settings
+from market_maker.utils import errors
+from market_maker.ws.ws_thread import GTEWebsocket
+from stub_exchange import StubHandler, feed, serve
+
+###
+# cycle-context-test.py
+#
+# Runs OrderManager cycles against a local stub exchange and checks how often each cycle reads
+# the exchange state and calls the REST API. Every cycle reads it exactly twice (one websocket
+# snapshot, and our orders from the local order state), and calls REST only to change orders or
+# to reconcile them:
+#
+#   startup      - reconcile our orders (1 GET), then create the ladder
+#   unchanged    - no REST calls at all
+#   book moved   - one cancel_batch for the old ladder, then create the new one
+#   reconnect    - the order state is stale: reconcile (1 GET), nothing else
+#
+# Then checks that cancel_all_orders() cancels our orders in every tracked symbol, each under its
+# own symbol, that a cycle on a symbol without a book still takes the ticker from the snapshot
+# (2 reads), and that a cycle started while a reconnect rebuilds the tables raises NotSyncedError
+# (so the loop skips it) until the symbol's instrument and book are back.
+#
+# The websocket is fed its tables directly instead of connecting. Run from a project directory
+# with a settings.py: python test/cycle-context-test.py
+###
+
+SYMBOL = 'BTC_USD'
+PAIRS = 3
+
+
+class StubExchange(StubHandler):
+    # Our open orders on the stub, and the requests it got, by path
+    orders = {}
+    requests = {}
+
+    def do_GET(self):
+        self.respond({'rows': list(self.orders.values())})
+
+    def do_POST(self):
+        query = dict((k, v[0]) for k, v in parse_qs(urlparse(self.path).query).items())
+        if self.path.startswith('/v1/api/pc/order/create'):
+            order_id = str(time.time())
+            self.orders[order_id] = dict(query, order_id=order_id, filled_qty='0', status='2')
+            self.respond({'order_id': order_id})
+        elif self.path.startswith('/v1/api/pc/order/cancel_batch'):
+            for order_id in json.loads(query['filter'])['order_id']:
+                if self.orders.get(order_id, {}).get('symbol') == query['symbol']:
+                    del self.orders[order_id]
+            self.respond(None)
+        else:
+            self.send_error(404)
+
+    def respond(self, data):
+        path = urlparse(self.path).path
+        StubExchange.requests[path] = StubExchange.requests.get(path, 0) + 1
+        self.reply({'code': 0, 'data': data})
+
+
+def book(mid):
+    rows = [{'id': i, 'symbol': SYMBOL, 'side': '1', 'price': mid - 0.5 - i, 'qty': 10} for i in range(10)]
+    rows += [{'id': 10 + i, 'symbol': SYMBOL, 'side': '0', 'price': mid + 0.5 + i, 'qty': 10} for i in range(10)]
+    return rows
+
+
+def connect(ws, *args, **kwargs):
+    feed(ws, 'instrument', 'partial', [{'symbol': SYMBOL, 'settle_currency': settings.SETTLECURRENCY,
+                                        'asset_class': settings.INSTRUMENTTYPE, 'tick_size': '0.5',
+                                        'last_price': '8000'}])
+    feed(ws, 'order_book', 'partial', book(8000))
+    feed(ws, 'position', 'partial', [
+        {'instrument_type': settings.INSTRUMENTTYPE, 'settle_currency': settings.SETTLECURRENCY, 'symbol': SYMBOL,
+         'side': '1', 'qty': '300'},
+        {'instrument_type': settings.INSTRUMENTTYPE, 'settle_currency': settings.SETTLECURRENCY, 'symbol': SYMBOL,
+         'side': '0', 'qty': '100'}])
+    feed(ws, 'order', 'partial', [])
+
+
+def check(name, ctx, rest_calls, requests):
+    requests_sent = sum(StubExchange.requests.values())
+    print('%-12s %6d %12d %16d' % (name, ctx.reads, ctx.rest_calls, requests_sent - requests))
+    assert ctx.reads == 2, ctx
+    assert ctx.rest_calls == rest_calls, ctx
+    assert requests_sent - requests == rest_calls
+    return requests_sent
+
+
+def main():
+    server, url = serve(StubExchange)
+    settings.update(API_URL_BASE=url, API_KEY='key', API_SECRET='secret', DRY_RUN=False,
+                    SYMBOL=SYMBOL, ORDER_PAIRS=PAIRS, INTERVAL=0.005, RELIST_INTERVAL=0.01, MIN_SPREAD=0.001,
+                    MAINTAIN_SPREADS=False, RANDOM_ORDER_SIZE=False, ORDER_START_SIZE=100, ORDER_STEP_SIZE=100,
+                    CHECK_POSITION_LIMITS=True, MIN_POSITION=-10000, MAX_POSITION=10000)
+    GTEWebsocket.connect = connect
+    GTEWebsocket.exit = lambda self: None
+    from market_maker.cycle import CycleContext
+    from market_maker.market_maker import OrderManager
+    logging.getLogger('root').setLevel(logging.WARNING)
+
+    print('%-12s %6s %12s %16s' % ('cycle', 'reads', 'REST calls', 'stub requests'))
+    om = OrderManager()  # Runs the first cycle
+    ws = om.exchange.gte.ws
+    requests = sum(StubExchange.requests.values())
+    assert requests == 1 + 2 * PAIRS, StubExchange.requests
+    assert len(StubExchange.orders) == 2 * PAIRS
+
+    ctx = om.run_cycle()
+    assert (ctx.long_qty, ctx.short_qty, ctx.net_qty) == (300, 100, 200), ctx
+    assert len(ctx.orders) == 2 * PAIRS
+    requests = check('unchanged', ctx, 0, requests)
+
+    feed(ws, 'order_book', 'partial', book(8400))
+    requests = check('book moved', om.run_cycle(), 1 + 2 * PAIRS, requests)
+    assert len(StubExchange.orders) == 2 * PAIRS
+
+    ws.orders.invalidate()
+    requests = check('reconnect', om.run_cycle(), 1, requests)
+
+    requests = check('unchanged', om.run_cycle(), 0, requests)
+
+    ws.subscriptions.append((settings.INSTRUMENTTYPE, settings.SETTLECURRENCY, 'ETH_USD'))
+    feed(ws, 'instrument', 'insert', [{'symbol': 'ETH_USD', 'settle_currency': settings.SETTLECURRENCY,
+                                       'asset_class': settings.INSTRUMENTTYPE, 'tick_size': '0.05',
+                                       'last_price': '200'}])
+    StubExchange.orders['eth'] = {'order_id': 'eth', 'symbol': 'ETH_USD', 'side': '1', 'price': '199.5', 'qty': '5',
+                                  'filled_qty': '0', 'status': '2'}
+    om.exchange.cancel_all_orders()
+    assert not StubExchange.orders, StubExchange.orders
+    print('cancel all ok')
+
+    # No book for the symbol: the snapshot's ticker falls back to the last price, still in 2 reads.
+    del ws.books[SYMBOL]
+    ctx = CycleContext.build(om.exchange).finish()
+    assert ctx.reads == 2, ctx
+    assert ctx.ticker['buy'] == ctx.ticker['sell'] == 8000, ctx.ticker
+    feed(ws, 'order_book', 'partial', book(8000))
+    print('no book ok')
+
+    # A reconnect drops the tables between the loop's is_synced() check and the cycle.
+    ws.connected = False
+    ws._GTEWebsocket__reset_tables()
+    for rebuilt in ('nothing', 'instrument'):
+        try:
+            om.run_cycle()
+        except errors.NotSyncedError:
+            pass
+        else:
+            raise AssertionError('cycle ran on %s rebuilt' % rebuilt)
+        feed(ws, 'instrument', 'partial', [{'symbol': SYMBOL, 'settle_currency': settings.SETTLECURRENCY,
+                                            'asset_class': settings.INSTRUMENTTYPE, 'tick_size': '0.5',
+                                            'last_price': '8000'}])
+    feed(ws, 'order_book', 'partial', book(8000))
+    om.run_cycle()
+    print('reconnect race ok')
+    print('ok')
+    atexit.unregister(om.exit)
+    om.exchange.gte.exit()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+import json
+import random
+import sys
+import time
+import tracemalloc
+
+from market_maker.ws.decoder import BACKENDS, FrameDecoder
+from market_maker.ws.recorder import FrameReplayer
+
+###
+# decoder-benchmark.py
+#
+# Decodes websocket frames with every installed JSON backend (stdlib json, and orjson / ujson
+# if they are installed) and reports, per backend:
+#
+#   msgs/s       - frames decoded per second
+#   allocs/msg   - memory blocks allocated per frame, from tracemalloc
+#   bytes/msg    - bytes allocated per frame, from tracemalloc
+#
+# 'skip trade' decodes the same frames with trade frames dropped after decoding, and 'scan trade'
+# with them dropped by a scan of the head of the raw frame before decoding, as FrameDecoder used
+# to do. The scan costs every frame it doesn't drop, so it only wins if most frames are dropped.
+#
+# Frames come from a FrameRecorder directory or chunk if one is given; otherwise a synthetic
+# session of order_book deltas and trades is generated.
+#
+#   python test/decoder-benchmark.py [recording]
+###
+
+SYMBOL = 'BTC_USD'
+FRAMES = 50000
+
+
+def synthetic_frames():
+    random.seed(1)
+    frames = []
+    for i in range(FRAMES):
+        if i % 10 == 0:
+            data = [{'symbol': SYMBOL, 'side': random.choice('01'), 'price': '%.1f' % (8000 + random.randint(-20, 20) / 2.),
+                     'qty': str(random.randint(1, 50)), 'timestamp': 1560000000000 + i, 'trade_id': str(i)}]
+            frames.append(json.dumps({'table': 'trade', 'action': 'insert', 'data': data}, separators=(',', ':')))
+        else:
+            data = [{'id': random.randint(1, 200), 'symbol': SYMBOL, 'side': random.choice('01'),
+                     'price': 8000 + random.randint(-100, 100) / 2., 'qty': random.randint(0, 500)}
+                    for _ in range(random.randint(1, 4))]
+            frames.append(json.dumps({'table': 'order_book', 'action': 'update', 'data': data}, separators=(',', ':')))
+    return frames
+
+
+class ScanDecoder(FrameDecoder):
+    """FrameDecoder with the old raw-frame scan: a skipped table is recognised from the
+    `"table":"<name>"` field in the first SCAN_CHARS characters, without decoding the frame."""
+
+    SCAN_CHARS = 64
+
+    def __init__(self, skip_tables=(), backend=None):
+        FrameDecoder.__init__(self, skip_tables, backend)
+        self._names = tuple('"%s"' % table for table in self.skip_tables)
+        self._byte_names = tuple(n.encode('utf8') for n in self._names)
+
+    def decode(self, raw):
+        if isinstance(raw, str):
+            i = raw.find('"table":', 0, self.SCAN_CHARS)
+            if i >= 0 and raw.startswith(self._names, i + 8):
+                return None
+        else:
+            i = raw.find(b'"table":', 0, self.SCAN_CHARS)
+            if i >= 0 and raw.startswith(self._byte_names, i + 8):
+                return None
+        return self.loads(raw)
+
+
+def measure(decoder, frames):
+    decode = decoder.decode
+    start = time.perf_counter()
+    for raw in frames:
+        decode(raw)
+    elapsed = time.perf_counter() - start
+
+    # Allocations: keep every decoded frame alive so nothing is freed and reused while tracing.
+    decoded = []
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    for raw in frames:
+        decoded.append(decode(raw))
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    stats = after.compare_to(before, 'filename')
+    blocks = sum(s.count_diff for s in stats)
+    size = sum(s.size_diff for s in stats)
+    return len(frames) / elapsed, float(blocks) / len(frames), float(size) / len(frames)
+
+
+def main():
+    if len(sys.argv) > 1:
+        frames = [raw for ts, raw in FrameReplayer(sys.argv[1]).frames()]
+    else:
+        frames = synthetic_frames()
+    print('%d frames' % len(frames))
+    if not frames:
+        return
+
+    print('%-18s %12s %12s %12s' % ('backend', 'msgs/s', 'allocs/msg', 'bytes/msg'))
+    for backend in sorted(BACKENDS):
+        for name, decoder in ((backend, FrameDecoder((), backend)),
+                              (backend + ' skip trade', FrameDecoder(('trade',), backend)),
+                              (backend + ' scan trade', ScanDecoder(('trade',), backend))):
+            print('%-18s %12.0f %12.1f %12.0f' % ((name,) + measure(decoder, frames)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+import json
+import time
+
+from market_maker.ws.inventory import Inventory
+from market_maker.ws.ws_thread import GTEWebsocket
+from stub_exchange import feed
+
+###
+# inventory-test.py
+#
+# Feeds position and execution frames to a GTEWebsocket and checks its InventoryTracker: long,
+# short and net size, average entry prices and realized PnL of GTE's two-sided positions, how
+# position rows correct the sizes, and what snapshots and the limit checks see. Fills whose
+# position row comes first (GTE's usual order) must not be counted twice, and a row no execution
+# explains in time is drift. Then times applying fills one execution frame at a time.
+#
+# Run from a project directory with a settings.py: python test/inventory-test.py
+###
+
+SYMBOL = 'BTC_USD'
+FILLS = 100000
+
+
+def position(side, qty):
+    return {'instrument_type': 'pc', 'settle_currency': 'BTC', 'symbol': SYMBOL, 'side': side, 'qty': str(qty)}
+
+
+def execution(side, qty, price, close_flag=0):
+    return {'order_id': 'x', 'symbol': SYMBOL, 'side': side, 'exec_qty': str(qty), 'exec_price': str(price),
+            'close_flag': close_flag}
+
+
+def check(name, inventory, long_qty, short_qty, long_entry=None, short_entry=None, realized_pnl=None):
+    print('%-28s %r' % (name, inventory))
+    assert (inventory.long_qty, inventory.short_qty) == (long_qty, short_qty)
+    assert inventory.net_qty == long_qty - short_qty
+    if long_entry is not None:
+        assert abs(inventory.long_entry - long_entry) < 1e-9
+    if short_entry is not None:
+        assert abs(inventory.short_entry - short_entry) < 1e-9
+    if realized_pnl is not None:
+        assert abs(inventory.realized_pnl - realized_pnl) < 1e-9
+
+
+def check_position_first(ws):
+    inventory = ws.inventory
+    feed(ws, 'position', 'partial', [], symbol=SYMBOL)
+    realized = inventory.get(SYMBOL).realized_pnl
+    for qty, price in ((100, 8000), (200, 8100), (300, 8200)):
+        feed(ws, 'position', 'update', [position('1', qty)])
+        check('position %d' % qty, inventory.get(SYMBOL), qty, 0)
+        feed(ws, 'execution', 'insert', [execution('1', 100, price)])
+        check('then its fill', inventory.get(SYMBOL), qty, 0, long_entry=(8000 + price) / 2.)  # 8000, 8050, 8100
+
+    # Closes: the row first, then the fill, which still realizes its PnL.
+    feed(ws, 'position', 'update', [position('1', 250)])
+    feed(ws, 'execution', 'insert', [execution('0', 50, 8300, close_flag=1)])
+    check('close, row first', inventory.get(SYMBOL), 250, 0, long_entry=8100,
+          realized_pnl=realized + 50 * 200)
+
+    # Two rows before their fills, and a fill before its row.
+    feed(ws, 'position', 'update', [position('0', 10)])
+    feed(ws, 'position', 'update', [position('0', 30)])
+    feed(ws, 'execution', 'insert', [execution('0', 10, 8000), execution('0', 20, 8300)])
+    feed(ws, 'execution', 'insert', [execution('0', 20, 8400)])
+    feed(ws, 'position', 'update', [position('0', 50)])
+    check('mixed order', inventory.get(SYMBOL), 250, 50, short_entry=8280)
+    assert inventory.drift == 0
+
+
+def test_missed_execution():
+    inventory = Inventory(SYMBOL)
+    inventory.fill('1', 100, 8000., now=0.)
+    assert not inventory.set_qty('1', 150, now=1.)
+    # The fill explaining the extra 50 never comes: the next fill, past the window, is counted.
+    assert inventory.fill('1', 10, 8100., now=1. + Inventory.MATCH_WINDOW)
+    check('missed execution', inventory, 160, 0)
+    assert inventory.long_entry is None
+
+
+def main():
+    ws = GTEWebsocket()
+    inventory = ws.inventory
+    feed(ws, 'position', 'partial', [position('1', 100), position('0', 0)])
+    # Executions from before the partial are in the positions already.
+    feed(ws, 'execution', 'partial', [execution('1', 100, 8000)])
+    check('partial', inventory.get(SYMBOL), 100, 0)
+    assert inventory.get(SYMBOL).long_entry is None  # Not in the position row
+
+    # Start flat, with known entries.
+    feed(ws, 'position', 'partial', [], symbol=SYMBOL)
+    feed(ws, 'execution', 'insert', [execution('1', 100, 7900)])
+    check('open long', inventory.get(SYMBOL), 100, 0, long_entry=7900)
+
+    feed(ws, 'execution', 'insert', [execution('1', 100, 8000)])
+    feed(ws, 'position', 'update', [position('1', 200)])
+    check('add to the long', inventory.get(SYMBOL), 200, 0, long_entry=7950)
+    assert inventory.drift == 0
+
+    feed(ws, 'execution', 'insert', [execution('0', 50, 8100), execution('0', 150, 8200)])
+    check('open short', inventory.get(SYMBOL), 200, 200, short_entry=8175)
+    feed(ws, 'execution', 'insert', [execution('1', 100, 8075, close_flag=1)])
+    check('close half the short', inventory.get(SYMBOL), 200, 100, short_entry=8175, realized_pnl=100 * 100)
+    feed(ws, 'execution', 'insert', [execution('1', 500, 8000, close_flag=1)])
+    check('close the rest, not more', inventory.get(SYMBOL), 200, 0, short_entry=0, realized_pnl=100 * 100 + 100 * 175)
+
+    snapshot = ws.snapshot()
+    feed(ws, 'position', 'update', [position('1', 150)])
+    check('position row wins', inventory.get(SYMBOL), 150, 0)
+    assert inventory.drift == 0  # Not until its executions are overdue
+    check('snapshot unchanged', snapshot.inventory(SYMBOL), 200, 0)
+
+    feed(ws, 'position', 'delete', [position('1', 0)])
+    # Flat, but the closes are still to come: their PnL needs the entry price.
+    check('delete', inventory.get(SYMBOL), 0, 0, long_entry=7950)
+
+    feed(ws, 'position', 'partial', [position('0', 30)])
+    check('partial after reconnect', inventory.get(SYMBOL), 0, 30)
+    assert snapshot.inventory('ETH_USD').net_qty == 0
+
+    check_position_first(ws)
+    test_missed_execution()
+
+    limits = Inventory(SYMBOL)
+    limits.fill('1', 10, 100.)
+    assert limits.long_limit_exceeded(10) and not limits.long_limit_exceeded(11)
+    assert not limits.short_limit_exceeded(-10)
+    limits.fill('0', 20, 100.)
+    assert limits.short_limit_exceeded(-10) and not limits.long_limit_exceeded(10)
+
+    frames = [json.dumps({'table': 'execution', 'action': 'insert', 'data': [
+        execution('1' if i % 2 else '0', 1, 8000 + i % 10, close_flag=(i // 2) % 2)]}) for i in range(FILLS)]
+    start = time.perf_counter()
+    for frame in frames:
+        ws._handle_message(frame)
+    elapsed = time.perf_counter() - start
+    print('%d execution frames: %.1f us each, %r' % (FILLS, elapsed / FILLS * 1e6, inventory.get(SYMBOL)))
+    print('ok')
+
+
+if __name__ == "__main__":
+    main()
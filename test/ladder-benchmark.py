@@ -0,0 +1,88 @@
+import time
+
+from market_maker.ladder import build_ladder
+from market_maker.market_maker import OrderManager
+from market_maker.settings import settings
+from market_maker.utils.ticks import Ticks
+
+###
+# ladder-benchmark.py
+#
+# Time to build one cycle's quote ladder of ORDER_PAIRS buys and sells:
+#
+#   per-order  - an order dict for every level, as place_orders used to build them: a
+#                get_price_offset() power and a tick rounding per order
+#   ladder     - build_ladder(), all levels in one NumPy pass
+#
+# Both run with geometric spacing and the fixed size schedule, and must give the same prices and
+# sizes. No exchange is contacted. Run from a project directory with a settings.py:
+#   python test/ladder-benchmark.py
+###
+
+PAIRS = [6, 30, 200]
+TICK_SIZE = '0.5'
+
+
+def order_manager():
+    # Just enough of an OrderManager to price orders; no exchange.
+    om = OrderManager.__new__(OrderManager)
+    om.instrument = {'symbol': 'BTC_USD', 'ticks': Ticks(TICK_SIZE), 'tickLog': 1}
+    om.start_ticks_buy = 16001
+    om.start_ticks_sell = 16003
+    return om
+
+
+def prepare_order(om, index):
+    # The order place_orders built for one level before the ladder.
+    quantity = settings.ORDER_START_SIZE + ((abs(index) - 1) * settings.ORDER_STEP_SIZE)
+    price = om.get_price_offset(index)
+    return om.new_order("1" if index < 0 else "0", om.instrument['ticks'].to_ticks(price), quantity)
+
+
+def per_order(om, pairs):
+    buys = [prepare_order(om, -i) for i in range(1, pairs + 1)]
+    sells = [prepare_order(om, i) for i in range(1, pairs + 1)]
+    return buys, sells
+
+
+def ladder(om, pairs):
+    return build_ladder(om.start_ticks_buy, om.start_ticks_sell, om.instrument['ticks'], pairs)
+
+
+def best_of(fn, repeat=5):
+    best = None
+    for _ in range(repeat):
+        loops = 0
+        start = time.perf_counter()
+        while loops < 20 or time.perf_counter() - start < 0.2:
+            fn()
+            loops += 1
+        per_call = (time.perf_counter() - start) / loops
+        best = per_call if best is None else min(best, per_call)
+    return best
+
+
+def main():
+    settings.INTERVAL = 0.005
+    settings.MAINTAIN_SPREADS = True
+    settings.LADDER_SPACING = 'geometric'
+    settings.RANDOM_ORDER_SIZE = False
+    settings.ORDER_START_SIZE = 100
+    settings.ORDER_STEP_SIZE = 100
+    om = order_manager()
+
+    print('%6s %14s %14s %9s' % ('pairs', 'per-order us', 'ladder us', 'speedup'))
+    for pairs in PAIRS:
+        settings.ORDER_PAIRS = pairs
+        buys, sells = per_order(om, pairs)
+        quotes = ladder(om, pairs)
+        assert [float(o['price']) for o in buys] == quotes.buy_prices.tolist()
+        assert [float(o['price']) for o in sells] == quotes.sell_prices.tolist()
+        assert [o['qty'] for o in buys] == quotes.buy_sizes.tolist()
+        old = best_of(lambda: per_order(om, pairs))
+        new = best_of(lambda: ladder(om, pairs))
+        print('%6d %14.1f %14.1f %8.1fx' % (pairs, old * 1e6, new * 1e6, old / new))
+
+
+if __name__ == "__main__":
+    main()
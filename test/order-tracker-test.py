@@ -0,0 +1,141 @@
+from market_maker.ws.orders import OrderTracker
+
+###
+# order-tracker-test.py
+#
+# Checks the local order state (OrderTracker) against the orderings of websocket events, REST
+# results and reconciles it has to survive:
+#
+#   placed()     - a websocket ack or fill that beats the REST response is not overwritten, and
+#                  an order that closed before its response isn't brought back
+#   events       - fills close orders, late events for closed orders are ignored, events for
+#                  unknown orders mark the state stale
+#   reconcile()  - the REST view replaces the state and the drift is counted; orders changed
+#                  while the REST view was fetched keep their local version; an invalidate during
+#                  the fetch leaves the state stale; orders in symbols the REST view didn't list
+#                  are kept; an order it reopens is remembered again when it closes again
+#
+# Run from the project directory: python test/order-tracker-test.py
+###
+
+
+def order(order_id, price='100', qty='10', filled_qty='0', status='2', **fields):
+    return dict(fields, order_id=order_id, symbol='BTC_USD', side='1', price=price, qty=qty,
+                filled_qty=filled_qty, status=status)
+
+
+def reconciled(tracker, rows):
+    tracker.reconcile(rows, tracker.begin_reconcile())
+    return tracker
+
+
+def test_placed():
+    sent = {'symbol': 'BTC_USD', 'side': '1', 'price': '100', 'qty': 10, 'client_oid': 'mm_gte_a'}
+
+    # The websocket insert and a fill arrive before the REST response.
+    tracker = reconciled(OrderTracker(), [])
+    tracker.apply('insert', [order('1', filled_qty='0')])
+    tracker.apply('update', [{'order_id': '1', 'filled_qty': '6'}])
+    tracker.placed(sent, '1')
+    placed = tracker.get('1')
+    assert placed['filled_qty'] == '6', placed
+    assert placed['client_oid'] == 'mm_gte_a', placed
+    assert tracker.by_client_oid('mm_gte_a')['order_id'] == '1'
+
+    # The REST response comes first, then the websocket.
+    tracker = reconciled(OrderTracker(), [])
+    tracker.placed(sent, '2')
+    assert tracker.get('2')['filled_qty'] == 0
+    tracker.apply('update', [{'order_id': '2', 'filled_qty': '4'}])
+    assert tracker.get('2')['filled_qty'] == '4'
+
+    # Filled before the response came back: stays closed.
+    tracker = reconciled(OrderTracker(), [])
+    tracker.apply('insert', [order('3')])
+    tracker.apply('update', [{'order_id': '3', 'filled_qty': '10'}])
+    tracker.placed(sent, '3')
+    assert tracker.get('3') is None and len(tracker) == 0
+    print('placed      ok')
+
+
+def test_events():
+    tracker = reconciled(OrderTracker(), [order('1'), order('2')])
+    assert not tracker.stale
+    tracker.apply('update', [{'order_id': '1', 'filled_qty': '10'}])
+    assert tracker.get('1') is None
+    tracker.apply('update', [{'order_id': '1', 'filled_qty': '10'}])
+    tracker.apply_executions([{'order_id': '1'}])
+    assert not tracker.stale, 'late events for a closed order are not drift'
+
+    tracker.apply('update', [{'order_id': '9', 'filled_qty': '1'}])
+    assert tracker.stale and tracker.drift == 1
+    tracker = reconciled(OrderTracker(), [order('2')])
+    tracker.apply_executions([{'order_id': '8'}])
+    assert tracker.stale and tracker.drift == 1
+    print('events      ok')
+
+
+def test_reconcile():
+    tracker = OrderTracker()
+    assert tracker.stale
+    diff = tracker.reconcile([order('1'), order('2'), order('3')], tracker.begin_reconcile())
+    assert diff == {'added': 3, 'removed': 0, 'changed': 0}, diff
+    assert not tracker.stale and tracker.reconciles == 1
+
+    # 1 is gone on the exchange, 2 was partly filled, 4 is new; done rows aren't added.
+    diff = tracker.reconcile([order('2', filled_qty='3'), order('3'), order('4'), order('5', status='3')],
+                             tracker.begin_reconcile())
+    assert diff == {'added': 2, 'removed': 1, 'changed': 1}, diff
+    assert sorted(o['order_id'] for o in tracker.open_orders()) == ['2', '3', '4']
+    assert tracker.get('2')['filled_qty'] == '3'
+
+    # Events during the fetch are newer than the REST view.
+    token = tracker.begin_reconcile()
+    tracker.apply('update', [{'order_id': '2', 'filled_qty': '5'}])
+    tracker.placed({'side': '1', 'price': '101', 'qty': 1}, '6')
+    tracker.canceled(['3'])
+    diff = tracker.reconcile([order('2', filled_qty='3'), order('3'), order('4')], token)
+    assert diff == {'added': 0, 'removed': 0, 'changed': 0}, diff
+    assert sorted(o['order_id'] for o in tracker.open_orders()) == ['2', '4', '6']
+    assert tracker.get('2')['filled_qty'] == '5'
+
+    # A reconnect during the fetch needs another round.
+    token = tracker.begin_reconcile()
+    tracker.invalidate('websocket reconnect')
+    tracker.reconcile([order('2'), order('4')], token)
+    assert tracker.stale
+    reconciled(tracker, [order('2'), order('4')])
+    assert not tracker.stale
+
+    # Only BTC_USD was listed: the ETH_USD order isn't gone.
+    tracker.placed({'symbol': 'ETH_USD', 'side': '1', 'price': '200', 'qty': 1}, '7')
+    diff = tracker.reconcile([order('2'), order('4')], tracker.begin_reconcile(), symbols={'BTC_USD'})
+    assert diff == {'added': 0, 'removed': 0, 'changed': 0}, diff
+    assert tracker.get('7') is not None
+    diff = tracker.reconcile([order('2'), order('4')], tracker.begin_reconcile(), symbols={'BTC_USD', 'ETH_USD'})
+    assert diff['removed'] == 1 and tracker.get('7') is None
+
+    # An order a reconcile lists as open again, then closes again, is remembered as closed for
+    # as long as any other: a late event for it doesn't bring it back.
+    memory = OrderTracker.CLOSED_MEMORY
+    OrderTracker.CLOSED_MEMORY = 2
+    try:
+        tracker = reconciled(OrderTracker(), [order('8')])
+        tracker.apply('delete', [{'order_id': '8'}])
+        reconciled(tracker, [order('8')])
+        tracker.apply('delete', [{'order_id': '8'}, {'order_id': '9'}])
+        tracker.apply('insert', [order('8')])
+        assert tracker.get('8') is None
+    finally:
+        OrderTracker.CLOSED_MEMORY = memory
+    print('reconcile   ok')
+
+
+def main():
+    test_placed()
+    test_events()
+    test_reconcile()
+
+
+if __name__ == "__main__":
+    main()
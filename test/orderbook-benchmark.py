@@ -0,0 +1,73 @@
+import random
+import time
+
+from market_maker.ws.orderbook import OrderBook
+
+###
+# orderbook-benchmark.py
+#
+# Measures order_book update throughput of the L2 OrderBook against the old list-of-dicts
+# storage. Each update is followed by a best bid/ask read, which is what quoting needs; the
+# list storage has to scan for both the row and the touch.
+#
+# Run from the project root: python test/orderbook-benchmark.py
+###
+
+LEVELS = [50, 500, 5000]
+UPDATES = 5000
+
+
+def make_partial(levels):
+    rows = []
+    for i in range(levels):
+        rows.append({'id': 2 * i, 'side': '1', 'price': 7000 - i * 0.5, 'qty': 100})
+        rows.append({'id': 2 * i + 1, 'side': '0', 'price': 7000.5 + i * 0.5, 'qty': 100})
+    return rows
+
+
+def make_updates(levels):
+    # Most book activity happens near the touch.
+    updates = []
+    for _ in range(UPDATES):
+        i = min(int(random.expovariate(0.1)), levels - 1)
+        updates.append({'id': 2 * i + random.randint(0, 1), 'qty': random.randint(1, 500)})
+    return updates
+
+
+def bench_list(partial, updates):
+    table = [dict(row) for row in partial]
+    start = time.perf_counter()
+    for update in updates:
+        for item in table:
+            if item['id'] == update['id']:
+                item.update(update)
+                break
+        max(float(o['price']) for o in table if o['side'] == '1')
+        min(float(o['price']) for o in table if o['side'] == '0')
+    return len(updates) / (time.perf_counter() - start)
+
+
+def bench_book(partial, updates):
+    book = OrderBook('BTC_USD')
+    book.apply('partial', partial)
+    start = time.perf_counter()
+    for update in updates:
+        book.apply('update', [update])
+        book.best_bid()
+        book.best_ask()
+    return len(updates) / (time.perf_counter() - start)
+
+
+def main():
+    random.seed(1)
+    print('%8s %16s %16s %9s' % ('levels', 'list upd/s', 'book upd/s', 'speedup'))
+    for levels in LEVELS:
+        partial = make_partial(levels)
+        updates = make_updates(levels)
+        list_rate = bench_list(partial, updates)
+        book_rate = bench_book(partial, updates)
+        print('%8d %16.0f %16.0f %8.1fx' % (2 * levels, list_rate, book_rate, book_rate / list_rate))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+import logging
+import time
+
+from market_maker.gte import GTE
+from market_maker.ws.ws_thread import GTEWebsocket
+from stub_exchange import StubHandler, serve
+
+###
+# pipeline-benchmark.py
+#
+# Wall-clock time to converge a ladder of ORDER_PAIRS buy/sell pairs against a local stub
+# exchange that answers every request after LATENCY seconds:
+#
+#   sequential - one create request at a time, as converge_orders used to do
+#   pipelined  - GTE.create_orders(), ORDER_CONCURRENCY requests in flight
+#
+# Each run also cancels the whole ladder, one request per order (old) or with
+# GTE.cancel_orders() (new).
+#
+# No websocket is opened. Run from a project directory with a settings.py:
+#   python test/pipeline-benchmark.py
+###
+
+LATENCY = 0.05
+PAIRS = [6, 30]
+
+
+class StubExchange(StubHandler):
+
+    def do_POST(self):
+        time.sleep(LATENCY)
+        if self.path.startswith('/v1/api/pc/order/create'):
+            self.reply({'code': 0, 'data': {'order_id': str(time.time())}})
+        else:
+            self.reply({'code': 0, 'data': None})
+
+
+def ladder(pairs):
+    orders = []
+    for i in range(1, pairs + 1):
+        orders.append({'asset': 'BTC', 'symbol': 'BTC_USD', 'price': 8000 - i * 0.5, 'qty': 100, 'side': '1',
+                       'close_flag': 0, 'order_type': 1})
+        orders.append({'asset': 'BTC', 'symbol': 'BTC_USD', 'price': 8000 + i * 0.5, 'qty': 100, 'side': '0',
+                       'close_flag': 0, 'order_type': 1})
+    return orders
+
+
+def sequential(gte, orders):
+    start = time.perf_counter()
+    for order in orders:
+        gte._curl_gte(path='/v1/api/pc/order/create', query=order, verb='POST')
+    for i in range(len(orders)):
+        gte.cancel('BTC', 'BTC_USD', str(i))
+    return time.perf_counter() - start
+
+
+def pipelined(gte, orders):
+    start = time.perf_counter()
+    for future in gte.create_orders(orders):
+        future.result()
+    gte.cancel_orders('BTC', 'BTC_USD', [str(i) for i in range(len(orders))])
+    return time.perf_counter() - start
+
+
+def main():
+    logging.getLogger('root').setLevel(logging.WARNING)
+    server, url = serve(StubExchange)
+    GTEWebsocket.connect = lambda self, *args, **kwargs: None
+    gte = GTE(base_url=url, apiKey='key', apiSecret='secret')
+
+    print('stub latency %.0fms, %d requests in flight' % (LATENCY * 1000, gte.concurrency))
+    print('%6s %8s %14s %14s %9s' % ('pairs', 'orders', 'sequential s', 'pipelined s', 'speedup'))
+    for pairs in PAIRS:
+        orders = ladder(pairs)
+        old = sequential(gte, orders)
+        new = pipelined(gte, orders)
+        print('%6d %8d %14.2f %14.2f %8.1fx' % (pairs, len(orders), old, new, old / new))
+    gte.exit()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
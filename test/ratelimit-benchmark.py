@@ -0,0 +1,104 @@
+import logging
+import threading
+import time
+
+from market_maker.gte import GTE
+from market_maker.utils import ratelimit
+from market_maker.ws.ws_thread import GTEWebsocket
+from stub_exchange import StubHandler, serve
+
+###
+# ratelimit-benchmark.py
+#
+# Floods a local stub exchange with creates from ORDER_CONCURRENCY threads while a separate thread
+# cancels one order every CANCEL_EVERY seconds. The stub allows LIMIT requests per WINDOW-second
+# window, answers 429 beyond that and reports its budget in X-RateLimit-* headers; the client
+# starts out with its default (much too generous) limits and learns the real one from them.
+#
+#   429s        - requests the stub refused
+#   create / cancel p50, p99, max - seconds from calling the API to getting the answer
+#
+# No websocket is opened. Run from a project directory with a settings.py:
+#   python test/ratelimit-benchmark.py
+###
+
+LIMIT = 40
+WINDOW = 2
+DURATION = 8
+CANCEL_EVERY = 0.25
+
+lock = threading.Lock()
+window = {'start': int(time.time()), 'used': 0, 'refused': 0}
+
+
+class StubExchange(StubHandler):
+
+    def do_POST(self):
+        with lock:
+            now = time.time()
+            if now - window['start'] >= WINDOW:
+                window['start'] = int(now)
+                window['used'] = 0
+            window['used'] += 1
+            ok = window['used'] <= LIMIT
+            if not ok:
+                window['refused'] += 1
+            remaining = max(0, LIMIT - window['used'])
+            reset = window['start'] + WINDOW
+        self.reply({'code': 0} if ok else {'error': {'message': 'rate limited'}}, 200 if ok else 429,
+                   {'X-RateLimit-Limit': LIMIT, 'X-RateLimit-Remaining': remaining, 'X-RateLimit-Reset': reset})
+
+
+def timed(fn, latencies):
+    start = time.perf_counter()
+    try:
+        fn()
+    except Exception:
+        pass
+    latencies.append(time.perf_counter() - start)
+
+
+def report(name, latencies):
+    latencies.sort()
+    pct = lambda p: latencies[min(len(latencies) - 1, int(len(latencies) * p))]
+    print('%-8s %8d %8.3f %8.3f %8.3f' % (name, len(latencies), pct(0.5), pct(0.99), pct(1)))
+
+
+def main():
+    logging.getLogger('root').setLevel(logging.CRITICAL)
+    server, url = serve(StubExchange)
+    GTEWebsocket.connect = lambda self, *args, **kwargs: None
+    gte = GTE(base_url=url, apiKey='key', apiSecret='secret')
+    order = {'asset': 'BTC', 'symbol': 'BTC_USD', 'price': 8000, 'qty': 1, 'side': '1', 'close_flag': 0, 'order_type': 1}
+
+    creates, cancels = [], []
+    end = time.time() + DURATION
+
+    def create_loop():
+        while time.time() < end:
+            timed(lambda: gte.create_order(order), creates)
+
+    def cancel_loop():
+        while time.time() < end:
+            timed(lambda: gte.cancel('BTC', 'BTC_USD', '1', rethrow_errors=True), cancels)
+            time.sleep(CANCEL_EVERY)
+
+    threads = [threading.Thread(target=create_loop) for _ in range(gte.concurrency)]
+    threads.append(threading.Thread(target=cancel_loop))
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    print('stub limit %d requests / %ds, %ds run, %d create threads' % (LIMIT, WINDOW, DURATION, gte.concurrency))
+    print('429s: %d, budget left for creates: %d, cancels: %d' % (
+        window['refused'], gte.ratelimit_budget(ratelimit.CREATE), gte.ratelimit_budget(ratelimit.CANCEL)))
+    print('%-8s %8s %8s %8s %8s' % ('request', 'count', 'p50 s', 'p99 s', 'max s'))
+    report('create', creates)
+    report('cancel', cancels)
+    gte.exit()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+import logging
+import time
+
+from market_maker.gte import GTE
+from market_maker.settings import settings
+from market_maker.ws.ws_thread import GTEWebsocket
+from stub_exchange import StubHandler, serve
+
+###
+# retry-deadline-test.py
+#
+# Drives a GET that the stub exchange always answers with a 503 until its retries end, and checks
+# that every rate-limit token the request took was accounted for (limiter.pending is back to 0):
+#
+#   retries      - the retries run out
+#   deadline     - a retry is granted its token after API_RETRY_DEADLINE, so it isn't sent
+#
+# No websocket is opened. Run from a project directory with a settings.py:
+#   python test/retry-deadline-test.py
+###
+
+DEADLINE = 0.5
+
+
+class StubExchange(StubHandler):
+    requests = 0
+
+    def do_GET(self):
+        StubExchange.requests += 1
+        self.reply({'error': {'message': 'down for a deploy'}}, 503)
+
+
+def failed_get(gte):
+    try:
+        gte._curl_gte(path='/v1/api/pc/order/open', verb='GET', rethrow_errors=True)
+    except Exception as e:
+        assert 'Max retries or retry deadline' in str(e), e
+    else:
+        raise AssertionError('the request did not fail')
+
+
+def check(name, gte, requests):
+    print('%-10s %8d %8d' % (name, StubExchange.requests, gte.limiter.pending))
+    assert StubExchange.requests == requests, StubExchange.requests
+    assert gte.limiter.pending == 0, gte.limiter.pending
+
+
+def main():
+    logging.getLogger('root').setLevel(logging.CRITICAL)
+    settings.update(API_MAX_RETRIES=2, API_RETRY_BACKOFF=0.01, API_RETRY_MAX_BACKOFF=0.01,
+                    API_RETRY_DEADLINE=DEADLINE)
+    server, url = serve(StubExchange)
+    GTEWebsocket.connect = lambda self, *args, **kwargs: None
+    gte = GTE(base_url=url, apiKey='key', apiSecret='secret')
+
+    print('%-10s %8s %8s' % ('case', 'requests', 'pending'))
+    failed_get(gte)
+    check('retries', gte, 3)
+
+    # The backoff fits in the deadline, but stretching the sleep makes the retry take its token after it.
+    StubExchange.requests = 0
+    sleep = time.sleep
+    time.sleep = lambda seconds: sleep(seconds + DEADLINE)
+    try:
+        failed_get(gte)
+    finally:
+        time.sleep = sleep
+    check('deadline', gte, 1)
+
+    gte.exit()
+    server.shutdown()
+    print('ok')
+
+
+if __name__ == "__main__":
+    main()
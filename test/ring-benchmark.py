@@ -0,0 +1,108 @@
+import random
+import time
+import tracemalloc
+
+from market_maker.ws.ring import RingTable
+from market_maker.ws.table import KeyedTable
+
+###
+# ring-benchmark.py
+#
+# Compares storage for the append-only trade table, fed one insert frame at a time:
+#
+#   list   - the old list of dicts, cut in half with a slice whenever it passes the limit
+#   keyed  - an unkeyed KeyedTable, dropping its oldest half when it passes the limit
+#   ring   - RingTable, overwriting the oldest row once full
+#
+# For each: inserts per second, p50/p99/max latency of one insert, memory held once full and
+# the cost of reading the last 50 trades of one symbol and of all symbols.
+#
+# Run from the project root: python test/ring-benchmark.py
+###
+
+CAPACITY = 200
+INSERTS = 200000
+SYMBOLS = ['BTC_USD', 'ETH_USD']
+
+
+def make_trades(n):
+    random.seed(1)
+    return [{'symbol': random.choice(SYMBOLS), 'side': random.choice('01'), 'price': '%.1f' % (8000 + random.randint(-20, 20) / 2.),
+             'qty': str(random.randint(1, 50)), 'timestamp': 1560000000000 + i, 'trade_id': str(i)} for i in range(n)]
+
+
+class ListTable(object):
+
+    def __init__(self):
+        self.rows = []
+
+    def __iadd__(self, rows):
+        self.rows += rows
+        if len(self.rows) > CAPACITY:
+            self.rows = self.rows[(CAPACITY // 2):]
+        return self
+
+    def last(self, count, symbol=None):
+        if symbol is None:
+            return self.rows[-count:]
+        return [t for t in self.rows if t['symbol'] == symbol][-count:]
+
+
+class TrimmedKeyedTable(KeyedTable):
+
+    def __iadd__(self, rows):
+        self.insert(rows)
+        if len(self) > CAPACITY:
+            self.drop_oldest(CAPACITY // 2)
+        return self
+
+    def last(self, count, symbol=None):
+        if symbol is None:
+            return self.rows()[-count:]
+        return self.partition(symbol)[-count:]
+
+
+def bench(name, table, trades):
+    latencies = []
+    clock = time.perf_counter
+    start = clock()
+    for trade in trades:
+        t = clock()
+        table += [trade]
+        latencies.append(clock() - t)
+    elapsed = clock() - start
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    for trade in make_trades(CAPACITY):
+        table += [dict(trade)]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    held = sum(s.size_diff for s in after.compare_to(before, 'filename'))
+
+    t = clock()
+    for _ in range(1000):
+        table.last(50, SYMBOLS[0])
+    read = (clock() - t) / 1000
+    t = clock()
+    for _ in range(1000):
+        table.last(50)
+    read_all = (clock() - t) / 1000
+
+    latencies.sort()
+    pct = lambda p: latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1e6
+    print('%-6s %12.0f %9.2f %9.2f %9.1f %12d %10.1f %10.1f' %
+          (name, len(trades) / elapsed, pct(0.5), pct(0.99), pct(1), held, read * 1e6, read_all * 1e6))
+
+
+def main():
+    trades = make_trades(INSERTS)
+    print('%-6s %12s %9s %9s %9s %12s %10s %10s' %
+          ('table', 'inserts/s', 'p50 us', 'p99 us', 'max us', 'held bytes', 'last50 us', 'all50 us'))
+    bench('list', ListTable(), trades)
+    bench('keyed', TrimmedKeyedTable(partition='symbol'), trades)
+    bench('ring', RingTable(CAPACITY, partition='symbol'), trades)
+
+
+if __name__ == "__main__":
+    main()
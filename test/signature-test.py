@@ -0,0 +1,113 @@
+import hashlib
+import hmac
+import json
+import time
+from urllib import parse
+from urllib.parse import urlparse
+
+import requests
+
+from market_maker.auth import APIKeyAuthWithExpires
+
+###
+# signature-test.py
+#
+# Checks that APIKeyAuthWithExpires signs byte-for-byte like the original implementation, over a
+# corpus of query-string and JSON-body requests, both through sign_params() (the path _curl_gte
+# uses) and as a requests AuthBase. Then times signing one request each way.
+#
+# Run from the project root: python test/signature-test.py
+###
+
+API_KEY = 'PNEsWEDhwvsNVkfZIBsRIoAv'
+API_SECRET = 'WpcBcZMduJIyYldMGjSHWFauMNqlvVyJCGBHSuEAEovsVPzkpAGSfRisLazPbcTP'
+URL = 'https://api.gte.io/v1/api/pc/order/query'
+EXPIRES = 1576477289000
+ITERATIONS = 20000
+
+CORPUS = [
+    # (query, postdict)
+    ({'asset': 'BTC', 'symbol': 'BTC_USD', 'count': 100}, None),
+    ({'asset': 'BTC', 'filter': json.dumps({'status': ['2']}).replace('\\', '').replace(' ', ''), 'count': 100}, None),
+    ({'asset': 'BTC', 'symbol': 'BTC_USD', 'filter': json.dumps({'order_id': ['123', '456']})}, None),
+    ({'asset': 'BTC', 'symbol': 'BTC_USD', 'id': '1234567890'}, None),
+    ({'symbol': 'BTC_USD', 'price': 6938.5, 'qty': 525, 'side': '1', 'close_flag': 0, 'order_type': 1}, None),
+    ({'z': 'a b c', 'a': 'x+y&z=1', 'm': '100%', 'k': 'back\\slash', 'u': u'中文'}, None),
+    ({'b': True, 'n': None, 'e': '', 'l': ['1', '2', '3'], 'f': 0.1 + 0.2, 'neg': -5}, None),
+    ({'filter': '{"status":["1"]}', 'start': '1560000000000', 'end': '1570000000000'}, None),
+    (None, {'asset': 'BTC', 'symbol': 'BTC_USD', 'price': 6938.5, 'qty': 525, 'side': '1'}),
+    (None, {'orders': [{'price': 1.5, 'qty': 2}, {'qty': 3, 'price': 2.5}], 'text': 'has spaces and "quotes"'}),
+    (None, {'nested': {'b': {'d': 1, 'c': [1, 2.25, None, True]}, 'a': u'é'}, 'empty': {}}),
+    ({'ignored': 'when there is a body'}, {'asset': 'ETH', 'qty': 10 ** 12}),
+    (None, {}),
+]
+
+
+def legacy_data_str(r):
+    """The parameter string of the original APIKeyAuthWithExpires.__call__."""
+    qsencoded = urlparse(r.url).query
+    data = r.body
+    if data:
+        if isinstance(data, str):
+            query_dict = dict(parse.parse_qsl(data))
+            data_str = json.dumps(query_dict, sort_keys=True).replace(' ', '')
+        else:
+            data_str = str(data, encoding="utf-8")
+        d = json.loads(data_str)
+        data_str1 = json.dumps(d, sort_keys=True).replace('\\', '')
+        data_str = data_str1.replace(' ', '')
+    else:
+        query_dict = dict(parse.parse_qsl(qsencoded))
+        data_str1 = json.dumps(query_dict, sort_keys=True).replace('\\', '')
+        data_str = data_str1.replace(' ', '')
+    return data_str
+
+
+def legacy_signature(r, expires):
+    message = API_KEY + str(expires) + legacy_data_str(r)
+    return hmac.new(bytes(API_SECRET, 'utf8'), bytes(message, 'utf8'), digestmod=hashlib.sha256).hexdigest()
+
+
+def check_corpus():
+    auth = APIKeyAuthWithExpires(API_KEY, API_SECRET)
+    for query, postdict in CORPUS:
+        r = requests.Request('POST', URL, params=query, json=postdict).prepare()
+        expected = legacy_signature(r, EXPIRES)
+
+        headers = auth.sign_params(query, postdict, expires=EXPIRES)
+        assert headers['api-signature'] == expected, (query, postdict, headers, legacy_data_str(r))
+
+        now = time.time
+        time.time = lambda: (EXPIRES // 1000) - 600
+        try:
+            signed = auth(requests.Request('POST', URL, params=query, json=postdict).prepare())
+        finally:
+            time.time = now
+        assert signed.headers['api-signature'] == expected, (query, postdict)
+        assert signed.headers['api-expires'] == str(EXPIRES)
+    print('%d requests: signatures identical' % len(CORPUS))
+
+
+def bench(name, fn):
+    start = time.perf_counter()
+    for _ in range(ITERATIONS):
+        fn()
+    elapsed = (time.perf_counter() - start) / ITERATIONS
+    print('%-34s %8.2f us' % (name, elapsed * 1e6))
+    return elapsed
+
+
+def main():
+    check_corpus()
+
+    query = CORPUS[1][0]
+    prepped = requests.Request('GET', URL, params=query).prepare()
+    auth = APIKeyAuthWithExpires(API_KEY, API_SECRET)
+    old = bench('legacy, per-request key + reparse', lambda: legacy_signature(prepped, EXPIRES))
+    bench('AuthBase on prepared request', lambda: auth(prepped))
+    new = bench('sign_params from the dict', lambda: auth.sign_params(query, expires=EXPIRES))
+    print('speedup %.1fx' % (old / new))
+
+
+if __name__ == "__main__":
+    main()
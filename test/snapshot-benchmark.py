@@ -0,0 +1,126 @@
+import json
+import logging
+import threading
+import time
+
+from market_maker.ws.ws_thread import GTEWebsocket
+
+###
+# snapshot-benchmark.py
+#
+# Measures GTEWebsocket.snapshot() while frames are applied on another thread at full speed.
+# Each frame moves both sides of the book, or fills two orders, by the same amount, so a reader
+# that sees the two differ has seen a half-applied frame.
+#
+#   ingest/s       - frames applied per second, with no reader and with a reader taking snapshots
+#                    back to back (with the GIL, any busy reader thread slows ingest down)
+#   snapshot us    - p50 / p99 cost of one snapshot, with the websocket idle and under ingest
+#   retries        - snapshots retried because a frame was applied while copying
+#   torn           - inconsistent (or failed) reads, through snapshots and through the live tables
+#
+# Run from a project directory with a settings.py: python test/snapshot-benchmark.py
+###
+
+SYMBOL = 'BTC_USD'
+FRAMES = 100000
+ORDERS = 20
+LEVELS = 50
+
+
+def make_ws():
+    ws = GTEWebsocket()
+    ws._handle_message(json.dumps({'table': 'instrument', 'action': 'partial', 'data': [
+        {'symbol': SYMBOL, 'settle_currency': 'BTC', 'asset_class': 'pc', 'tick_size': '0.5', 'last_price': '8000'}]}))
+    book = [{'id': i, 'symbol': SYMBOL, 'side': '1', 'price': 7999.5 - i, 'qty': 1} for i in range(LEVELS)]
+    book += [{'id': LEVELS + i, 'symbol': SYMBOL, 'side': '0', 'price': 8000.5 + i, 'qty': 1} for i in range(LEVELS)]
+    ws._handle_message(json.dumps({'table': 'order_book', 'action': 'partial', 'data': book}))
+    orders = [{'order_id': str(i), 'symbol': SYMBOL, 'side': '1', 'price': '7000', 'qty': 10 ** 9, 'filled_qty': 0}
+              for i in range(ORDERS)]
+    ws._handle_message(json.dumps({'table': 'order', 'action': 'partial', 'data': orders}))
+    return ws
+
+
+def make_frames():
+    frames = []
+    for i in range(2, FRAMES // 2 + 2):
+        frames.append(json.dumps({'table': 'order_book', 'action': 'update', 'data': [
+            {'id': 0, 'symbol': SYMBOL, 'qty': i}, {'id': LEVELS, 'symbol': SYMBOL, 'qty': i}]}))
+        frames.append(json.dumps({'table': 'order', 'action': 'update', 'data': [
+            {'order_id': '0', 'filled_qty': i}, {'order_id': '1', 'filled_qty': i}]}))
+    return frames
+
+
+def ingest(ws, frames):
+    start = time.perf_counter()
+    for frame in frames:
+        ws._handle_message(frame)
+    return len(frames) / (time.perf_counter() - start)
+
+
+def snapshot_costs(ws, keep_going):
+    costs = []
+    torn = 0
+    while keep_going():
+        start = time.perf_counter()
+        snapshot = ws.snapshot()
+        costs.append(time.perf_counter() - start)
+        depth = snapshot.market_depth(SYMBOL)
+        orders = snapshot.orders()
+        if depth['bids'][0][1] != depth['asks'][0][1] or orders[0]['filled_qty'] != orders[1]['filled_qty']:
+            torn += 1
+    return costs, torn
+
+
+def live_torn(ws, keep_going):
+    reads = torn = 0
+    book = ws.order_book(SYMBOL)
+    while keep_going():
+        reads += 1
+        try:
+            bid, ask = book.best_bid(), book.best_ask()
+            orders = list(ws.data['order'])
+        except (KeyError, RuntimeError):
+            torn += 1  # Read in the middle of a change
+            continue
+        if bid is None or ask is None or bid[1] != ask[1] or orders[0]['filled_qty'] != orders[1]['filled_qty']:
+            torn += 1
+    return reads, torn
+
+
+def pct(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))] * 1e6
+
+
+def main():
+    logging.getLogger('root').setLevel(logging.WARNING)
+    frames = make_frames()
+
+    alone = ingest(make_ws(), frames)
+
+    ws = make_ws()
+    count = iter(range(2000))
+    idle, _ = snapshot_costs(ws, lambda: next(count, None) is not None)
+
+    results = {}
+    writer = threading.Thread(target=lambda: results.update(rate=ingest(ws, frames)))
+    writer.start()
+    busy, torn = snapshot_costs(ws, writer.is_alive)
+    writer.join()
+
+    ws2 = make_ws()
+    writer = threading.Thread(target=lambda: ingest(ws2, frames))
+    writer.start()
+    reads, raw_torn = live_torn(ws2, writer.is_alive)
+    writer.join()
+
+    print('ingest/s, no reader         %10.0f' % alone)
+    print('ingest/s, snapshot reader   %10.0f' % results['rate'])
+    print('snapshot us, idle     p50 %8.1f   p99 %8.1f' % (pct(idle, 0.5), pct(idle, 0.99)))
+    print('snapshot us, ingest   p50 %8.1f   p99 %8.1f' % (pct(busy, 0.5), pct(busy, 0.99)))
+    print('snapshots %d, retries %d, torn %d' % (len(busy), ws.snapshot_retries, torn))
+    print('live reads %d, torn %d' % (reads, raw_torn))
+
+
+if __name__ == "__main__":
+    main()
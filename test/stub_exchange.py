@@ -0,0 +1,53 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+###
+# stub_exchange.py
+#
+# Shared by the tests and benchmarks that run against a local stub exchange instead of GTE; not a
+# test itself:
+#
+#   StubHandler  - base request handler for a stub: reply() sends a JSON body, nothing is logged
+#   serve()      - serves a handler on a free local port, in a daemon thread
+#   feed()       - applies one table frame to a GTEWebsocket, as if it came off the socket
+#
+# Scripts in test/ import it directly: from stub_exchange import StubHandler, serve, feed
+###
+
+HOST = '127.0.0.1'
+
+
+class StubHandler(BaseHTTPRequestHandler):
+
+    def reply(self, body, status=200, headers=None):
+        '''Send `body` as JSON, with any extra headers.'''
+        body = json.dumps(body).encode('utf8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        for name, value in (headers or {}).items():
+            self.send_header(name, str(value))
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class ThreadedServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def serve(handler):
+    '''Serve `handler` on a port the OS picks, so runs never clash. Returns the server and its
+    base URL.'''
+    server = ThreadedServer((HOST, 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, 'http://%s:%d' % (HOST, server.server_address[1])
+
+
+def feed(ws, table, action, data, **fields):
+    '''Apply a frame of `table` to `ws`. Extra fields (e.g. symbol) go into the frame too.'''
+    ws._handle_message(json.dumps(dict(fields, table=table, action=action, data=data)))
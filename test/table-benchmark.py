@@ -0,0 +1,67 @@
+import random
+import time
+
+from market_maker.ws.table import KeyedTable
+
+###
+# table-benchmark.py
+#
+# Compares update/delete throughput of the keyed websocket tables against the old
+# list-of-dicts storage, which located every row with a linear scan.
+#
+# Run from the project root: python test/table-benchmark.py
+###
+
+SIZES = [1000, 10000, 100000]
+OPS = 2000
+
+
+def make_rows(n):
+    return [{'id': i, 'side': '1' if i % 2 else '0', 'price': 7000 + i * 0.5, 'qty': 100} for i in range(n)]
+
+
+def find_linear(keys, table, matchData):
+    for item in table:
+        if all(item[key] == matchData[key] for key in keys):
+            return item
+
+
+def bench_list(rows, ops):
+    table = list(rows)
+    start = time.perf_counter()
+    for op in ops:
+        item = find_linear(['id'], table, op)
+        if op['delete']:
+            table.remove(item)
+            table.append(dict(item))
+        else:
+            item.update(op)
+    return len(ops) / (time.perf_counter() - start)
+
+
+def bench_keyed(rows, ops):
+    table = KeyedTable(['id'])
+    table += rows
+    start = time.perf_counter()
+    for op in ops:
+        if op['delete']:
+            item = table.delete(op)
+            table.insert([dict(item)])
+        else:
+            table.update(op)
+    return len(ops) / (time.perf_counter() - start)
+
+
+def main():
+    random.seed(1)
+    print('%8s %16s %16s %9s' % ('rows', 'list ops/s', 'keyed ops/s', 'speedup'))
+    for n in SIZES:
+        ops = [{'id': random.randrange(n), 'qty': random.randint(1, 500), 'delete': random.random() < 0.2}
+               for _ in range(OPS)]
+        list_rate = bench_list(make_rows(n), ops)
+        keyed_rate = bench_keyed(make_rows(n), ops)
+        print('%8d %16.0f %16.0f %8.1fx' % (n, list_rate, keyed_rate, keyed_rate / list_rate))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+import asyncio
+import json
+import logging
+import threading
+import time
+
+import websockets
+
+from market_maker.ws.ws_asyncio import GTEAsyncWebsocket
+from market_maker.ws.ws_thread import GTEWebsocket
+
+###
+# transport-benchmark.py
+#
+# Compares the threaded GTEWebsocket with the asyncio GTEAsyncWebsocket against a local stub
+# server that streams order_book updates, each one moving the best bid.
+#
+#   ingest    - updates applied per second, first send to last update applied
+#   latency   - time from the server sending an update to the strategy seeing it: the main
+#               thread waking in wait_for_update() (threaded) or a listener callback (asyncio)
+#
+# The asyncio listener also takes a snapshot() on its first update, which must not wait on the
+# frame that triggered it.
+#
+# The stub server runs in a thread of this process. Run from a project directory with a
+# settings.py: python test/transport-benchmark.py
+###
+
+HOST = '127.0.0.1'
+PORT = 18765
+URL = 'ws://%s:%d' % (HOST, PORT)
+SYMBOL = 'BTC_USD'
+UPDATES = 20000
+
+PARTIALS = {
+    'instrument': [{'symbol': SYMBOL, 'settle_currency': 'BTC', 'tick_size': '0.5', 'last_price': '8000'}],
+    'order_book': [{'id': 1, 'symbol': SYMBOL, 'side': '1', 'price': 7999.5, 'qty': 0.5},
+                   {'id': 2, 'symbol': SYMBOL, 'side': '0', 'price': 8000.5, 'qty': 1}],
+}
+
+sent_at = {}
+
+
+async def handler(ws, path=None):
+    async for raw in ws:
+        message = json.loads(raw)
+        if message['op'] == 'sub':
+            table = message['args']['table']
+            await ws.send(json.dumps({'table': table, 'action': 'partial', 'data': PARTIALS.get(table, [])}))
+        elif message['op'] == 'bench':
+            for i in range(1, message['args']['n'] + 1):
+                frame = json.dumps({'table': 'order_book', 'action': 'update',
+                                    'data': [{'id': 1, 'symbol': SYMBOL, 'qty': i}]})
+                sent_at[i] = time.perf_counter()
+                await ws.send(frame)
+
+
+def run_server(started):
+    async def serve():
+        async with websockets.serve(handler, HOST, PORT):
+            started.set()
+            await asyncio.Future()
+    asyncio.run(serve())
+
+
+def report(name, latencies, elapsed):
+    latencies.sort()
+    pct = lambda p: latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1e6
+    print('%-10s %12.0f %10d %10.0f %10.0f %10.0f' %
+          (name, UPDATES / elapsed, len(latencies), pct(0.5), pct(0.99), pct(1)))
+
+
+def bench_threaded():
+    ws = GTEWebsocket()
+    ws.ws_url = URL
+    ws.connect()
+    latencies = []
+    last = 0
+    ws.ws.send(json.dumps({'op': 'bench', 'args': {'n': UPDATES}}))
+    while last < UPDATES:
+        ws.wait_for_update(5)
+        now = time.perf_counter()
+        i = int(ws.order_book(SYMBOL).best_bid()[1])
+        if i != last:
+            latencies.append(now - sent_at[i])
+            last = i
+    elapsed = time.perf_counter() - sent_at[1]
+    ws.exit()
+    report('threaded', latencies, elapsed)
+
+
+async def bench_asyncio():
+    ws = GTEAsyncWebsocket()
+    ws.ws_url = URL
+    await ws.connect()
+    assert ws.connected
+    latencies = []
+    done = asyncio.Event()
+
+    def on_update(table):
+        now = time.perf_counter()
+        if not latencies:
+            ws.snapshot()
+        i = int(ws.order_book(SYMBOL).best_bid()[1])
+        latencies.append(now - sent_at[i])
+        if i == UPDATES:
+            done.set()
+
+    ws.add_listener(on_update)
+    await ws.send_command('bench', {'n': UPDATES})
+    await done.wait()
+    elapsed = time.perf_counter() - sent_at[1]
+    await ws.close()
+    report('asyncio', latencies, elapsed)
+
+
+def main():
+    logging.getLogger('root').setLevel(logging.WARNING)
+    started = threading.Event()
+    threading.Thread(target=run_server, args=(started,), daemon=True).start()
+    started.wait()
+
+    print('%-10s %12s %10s %10s %10s %10s' % ('transport', 'ingest/s', 'wakeups', 'p50 us', 'p99 us', 'max us'))
+    bench_threaded()
+    asyncio.run(bench_asyncio())
+
+
+if __name__ == "__main__":
+    main()